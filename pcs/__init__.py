@@ -62,6 +62,9 @@ __revision__ = "$Id: __init__.py,v 1.9 2006/09/05 07:30:56 gnn Exp $"
 # We need the struct module to pack our class into a byte string.
 import struct
 
+# Fields wider than 64 bits are converted through hex strings.
+from binascii import hexlify, unhexlify
+
 # We need the socket module for to implement some of the Connector classes.
 from socket import *
 
@@ -69,9 +72,26 @@ import pcs.pcap as pcap
 
 import exceptions
 import itertools
+import time
+
+# Timestamps are kept as integer nanoseconds since the epoch, as a
+# float cannot hold the time of day to better than a microsecond.
+# The POSIX clocks are not available everywhere.
+try:
+    import pcs.clock as clock
+except ImportError:
+    clock = None
 
 # import fast
 
+def now_ns():
+    """Return the time of day in integer nanoseconds since the epoch."""
+    if clock is not None:
+        t = clock.gettime_ns(clock.CLOCK_REALTIME)
+        if t is not None:
+            return t
+    return long(time.time() * 1000000000)
+
 def attribreprlist(obj, attrs):
     return map(lambda x, y = obj: '%s: %s' % (x.name, repr(getattr(y, x.name))), itertools.ifilter(lambda x, y = obj: hasattr(y, x.name), attrs))
 
@@ -91,7 +111,12 @@ class Field(object):
 value and can be marked as a dicriminator for higher level packet
 demultiplexing .  These classes are used by the packet to define the
 layout of the data and how it is addressed."""
-    
+
+    # There are many more fields than packets, so they carry no
+    # dictionary of their own.
+    __slots__ = ('packet', 'name', 'width', 'default', 'discriminator',
+                 'compare', 'value')
+
     def __init__(self, name = "", width = 1, default = None,
                  discriminator = False, compare=None):
         """initialize a field
@@ -230,18 +255,15 @@ layout of the data and how it is addressed."""
     def __copy__(self):
         """Return a shallow copy of a Field; used by copy module.
            Fields may be copied, they are not immutable."""
-        return self.__deepcopy__()
+        return self.__deepcopy__({})
 
     def __deepcopy__(self, memo={}):
         """Return a deep copy of a Field; used by copy module.
            Fields may be copied, they are not immutable; however they
            always contain integer types which *are* immutable."""
-        result = self.__class__()
+        result = self.__class__(self.name, self.width, self.default,
+                                self.discriminator, self.compare)
         memo[id(self)] = result
-        result.__init__(name=self.name, width=self.width, \
-                        default=self.default, \
-                        discriminator=self.discriminator, \
-                        compare=self.compare)
         # Copy value, we can do so here with impunity -- no __setattr__.
         result.value = self.value
         assert result.value == self.value, "value not copied"
@@ -283,7 +305,9 @@ class StringField(Field):
 default value.  The data is to be interpreted as a string, but does
 not encode the length into the packet.  Length encoded values are
 handled by the LengthValueField."""
-    
+
+    __slots__ = ()
+
     def __init__(self, name = "", width = 1, default = None, \
                  compare = None ):
         """initialtize a StringField"""
@@ -337,6 +361,14 @@ handled by the LengthValueField."""
         if (value is None) or (len (value) > (self.width / 8)):
             raise FieldBoundsError, "Value must be between 0 and %d bytes long" % (self.width / 8)
 
+    def __deepcopy__(self, memo={}):
+        """Return a deep copy of a StringField; used by copy module."""
+        result = StringField(self.name, self.width, self.default,
+                             self.compare)
+        memo[id(self)] = result
+        result.value = self.value
+        return result
+
 class LengthValueFieldError(Exception):
     """LengthValue fields only allow access to two internal pieces of data."""
     
@@ -378,7 +410,7 @@ class LengthValueField(object):
     def __setattr__(self, name, value):
         object.__setattr__(self, name, value)
         if self.packet is not None:
-            self.packet.__needencode = True
+            self.packet._needencode = True
 
     def decode(self, bytes, curr, byteBR):
         """Decode a LengthValue field."""
@@ -402,7 +434,7 @@ class LengthValueField(object):
 	self.length.value = len(value)
         self.value.value = value
         if self.packet is not None:
-            self.packet.__needencode = True
+            self.packet._needencode = True
 
     #def get_value(self):
     #    return self.value.value
@@ -465,7 +497,7 @@ class TypeValueField(object):
     def __setattr__(self, name, value):
         object.__setattr__(self, name, value)
         if self.packet is not None:
-            self.packet.__needencode = True
+            self.packet._needencode = True
 
     def decode(self, bytes, curr, byteBR):
         [self.type.value, curr, byteBR] = self.type.decode(bytes, curr, byteBR)
@@ -545,7 +577,7 @@ class TypeLengthValueField(object):
     def __setattr__(self, name, value):
         object.__setattr__(self, name, value)
         if self.packet is not None:
-            self.packet.__needencode = True
+            self.packet._needencode = True
 
     def decode(self, bytes, curr, byteBR):
         [self.type.value, curr, byteBR] = self.type.decode(bytes, curr, byteBR)
@@ -722,10 +754,17 @@ class OptionListField(CompoundField, list):
         retval += "]"
         return retval
     
+    def changed(self):
+        """Mark the packet which owns this option list as needing to be
+        encoded again.  Called whenever the list is changed in place."""
+        if self.packet is not None:
+            self.packet._needencode = True
+
     def __setitem__(self, index, value):
         if (index < 0 or index > len(self._options)):
             raise IndexError, "index %d out of range" % index
         else:
+            self.changed()
             # Three part harmony
             # The caller can pass a list of (value, option) 
             if isinstance(value, list):
@@ -759,10 +798,12 @@ class OptionListField(CompoundField, list):
     def set_value(self, value):
         """Set the value of a field."""
         self._options = value
+        self.changed()
 
     def __add__(self, other):
         if isinstance(other, _fieldlist):
             self._options += other
+            self.changed()
 
     def append(self, option):
         """Append an option, an option/value pair, or a value to an
@@ -775,6 +816,7 @@ class OptionListField(CompoundField, list):
         if not hasattr(self, '_options'):
             self._options = []
         self._options.append(option)
+        self.changed()
             
     def encode(self, bytearray, value, byte, byteBR):
         """Encode all the options in a list into a set of bytes"""
@@ -834,6 +876,315 @@ class OptionListField(CompoundField, list):
 # inherited from Field. User types may inherit from these types.
 _fieldlist = (Field, StringField, LengthValueField, TypeValueField, TypeLengthValueField, CompoundField)
 
+class Codec(object):
+    """A codec is the compiled form of a layout.
+
+    Decoding and encoding a layout one Field at a time means walking
+    every field bit by bit.  Most protocol headers are made up of
+    runs of fields which start and end on a byte boundary, e.g. all of
+    UDP, the fixed part of IPv4 and TCP, and Ethernet.  A codec turns
+    each such run into a single precompiled struct.Struct, and a pair
+    of small Python functions which unpack or pack the whole run with
+    one call.  Fields narrower than a byte, such as the IPv4 hlen or
+    the TCP flag bits, are extracted from their enclosing word with a
+    shift and a mask.
+
+    Fields which are not plain Fields or StringFields, e.g. option
+    lists and TLVs, and any run which does not fit in the bytes
+    given, are handed to the Field's own decode() and encode() methods
+    exactly as before.
+
+    A codec works either on a layout of Fields which hold their own
+    values, through decode() and encode(), or on the flat list of
+    values kept by a packet of a class which declares its layout,
+    through decode_values() and encode_values(); see PacketClass.
+
+    Codecs are immutable and are shared by every layout of the same
+    shape; use compile_layout() to get one."""
+
+    def __init__(self, layout):
+        """compile a layout
+
+        layout - a list of Field objects
+        """
+        ## the steps to take when decoding or encoding, either the
+        ## index of a field in the layout or a compiled run of fields
+        self.steps = []
+        run = []	# closed words in the current run
+        word = []	# fields in the word we are filling
+        wordbits = 0
+        for i in xrange(len(layout)):
+            field = layout[i]
+            ftype = type(field)
+            if ftype is Field and field.width > 0:
+                word.append((i, field))
+                wordbits += field.width
+                if (wordbits % 8) == 0:
+                    run.append(word)
+                    word = []
+                    wordbits = 0
+                continue
+            if ftype is StringField and field.width > 0 and \
+               (field.width % 8) == 0 and wordbits == 0:
+                run.append([(i, field)])
+                continue
+            self.__flush(run, word)
+            run = []
+            word = []
+            wordbits = 0
+            self.steps.append(i)
+        self.__flush(run, word)
+        self.steps = tuple(self.steps)
+        ## whether each field of the layout keeps a plain value rather
+        ## than being an object of its own, such as an option list
+        self.plain = tuple([type(field) in (Field, StringField)
+                            for field in layout])
+        ## the compiled run, if it covers the whole layout
+        self.run = None
+        if len(self.steps) == 1 and self.steps[0].__class__ is not int:
+            self.run = self.steps[0]
+
+    def __flush(self, run, word):
+        """Compile the words seen so far into a run.  Fields left over
+           in a word which does not end on a byte boundary cannot be
+           compiled and are decoded one by one."""
+        if len(run) > 0:
+            self.steps.append(self.__compile(run))
+        for (i, field) in word:
+            self.steps.append(i)
+
+    def __compile(self, run):
+        """Compile a list of words into a tuple of (size, decoder,
+           encoder, indices, vdecoder, vencoder).
+
+           The decoder is called as decoder(layout, bytes, curr) and
+           sets the values of the fields in the run.  The encoder is
+           called as encoder(fieldnames) and returns the bytes.  The
+           vdecoder and vencoder do the same for a list of values, as
+           vdecoder(values, bytes, curr) and vencoder(values)."""
+        formats = { 1: 'B', 2: 'H', 4: 'I', 8: 'Q' }
+        fmt = "!"
+        decoder = [ "def decoder(layout, bytes, curr):",
+                    "    v = unpack_from(bytes, curr)" ]
+        vdecoder = [ "def vdecoder(values, bytes, curr):",
+                     "    v = unpack_from(bytes, curr)" ]
+        packed = []
+        vpacked = []
+        indices = []
+        for n in xrange(len(run)):
+            word = run[n]
+            bits = 0
+            for (i, field) in word:
+                bits += field.width
+            nbytes = bits / 8
+            if type(word[0][1]) is StringField:
+                fmt += "%ds" % nbytes
+                (i, field) = word[0]
+                indices.append(i)
+                decoder.append("    layout[%d].value = v[%d]" % (i, n))
+                vdecoder.append("    values[%d] = v[%d]" % (i, n))
+                packed.append("fieldnames[%r].value" % field.name)
+                vpacked.append("values[%d]" % i)
+                continue
+            if nbytes in formats:
+                fmt += formats[nbytes]
+                value = "v[%d]" % n
+            else:
+                # Other widths are unpacked as strings, via hex.
+                fmt += "%ds" % nbytes
+                decoder.append("    w%d = int(hexlify(v[%d]), 16)" % (n, n))
+                vdecoder.append("    w%d = int(hexlify(v[%d]), 16)" % (n, n))
+                value = "w%d" % n
+            shift = bits
+            parts = []
+            vparts = []
+            for (i, field) in word:
+                shift -= field.width
+                mask = (1 << field.width) - 1
+                indices.append(i)
+                if field.width == bits:
+                    expr = value
+                elif shift == 0:
+                    expr = "%s & %d" % (value, mask)
+                else:
+                    expr = "(%s >> %d) & %d" % (value, shift, mask)
+                decoder.append("    layout[%d].value = %s" % (i, expr))
+                vdecoder.append("    values[%d] = %s" % (i, expr))
+                parts.append("((fieldnames[%r].value & %d) << %d)" %
+                             (field.name, mask, shift))
+                vparts.append("((values[%d] & %d) << %d)" % (i, mask, shift))
+            for (words, parts) in [(packed, parts), (vpacked, vparts)]:
+                word = " | ".join(parts)
+                if nbytes in formats:
+                    words.append(word)
+                else:
+                    words.append("unhexlify('%%0%dx' %% (%s))" %
+                                 (nbytes * 2, word))
+        encoder = [ "def encoder(fieldnames):",
+                    "    return pack(%s)" % ",\n                ".join(packed) ]
+        vencoder = [ "def vencoder(values):",
+                     "    return pack(%s)" % ",\n                ".join(vpacked) ]
+        st = struct.Struct(fmt)
+        namespace = { 'unpack_from': st.unpack_from, 'pack': st.pack,
+                      'hexlify': hexlify, 'unhexlify': unhexlify }
+        for code in [decoder, encoder, vdecoder, vencoder]:
+            exec "\n".join(code) + "\n" in namespace
+        return (st.size, namespace['decoder'], namespace['encoder'],
+                tuple(indices), namespace['vdecoder'], namespace['vencoder'])
+
+    def decode(self, layout, bytes):
+        """Decode the bytes into the values of the fields in the layout."""
+        if self.run is not None and self.run[0] <= len(bytes):
+            self.run[1](layout, bytes, 0)
+            return
+        curr = 0
+        byteBR = 8
+        length = len(bytes)
+        for step in self.steps:
+            if curr > length:
+                break
+            if step.__class__ is int:
+                [value, curr, byteBR] = layout[step].decode(bytes, curr,
+                                                            byteBR)
+                continue
+            (size, decoder, encoder, indices, vdecoder, vencoder) = step
+            if byteBR == 8 and curr + size <= length:
+                decoder(layout, bytes, curr)
+                curr += size
+                continue
+            # Not enough bytes left, let each field decode what it can.
+            for i in indices:
+                if curr > length:
+                    return
+                [value, curr, byteBR] = layout[i].decode(bytes, curr, byteBR)
+
+    def encode(self, layout, fieldnames):
+        """Encode the values of the fields in the layout and return
+        the resulting string of bytes.
+
+        layout - the list of Field objects to encode
+        fieldnames - the dictionary of Fields holding the values
+        """
+        if self.run is not None:
+            try:
+                return self.run[2](fieldnames)
+            except (struct.error, TypeError):
+                pass
+        byteBR = 8
+        byte = 0
+        bytearray = []
+        for step in self.steps:
+            if step.__class__ is int:
+                field = layout[step]
+                value = fieldnames[field.name].value
+                [byte, byteBR] = field.encode(bytearray, value, byte, byteBR)
+                continue
+            (size, decoder, encoder, indices, vdecoder, vencoder) = step
+            if byteBR == 8:
+                try:
+                    bytearray.append(encoder(fieldnames))
+                    continue
+                except (struct.error, TypeError):
+                    # Fall through and let each field deal with its value.
+                    pass
+            for i in indices:
+                field = layout[i]
+                value = fieldnames[field.name].value
+                [byte, byteBR] = field.encode(bytearray, value, byte, byteBR)
+        return ''.join(bytearray)
+
+    def decode_values(self, declared, values, bytes):
+        """Decode the bytes into a list of values, one for each field
+        declared.  The value of a field which is not plain, such as an
+        option list, is the packet's own field object, which decodes
+        itself."""
+        if self.run is not None and self.run[0] <= len(bytes):
+            self.run[4](values, bytes, 0)
+            return
+        plain = self.plain
+        curr = 0
+        byteBR = 8
+        length = len(bytes)
+        for step in self.steps:
+            if curr > length:
+                break
+            if step.__class__ is int:
+                indices = (step,)
+            else:
+                (size, decoder, encoder, indices, vdecoder, vencoder) = step
+                if byteBR == 8 and curr + size <= length:
+                    vdecoder(values, bytes, curr)
+                    curr += size
+                    continue
+            # Not enough bytes left, let each field decode what it can;
+            # the declared fields are shared, so plain ones decode
+            # through a copy.
+            for i in indices:
+                if curr > length:
+                    return
+                if plain[i]:
+                    [values[i], curr, byteBR] = \
+                        declared[i].__copy__().decode(bytes, curr, byteBR)
+                else:
+                    [value, curr, byteBR] = values[i].decode(bytes, curr,
+                                                             byteBR)
+
+    def encode_values(self, declared, values):
+        """Encode a list of values, one for each field declared, and
+        return the resulting string of bytes."""
+        if self.run is not None:
+            try:
+                return self.run[5](values)
+            except (struct.error, TypeError):
+                pass
+        plain = self.plain
+        byteBR = 8
+        byte = 0
+        bytearray = []
+        for step in self.steps:
+            if step.__class__ is int:
+                indices = (step,)
+            else:
+                (size, decoder, encoder, indices, vdecoder, vencoder) = step
+                if byteBR == 8:
+                    try:
+                        bytearray.append(vencoder(values))
+                        continue
+                    except (struct.error, TypeError):
+                        pass
+            for i in indices:
+                if plain[i]:
+                    [byte, byteBR] = declared[i].encode(bytearray, values[i],
+                                                        byte, byteBR)
+                else:
+                    field = values[i]
+                    [byte, byteBR] = field.encode(bytearray, field.value,
+                                                  byte, byteBR)
+        return ''.join(bytearray)
+
+# Layouts are created afresh for every packet, but all the packets
+# of one class almost always share the same shape, i.e. the same
+# field types, names and widths, so their codecs are cached by
+# shape.  Some packets, e.g. payload, have a width which depends on
+# their contents, so the cache is bounded.
+_codecs = {}
+_CODECS_MAX = 1024
+
+def compile_layout(layout):
+    """Return the Codec for a layout, compiling it if need be."""
+    shape = tuple([(type(field), getattr(field, 'name', None),
+                    getattr(field, 'width', None))
+                   for field in layout])
+    try:
+        return _codecs[shape]
+    except KeyError:
+        pass
+    codec = Codec(layout)
+    if len(_codecs) >= _CODECS_MAX:
+        _codecs.clear()
+    _codecs[shape] = codec
+    return codec
+
 class LayoutDiscriminatorError(Exception):
     """When a programmer tries to set more than one field in a Layout as a 
     discriminator an error is raised."""
@@ -847,7 +1198,12 @@ class Layout(list):
     """The layout is a special attribute of a Packet which implements
     the layout of the packet on the wire.  It is actually a list of
     Fields and is implemented as a descriptor.  A layout can only be
-    set or get, but never deleted."""
+    set or get, but never deleted.
+
+    A Packet class may give the fields of its layout when it declares
+    its Layout, see PacketClass, in which case the layout of each of
+    its packets is the declared one, whose fields do not hold the
+    values of any one packet."""
 
     # No need to implement __deepcopy__, as Layout is a descriptor
     # modeled on the built-in type 'list' and will propagate deep-copies
@@ -856,7 +1212,13 @@ class Layout(list):
     def __get__(self, obj, typ=None): 
         """return the Layout"""
         ## the layout is the ordering of the fields in the packet
-        return self._layout
+        if obj is None or type(obj)._declared is not None:
+            # A packet of a class which declares its layout.
+            return self
+        try:
+            return object.__getattribute__(obj, '__dict__')['_layout']
+        except KeyError:
+            return self
 
     # Update the layout itself.  Right now this does not handle
     # removing fields or anything else but must do so in future.
@@ -869,15 +1231,152 @@ class Layout(list):
         obj - the object we are about to set
         value - the value we are setting the field to
         """
-        self._layout = value
-        for field in self._layout:
-            # This is a special case, we don't want to recurse back
-            # through the encapsulating class's __setattr__ routine.
-            # We want to set this directly in the class's dictionary
-            if not hasattr(field, 'default') or field.default is None:
-                obj.__dict__[field.name] = field.reset()
+        # Each packet has a layout of its own.  The values of its
+        # fields are kept in the fields themselves.
+        object.__getattribute__(obj, '__dict__')['_layout'] = value
+
+class PacketClass(type):
+    """The type of every Packet class.
+
+    A Packet class may declare its fields once, in the Layout of the
+    class, rather than building them each time a packet is made:
+
+        class udp(pcs.Packet):
+            _layout = pcs.Layout([pcs.Field("sport", 16),
+                                  pcs.Field("dport", 16),
+                                  pcs.Field("length", 16),
+                                  pcs.Field("checksum", 16)])
+
+            def __init__(self, bytes = None, timestamp = None, **kv):
+                pcs.Packet.__init__(self, None, bytes, **kv)
+
+    The codec, discriminator and length of a declared layout are
+    worked out here, once per class.  A packet of the class keeps the
+    values of its fields in a flat list, _values, and which of them
+    have been assigned, and so are compared by expect(), in a bit mask,
+    _assigned; only fields which are not plain, such as option lists,
+    are copied for each packet.  A plain field is copied for a packet
+    only when a compare function of its own is attached to it, through
+    _fieldnames, see DeclaredFields.  Every declared field gets a
+    property on the class so that getting or setting it is a plain
+    attribute lookup, and the class does without the __getattribute__
+    and __setattr__ hooks of Packet, which otherwise slow down getting
+    any attribute at all.  The attributes every packet of the class
+    has, which are listed in slots, are kept in __slots__ generated
+    for the class rather than in a dictionary of each packet's own;
+    a packet only gets a dictionary if some other attribute is set
+    on it.
+
+    The layout of a declared class is fixed; fields cannot be added
+    to its packets."""
+
+    ## the attributes of a packet of a class which declares its layout
+    ## which are kept in its __slots__; all but timestamp and
+    ## description are set when the packet is made
+    slots = ('_values', '_assigned', '_fields', '_shared', '_bytes',
+             '_needencode', '_head', '_data', '_deferred', '_lazy',
+             '_discriminator_inited', 'timestamp', 'description')
+
+    def __new__(meta, name, bases, dict):
+        layout = dict.get('_layout')
+        if isinstance(layout, Layout) and len(layout) > 0 and \
+           '__slots__' not in dict:
+            names = [field.name for field in layout]
+            dict['__slots__'] = tuple([slot for slot in PacketClass.slots
+                                       if slot not in names])
+        return type.__new__(meta, name, bases, dict)
+
+    def __init__(cls, name, bases, dict):
+        type.__init__(cls, name, bases, dict)
+        layout = dict.get('_layout')
+        if not isinstance(layout, Layout) or len(layout) == 0:
+            return
+        cls._declared = tuple(layout)
+        cls._codec = compile_layout(layout)
+        cls._plain = cls._codec.plain
+        cls._bitlength = 0
+        cls._discriminator = None
+        indices = {}
+        initial = []
+        for i in xrange(len(layout)):
+            field = layout[i]
+            cls._bitlength += field.width
+            if getattr(field, 'discriminator', False) is True:
+                if cls._discriminator is not None:
+                    raise LayoutDiscriminatorError, "Layout can only have one field marked as a discriminator, but there are at least two %s %s" % (field, cls._discriminator)
+                cls._discriminator = field
+            if hasattr(Packet, field.name):
+                raise FieldError, "%s cannot be used as a field name" % \
+                      field.name
+            indices[field.name] = i
+            if cls._plain[i]:
+                initial.append(field.value)
             else:
-                obj.__dict__[field.name] = field.default
+                initial.append(None)
+            setattr(cls, field.name, PacketClass.__property(i, field))
+        ## the index in the layout of each field, by name
+        cls._indices = indices
+        ## the values a packet starts out with
+        cls._initial = tuple(initial)
+        ## the indices of the fields which each packet has a copy of
+        cls._objects = tuple([i for i in xrange(len(layout))
+                              if not cls._plain[i]])
+        cls._fieldnames = property(DeclaredFields)
+        cls.__getattribute__ = object.__getattribute__
+        cls.__setattr__ = object.__setattr__
+
+    def __property(i, field):
+        """Return the property for getting and setting field number i."""
+        name = field.name
+        if type(field) in (Field, StringField):
+            def get(self):
+                return self._values[i]
+        else:
+            def get(self):
+                if self._shared:
+                    self._unshare()
+                self._needencode = True
+                return self._values[i]
+        def set(self, value):
+            self._setfield(name, value)
+        return property(get, set)
+    __property = staticmethod(__property)
+
+class DeclaredFields(object):
+    """The fields of a packet of a class which declares its layout, by
+    name, as _fieldnames gives them for the packets of other classes.
+
+    The packet keeps only the values of its plain fields, see
+    PacketClass, so a plain field is copied for the packet the first
+    time it is asked for here and kept, with the packet's value, so
+    that a compare function may be attached to it for expect() and
+    matches().  The copy is given the packet's value again each time
+    it is asked for; set values through the packet."""
+
+    __slots__ = ('packet',)
+
+    def __init__(self, packet):
+        self.packet = packet
+
+    def __getitem__(self, name):
+        return self.packet._materialize(name)
+
+    def __contains__(self, name):
+        return name in self.packet._indices
+
+    def __len__(self):
+        return len(self.packet._declared)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return [field.name for field in self.packet._declared]
+
+    def get(self, name, default = None):
+        if name in self.packet._indices:
+            return self[name]
+        return default
 
 class FieldError(Exception):
     """When a programmer tries to set a field that is not in the
@@ -888,7 +1387,7 @@ class FieldError(Exception):
         ## the error message passed when this error is raised
         self.message = message
         
-reserved_names = ["_layout", "_discriminator", "_map", "_head"]
+reserved_names = ["_layout", "_codec", "_discriminator", "_map", "_head"]
 
 class Packet(object):
     """A Packet is a base class for building real packets.
@@ -899,6 +1398,22 @@ class Packet(object):
        to be installed. This is to make it easy to specify match
        filters for Connector.expect().  """
 
+    __metaclass__ = PacketClass
+
+    # The fields declared in the Layout of the class, if any, see
+    # PacketClass.
+    _declared = None
+
+    # Whether the fields of the packet are shared with its clones, see
+    # clone().
+    _shared = False
+
+    # The fields which have been assigned, by bit, and the plain fields
+    # copied for the packet, by name, of a packet of a class which
+    # declares its layout, see PacketClass.
+    _assigned = 0
+    _fields = None
+
     # The layout is a list of fields without values that indicate how
     # the data in the packet is to be layed in terms of ordering and
     # bit widths.  The update() method, below, uses this list to build
@@ -913,28 +1428,46 @@ class Packet(object):
     # formed packet.  Packets are always fully formed as any setting
     # of a packet field generates a call to the update() method.
 
+    # The bytes are only encoded again when a field has changed since
+    # they were last encoded or decoded.  A packet which has just been
+    # decoded keeps a buffer which refers to its part of the bytes it
+    # was decoded from, and only copies them out when they are asked for.
     _bytes = ""
+    _needencode = True
     def getbytes(self):
         """return the bytes of the packet"""
         if self._needencode:
             self._needencode = False
             self.encode()
+        elif self._bytes.__class__ is buffer:
+            self._bytes = str(self._bytes)
         return self._bytes
 
+    def tobytes(self):
+        """return the bytes of the packet as a string of its own, which
+        does not refer to the buffer the packet was decoded from"""
+        return self.getbytes()
+
     # decode must be defined before its used in the property
     # that is set below it.
     def decode(self, bytes):
         """Reset the bytes field and then update the associated
         attributes of the packet.  This method is used when a packet
         is read in raw form."""
+        if self._shared:
+            self._unshare()
         self._bytes = bytes
-        curr = 0
-        byteBR = 8
-        length = len(bytes)
-        for field in self._layout:
-            if curr > length:
-                break
-            [value, curr, byteBR]  = field.decode(bytes, curr, byteBR)
+        if self._declared is not None:
+            self._codec.decode_values(self._declared, self._values, bytes)
+        else:
+            self._codec.decode(self._layout, bytes)
+        # A layout made up only of plain fields encodes back to exactly
+        # the bytes it was decoded from, so keep those.
+        run = self._codec.run
+        if run is not None and run[0] <= len(bytes):
+            if run[0] < len(bytes):
+                self._bytes = buffer(bytes, 0, run[0])
+            self._needencode = False
 
     bytes = property(getbytes, decode)
  
@@ -943,23 +1476,13 @@ class Packet(object):
         function ought to be considered private to the class."""
 
         # Encode the fields, which are a set of bit widths and values
-        # into a byte string.  This is achieved by walking the list of
-        # fields, and then packing them, byte by byte, into a byte
-        # string.  The algorithm below hurts my head, as I'm not very
-        # smart so it is heavily commented.
-        #
-        # fieldBR is the bits remaining in the field to be encoded
-        # byteBR is the bits remaining in the current byte being encoded
-        #
-        
-        byteBR = 8
-        byte = 0
-        bytearray = []
-        for field in self._layout:
-            value = self._fieldnames[field.name].value
-            [byte, byteBR] = field.encode(bytearray, value, byte, byteBR)
-
-        self._bytes = ''.join(bytearray) # Install the new value
+        # into a byte string.  The layout's codec packs each run of
+        # byte aligned fields in one go and walks the rest, see Codec.
+        if self._declared is not None:
+            self._bytes = self._codec.encode_values(self._declared,
+                                                    self._values)
+        else:
+            self._bytes = self._codec.encode(self._layout, self._fieldnames)
 
     def __init__(self, layout = None, bytes = None, **kv):
         """initialize a Packet object
@@ -969,11 +1492,18 @@ class Packet(object):
         kv - if the packet is being set up now, the initial values of
              each named field, specified as keyword arguments. These
              are always passed as a dict from classes which inherit
-             from Packet.
+             from Packet.  The keyword lazy=True defers decoding the
+             packets which follow this one, see decapsulate().
         """
         # XXX
         #self._bytes = ""
+        if layout is None and self._declared is not None:
+            self.__init_declared(bytes, kv)
+            return
         self._layout = layout
+        self._codec = compile_layout(layout)
+        if 'lazy' in kv:
+            self._lazy = kv.pop('lazy')
         self._fieldnames = {}
         self._head = None
         for field in layout:
@@ -1004,14 +1534,47 @@ class Packet(object):
                 if kw[0] in self._fieldnames:
                     self.__setattr__(kw[0], kw[1])
 
+    def __init_declared(self, bytes, kv):
+        """initialize a Packet of a class which declares its layout,
+        see PacketClass"""
+        values = list(self._initial)
+        for i in self._objects:
+            field = self._declared[i].__copy__()
+            field.packet = self
+            values[i] = field
+        self._values = values
+        self._assigned = 0
+        self._fields = None
+        self._shared = False
+        self._bytes = ""
+        self._needencode = True
+        self._head = None
+        self._data = None
+        self._deferred = None
+        self._lazy = kv.pop('lazy', False)
+        self._discriminator_inited = False
+        if bytes is not None:
+            self.decode(bytes)
+        indices = self._indices
+        for (name, value) in kv.iteritems():
+            if name in indices:
+                self._setfield(name, value)
+
     def __add__(self, layout = None):
         """add two packets together
 
         This is really an append operation, of one packet after another.
         """
+        if self._declared is not None:
+            raise FieldError, "the layout of %s is fixed" % \
+                  self.__class__.__name__
+        if self._shared:
+            self._unshare()
         for field in layout:
             self._layout.append(field)
+            self._fieldnames[field.name] = field
             self._needencode = True
+        self._codec = compile_layout(self._layout)
 
     def __setattr__(self, name, value):
         """Setting the layout is a special case because of the
@@ -1027,7 +1590,29 @@ class Packet(object):
             return
 
         if (name in self._fieldnames):
-            field = self._fieldnames[name]
+            self._setfield(name, value)
+        else:
+            object.__setattr__(self, name, value)
+
+    def _setfield(self, name, value):
+        """Set the value of the field called name."""
+        if self._shared:
+            self._unshare()
+        if self._declared is not None and self._plain[self._indices[name]]:
+            i = self._indices[name]
+            self._declared[i].bounds(value)
+            self._values[i] = value
+            # Setting a field installs the default comparison functor,
+            # which is recorded in the mask of assigned fields.
+            self._assigned |= 1 << i
+            fields = self._fields
+            if fields is not None and name in fields:
+                field = fields[name]
+                field.value = value
+                if field.compare is None:
+                    field.compare = field.default_compare
+        else:
+            field = self._field(name)
             if hasattr(field, 'bounds'):
                 field.bounds(value)
             field.set_value(value)
@@ -1035,32 +1620,116 @@ class Packet(object):
             # install the default comparison functor.
             if field.compare is None:
                 field.compare = field.default_compare
-            # If the field we're initializing is the discriminator field,
-            # record that we have initialized it, so that the / operator
-            # will not clobber its value.
-            if self._discriminator is not None and \
-               name == self._discriminator.name:
-                self._discriminator_inited = True
-            self._needencode = True
+        # If the field we're initializing is the discriminator field,
+        # record that we have initialized it, so that the / operator
+        # will not clobber its value.
+        if self._discriminator is not None and \
+           name == self._discriminator.name:
+            self._discriminator_inited = True
+        self._needencode = True
+
+    def _field(self, name):
+        """Return the field called name, holding this packet's value.
+
+        A plain field of a class which declares its layout is not kept
+        by the packet unless a compare function has been attached to it,
+        see DeclaredFields, and is otherwise given as a copy which is
+        not kept."""
+        if self._declared is None:
+            return self._fieldnames[name]
+        i = self._indices[name]
+        if not self._plain[i]:
+            return self._values[i]
+        fields = self._fields
+        if fields is not None and name in fields:
+            field = fields[name]
+            field.value = self._values[i]
+            return field
+        field = self._declared[i].__copy__()
+        field.packet = self
+        field.value = self._values[i]
+        field.compare = self._getcompare(name)
+        return field
+
+    def _materialize(self, name):
+        """Return the field called name, copying a plain field of a
+        class which declares its layout for this packet and keeping it,
+        so that a compare function may be attached to it."""
+        if self._declared is None or not self._plain[self._indices[name]]:
+            return self._field(name)
+        if self._shared:
+            self._unshare()
+        fields = self._fields
+        if fields is None:
+            fields = self._fields = {}
+        if name not in fields:
+            fields[name] = self._field(name)
+        return self._field(name)
+
+    def _getvalue(self, name):
+        """Return the value of the field called name."""
+        if self._declared is None:
+            return self._fieldnames[name].value
+        i = self._indices[name]
+        if self._plain[i]:
+            return self._values[i]
+        return self._values[i].value
+
+    def _getcompare(self, name):
+        """Return the compare function of the field called name, or
+        None if it is not compared."""
+        if self._declared is None:
+            return self._fieldnames[name].compare
+        i = self._indices[name]
+        if not self._plain[i]:
+            return self._values[i].compare
+        fields = self._fields
+        if fields is not None and name in fields:
+            return fields[name].compare
+        if self._assigned & (1 << i):
+            return self._declared[i].default_compare
+        return None
+
+    def _setcompare(self, name, compare):
+        """Set the compare function of the field called name; None
+        leaves it out of comparisons."""
+        if self._declared is None or not self._plain[self._indices[name]]:
+            self._field(name).compare = compare
+            return
+        if self._shared:
+            self._unshare()
+        i = self._indices[name]
+        if compare is None:
+            self._assigned &= ~(1 << i)
         else:
-            object.__setattr__(self, name, value)
+            self._assigned |= 1 << i
+        fields = self._fields
+        if compare is not None and \
+           compare is not self._declared[i].default_compare:
+            self._materialize(name).compare = compare
+        elif fields is not None and name in fields:
+            fields[name].compare = compare
 
     def __getattribute__(self, name):
-        """Getting an attribute means we may have extended an option.
-
-        If we append to an options list we have to reencode the bytes."""
-        object.__setattr__(self, '_needencode', True)
+        """Getting a field returns its value.
 
+        Getting an option list or a TLV returns the field itself, which
+        the caller may change in place, e.g. by appending an option, so
+        in that case we have to reencode the bytes.  Plain fields are
+        immutable and reading them leaves the bytes alone."""
         try: 
             fieldnames = object.__getattribute__(self, '_fieldnames')
         except:
             return {}
         if name in fieldnames:
-            if isinstance(fieldnames[name], Field) and not \
-                   isinstance(fieldnames[name], (LengthValueField, TypeValueField, TypeLengthValueField)):
-                return fieldnames[name].get_value()
-            else:
-                return fieldnames[name]
+            field = fieldnames[name]
+            if isinstance(field, Field):
+                return field.get_value()
+            if object.__getattribute__(self, '_shared'):
+                self._unshare()
+                field = self._fieldnames[name]
+            object.__setattr__(self, '_needencode', True)
+            return field
 
         return object.__getattribute__(self, name)
 
@@ -1071,7 +1740,7 @@ class Packet(object):
         if (self.bytes != other.bytes):
             return False
         for field in self._layout:
-            if self._fieldnames[field.name].value != other._fieldnames[field.name].value:
+            if self._getvalue(field.name) != other._getvalue(field.name):
                 return False
         return True
 
@@ -1092,16 +1761,20 @@ class Packet(object):
             return False
         nocomps = True
         for fn in self._layout:
-            f = self._fieldnames[fn.name]
-            if f.compare is None:
+            name = fn.name
+            compare = self._getcompare(name)
+            if compare is None:
                 continue
             nocomps = False
-            #if __debug__ and f.compare is not f.default_compare:
+            #if __debug__ and compare is not fn.default_compare:
             #    print "WARNING: %s.%s not using default_compare." % \
-            #          (type(self), fn.name)
-            #if __debug__ and isinstance(f, Field):
-            #    print " comparing", f.value, "with", other._fieldnames[fn.name].value
-            if not f.compare(self, f, other, other._fieldnames[fn.name]):
+            #          (type(self), name)
+            if compare is Field.default_compare:
+                # Compare plain values without going through fields.
+                if self._getvalue(name) != other._getvalue(name):
+                    return False
+            elif not compare(self, self._field(name), other,
+                             other._field(name)):
                 return False
         #if __debug__ and nocomps is True:
         #    print "WARNING: no comparisons were made"
@@ -1112,14 +1785,19 @@ class Packet(object):
            wildcard for match(). If unmask is false, then apply a
            default comparison function specific to the class of the Field.
            If an empty list is passed, apply the mask to all fields."""
+        if self._shared:
+            self._unshare()
         if fieldnames == []:
-            fieldnames = self._fieldnames.keys()
-        for i in fieldnames:
-            field = self._fieldnames[i]
+            fieldnames = [field.name for field in self._layout]
+        for name in fieldnames:
             if unmask is True:
-                field.compare = None
+                self._setcompare(name, None)
+            elif self._declared is not None:
+                field = self._declared[self._indices[name]]
+                self._setcompare(name, field.default_compare)
             else:
-                field.compare = field.default_compare
+                field = self._fieldnames[name]
+                self._setcompare(name, field.default_compare)
 
     def __repr__(self):
         """Walk the entire packet and return the values of the fields."""
@@ -1141,8 +1819,7 @@ class Packet(object):
         if hasattr(self, 'description'):
             retval += "%s\n" % self.description
         for field in self._layout:
-            retval += "%s %s\n" % (field.name,
-                                   self._fieldnames[field.name].value)
+            retval += "%s %s\n" % (field.name, self._getvalue(field.name))
         #for field in self._layout:
         #    retval += "%s %s\n" % (field.name, field.value)
         return retval
@@ -1198,12 +1875,99 @@ class Packet(object):
            either copy it or forget about it."""
         from copy import deepcopy
         newp = self.__class__()
-        for field in newp._layout:
-            newp._fieldnames[field.name] = \
-                deepcopy(self._fieldnames[field.name], memo)
+        if self._declared is not None:
+            values = newp._values
+            for i in xrange(len(values)):
+                value = self._values[i]
+                if not self._plain[i]:
+                    value = deepcopy(value, memo)
+                    value.packet = newp
+                values[i] = value
+            newp._assigned = self._assigned
+            if self._fields is not None:
+                newp._fields = {}
+                for (name, field) in self._fields.iteritems():
+                    field = deepcopy(field, memo)
+                    field.packet = newp
+                    newp._fields[name] = field
+            newp._needencode = True
+        else:
+            for field in newp._layout:
+                newp._fieldnames[field.name] = \
+                    deepcopy(self._fieldnames[field.name], memo)
         memo[id(self)] = newp
         return newp
 
+    def clone(self):
+        """Return a copy of this packet which shares its fields and its
+           bytes with this one until either packet is changed, when the
+           packet being changed first copies its fields.  This makes
+           many variants of one packet cheap to make.
+
+           As with copy.deepcopy() the copy is not part of a chain and
+           carries no data.  Other attributes, such as the timestamp,
+           are those of this packet."""
+        newp = object.__new__(self.__class__)
+        if self._declared is not None:
+            self._shared = True
+            for name in self.__slots__:
+                try:
+                    object.__setattr__(newp, name,
+                                       object.__getattribute__(self, name))
+                except AttributeError:
+                    pass
+            newp._head = None
+            newp._data = None
+            newp._deferred = None
+            # Any other attributes are kept in the packet's dictionary.
+            d = object.__getattribute__(self, '__dict__')
+            if d:
+                object.__getattribute__(newp, '__dict__').update(d)
+            return newp
+        d = object.__getattribute__(self, '__dict__')
+        d['_shared'] = True
+        newd = object.__getattribute__(newp, '__dict__')
+        newd.update(d)
+        newd['_head'] = None
+        newd['_data'] = None
+        newd['_deferred'] = None
+        return newp
+
+    def _unshare(self):
+        """Copy the fields this packet shares with its clones, before
+           one of them is changed, see clone()."""
+        if self._declared is not None:
+            values = list(self._values)
+            for i in self._objects:
+                field = values[i].__copy__()
+                field.packet = self
+                values[i] = field
+            self._values = values
+            if self._fields is not None:
+                fields = {}
+                for (name, field) in self._fields.iteritems():
+                    field = field.__copy__()
+                    field.packet = self
+                    fields[name] = field
+                self._fields = fields
+            self._shared = False
+            return
+        d = object.__getattribute__(self, '__dict__')
+        layout = []
+        fieldnames = {}
+        for field in d['_layout']:
+            # Go through the packet's own field where __deepcopy__()
+            # left the layout and the field names apart.
+            field = d['_fieldnames'].get(field.name, field).__copy__()
+            field.packet = self
+            layout.append(field)
+            fieldnames[field.name] = field
+        d['_layout'] = layout
+        d['_fieldnames'] = fieldnames
+        if d.get('_discriminator') is not None:
+            d['_discriminator'] = fieldnames[d['_discriminator'].name]
+        d['_shared'] = False
+
     def chain(self):
         """Return the packet and its next packets as a chain."""
         chain = Chain([])
@@ -1231,14 +1995,68 @@ class Packet(object):
 
         if ((discriminator is not None) and (self._map is not None)):
             if (discriminator in self._map):
-                return self._map[self._fieldnames[discriminator.name].value](bytes, timestamp = timestamp)
+                return self._map[self._getvalue(discriminator.name)](bytes, timestamp = timestamp, lazy = self._lazy)
             
         if ((self._discriminator is not None) and (self._map is not None)):
-            if (self._fieldnames[self._discriminator.name].value in self._map):
-                return self._map[self._fieldnames[self._discriminator.name].value](bytes, timestamp = timestamp)
+            value = self._getvalue(self._discriminator.name)
+            if (value in self._map):
+                return self._map[value](bytes, timestamp = timestamp, lazy = self._lazy)
         
         return None
 
+    # The packet which follows this one is kept in data.  Lazy packets
+    # only keep the bytes of the following packet and decode them the
+    # first time data is read, so that callers which only look at the
+    # outer headers do not pay for decoding the inner ones.
+    _lazy = False
+    _data = None
+    _deferred = None
+
+    def getdata(self):
+        """return the packet which follows this one, decoding it now if
+        its decoding was deferred"""
+        if self._deferred is not None:
+            (bytes, timestamp, fallback) = self._deferred
+            self._deferred = None
+            self._data = self.__decapsulate(bytes, timestamp, fallback)
+        return self._data
+
+    def setdata(self, data):
+        """set the packet which follows this one"""
+        self._deferred = None
+        self._data = data
+
+    data = property(getdata, setdata)
+
+    def decapsulate(self, bytes, offset = 0, timestamp = None,
+                    fallback = False):
+        """Decode the packet which follows this one from the bytes given,
+        starting at offset, and store it in data.  The packet type is
+        chosen by next(); if fallback is True, bytes which next() cannot
+        decode are stored as a payload.  If this packet is lazy, decoding
+        is deferred until data is first read.  The fields next()
+        discriminates on are then looked at when data is first read and
+        not now.
+
+        The following packet is handed a buffer which refers to the
+        bytes given rather than a copy of them, so that a frame is not
+        copied again for each layer it is decoded through."""
+        if offset > 0:
+            bytes = buffer(bytes, offset)
+        if self._lazy:
+            self._data = None
+            self._deferred = (bytes, timestamp, fallback)
+        else:
+            self.data = self.__decapsulate(bytes, timestamp, fallback)
+
+    def __decapsulate(self, bytes, timestamp, fallback):
+        """Decode the packet which follows this one."""
+        data = self.next(bytes, timestamp = timestamp)
+        if data is None and fallback is True:
+            from pcs.packets.payload import payload
+            data = payload(bytes)
+        return data
+
     def rdiscriminate(self, packet, discfieldname = None, map = None):
         """Reverse-map an encapsulated packet back to a discriminator
            field value.
@@ -1276,10 +2094,11 @@ class Packet(object):
 
         for i in map.iteritems():
             if isinstance(packet, i[1]):
-                field = self._fieldnames[discfieldname]
-                field.value = i[0]
-                if field.compare is None:
-                    field.compare = field.default_compare
+                # Filling in the field is not the same as the caller
+                # setting it, so / may still fill it in again.
+                inited = self._discriminator_inited
+                self._setfield(discfieldname, i[0])
+                self._discriminator_inited = inited
                 return True
 
         return False
@@ -1317,7 +2136,15 @@ class Packet(object):
 
 class Chain(list):
     """A chain is simply a list of packets.  Chains are used to
-    aggregate related sub packets into one chunk for transmission."""
+    aggregate related sub packets into one chunk for transmission.
+
+    The bytes of a chain are only put together, with a single join,
+    when they are first asked for after the chain was last changed.
+    Adding packets to a chain, or calling encode(), throws away the
+    bytes it had put together before."""
+
+    _bytes = None
+    _fixup = None
 
     def __init__(self, packets=[]):
         """initialize a Chain object
@@ -1331,7 +2158,6 @@ class Chain(list):
             #if __debug__ and p._head is not None:
             #    print "WARNING: clobbering head pointer"
             p._head = self
-        self.encode()
 
     def __eq__(self, other):
         """test two Chain objects for equality
@@ -1349,6 +2175,16 @@ class Chain(list):
     def __ne__(self, other):
         """test two Chain objects for inequality"""
         return not self.__eq__(other)
+
+    def timestamp(self):
+        """return the time at which the first packet of the chain was
+        captured or made, in integer nanoseconds since the epoch, or
+        None if the chain is empty"""
+        if len(self.packets) == 0:
+            return None
+        return self.packets[0].timestamp
+
+    timestamp = property(timestamp)
             
     def __str__(self):
         """return a pretty printed Chain"""
@@ -1406,14 +2242,25 @@ class Chain(list):
             newp = deepcopy(p, memo)
             newp._head = newchain
             newchain.packets.append(newp)
-        newchain.encode()
+        return newchain
+
+    def clone(self):
+        """Return a copy of this chain made of clones of its packets,
+           see Packet.clone(), which share their fields and bytes with
+           the packets of this chain until they are changed."""
+        packets = [p.clone() for p in self.packets]
+        for i in xrange(len(packets) - 1):
+            if self.packets[i]._data is self.packets[i + 1]:
+                packets[i]._data = packets[i + 1]
+        newchain = self.__class__(packets)
+        newchain._bytes = self._bytes
         return newchain
 
     def append(self, packet):
         """Append a packet to a chain.  Appending a packet requires
         that we update the bytes as well."""
         self.packets.append(packet)
-        self.encode()
+        self._bytes = None
 
     def insert_after(self, p1, p2, rdiscriminate=True):
         """Insert a packet into a chain after a given packet instance.
@@ -1425,7 +2272,7 @@ class Chain(list):
                 if rdiscriminate is True:
                     p1.rdiscriminate(p2)
                 self.packets.insert(i, p2)
-                self.encode()
+                self._bytes = None
                 return True
         return False
 
@@ -1468,10 +2315,22 @@ class Chain(list):
             self.packets[i].wildcard_mask([], unmask)
 
     def encode(self):
-        """Encode all the packets in a chain into a set of bytes for the Chain"""
-        self.bytes = ""
-        for packet in self.packets:
-            self.bytes += packet.bytes
+        """Encode all the packets in a chain into a set of bytes for the
+        Chain.  The bytes are put together when they are next asked for."""
+        self._bytes = None
+
+    def getbytes(self):
+        """return the bytes of all the packets in the chain"""
+        if self._bytes is None:
+            self._bytes = "".join([packet.getbytes()
+                                   for packet in self.packets])
+        return self._bytes
+
+    def setbytes(self, bytes):
+        """set the bytes of the chain, without decoding them"""
+        self._bytes = bytes
+
+    bytes = property(getbytes, setbytes)
     
     def decode(self, bytes):
         """Decode all the bytes of all the packets in a Chain into the underlying packets"""
@@ -1482,6 +2341,8 @@ class Chain(list):
     # self.packets this can be renamed index() and go away.
     def index_of(self, packet):
         """Return the index of 'packet' in this chain."""
+        if self._fixup is not None:
+            return self._fixup[0][id(packet)]
         n = 0
         for i in self.packets:
             if i is packet:
@@ -1496,14 +2357,51 @@ class Chain(list):
         """Given a packet which is part of this chain, return a string
            containing the bytes of all packets following it in this chain.
            Helper method used by Internet transport protocols."""
-        tmpbytes = ""
         n = self.index_of(packet)
-        if n == len(self.packets)-1:
-            return tmpbytes
-        for p in self.packets[n+1:]:
-            #print "collating %s" % (type(p))
-            tmpbytes += p.getbytes()
-        return tmpbytes
+        if self._fixup is not None:
+            return self._fixup[1][n]
+        return "".join([p.getbytes() for p in self.packets[n+1:]])
+
+    def length_following(self, packet):
+        """Given a packet which is part of this chain, return the
+           number of bytes in all packets following it in this chain."""
+        return len(self.collate_following(packet))
+
+    def sum_following(self, packet):
+        """Given a packet which is part of this chain, return the
+           partial Internet checksum of the bytes of all packets
+           following it in this chain, see inetcksum.partial().
+           Helper method used by Internet transport protocols."""
+        from pcs.packets import inetcksum
+        n = self.index_of(packet)
+        if self._fixup is None:
+            return inetcksum.partial(self.collate_following(packet))
+        # Work outwards from the innermost packet whose sum is known,
+        # so that each packet's bytes are only summed once.
+        (index, following, sums) = self._fixup
+        i = n
+        while sums[i] is None:
+            i += 1
+        while i > n:
+            bytes = self.packets[i].getbytes()
+            sums[i - 1] = inetcksum.combine(inetcksum.partial(bytes),
+                                            sums[i], len(bytes))
+            i -= 1
+        return sums[n]
+
+    def payload_cksum(self, packet, pseudo):
+        """Given a packet which is part of this chain and the pseudo
+           header for it, return the Internet checksum over the pseudo
+           header, the packet and all packets following it in this
+           chain.  The length of the pseudo header is filled in.
+           Helper method used by Internet transport protocols."""
+        from pcs.packets import inetcksum
+        bytes = packet.getbytes()
+        pseudo.length = len(bytes) + self.length_following(packet)
+        header = pseudo.getbytes() + bytes
+        return inetcksum.finish(inetcksum.combine(inetcksum.partial(header),
+                                                  self.sum_following(packet),
+                                                  len(header)))
 
     def find_first_of(self, ptype):
         """Find the first packet of type 'ptype' in this chain.
@@ -1554,10 +2452,128 @@ class Chain(list):
             packet.calc_length()
 
     def fixup(self):
-        """Convenience method to calculate lengths, checksums, and encode."""
-        self.calc_lengths()
-        self.calc_checksums()
-        self.encode()
+        """Convenience method to calculate lengths, checksums, and encode.
+
+           The packets are fixed up in a single pass, from the innermost
+           packet outwards, each one's length and then its checksum.
+           While this goes on the chain keeps the bytes following each
+           packet, and their partial checksums once they are asked for,
+           so that collate_following() and sum_following() do not walk
+           and encode the rest of the chain for every packet."""
+        packets = self.packets
+        n = len(packets)
+        index = {}
+        for i in xrange(n):
+            index[id(packets[i])] = i
+        following = [""] * n
+        sums = [None] * n
+        if n > 0:
+            sums[n - 1] = 0
+        self._fixup = (index, following, sums)
+        bytes = ""
+        try:
+            for i in xrange(n - 1, -1, -1):
+                following[i] = bytes
+                packet = packets[i]
+                packet.calc_length()
+                packet.calc_checksum()
+                bytes = packet.getbytes() + bytes
+        finally:
+            self._fixup = None
+        self._bytes = bytes
+
+class Matcher(object):
+    """A list of patterns compiled for matching many chains, as
+    Connector.expect() does.
+
+    Matching a chain against each pattern in turn calls the compare
+    function of every field of every pattern.  A matcher instead sorts
+    the patterns into groups which have the same types of packet and
+    whose fields are compared by value with the default compare
+    functions, and keeps each group in a dictionary keyed on the
+    values of those fields.  A chain is then looked up once in each
+    group, so the cost of matching it grows with the number of groups
+    rather than the number of patterns.  Fields with other compare
+    functions are still called for the patterns looked up.
+
+    The index of the pattern found is the same as that of the first
+    pattern in the list whose Chain.matches() is True."""
+
+    def __init__(self, patterns):
+        """compile a list of patterns
+
+        patterns - a list of Chains, and of other objects such as EOF
+                   which the matcher ignores
+        """
+        groups = {}
+        for j in xrange(len(patterns)):
+            pattern = patterns[j]
+            if not isinstance(pattern, Chain):
+                continue
+            classes = tuple([p.__class__ for p in pattern.packets])
+            keys = []
+            values = []
+            rest = []
+            for i in xrange(len(pattern.packets)):
+                p = pattern.packets[i]
+                for fn in p._layout:
+                    name = fn.name
+                    compare = p._getcompare(name)
+                    if compare is None:
+                        continue
+                    value = p._getvalue(name)
+                    if type(fn) in (Field, StringField) and \
+                       compare is Field.default_compare and \
+                       value.__hash__ is not None:
+                        keys.append((i, name))
+                        values.append(value)
+                    else:
+                        rest.append((i, p, name, compare))
+            shape = (classes, tuple(keys))
+            if shape not in groups:
+                groups[shape] = [j, classes, tuple(keys), {}]
+            table = groups[shape][3]
+            table.setdefault(tuple(values), []).append((j, tuple(rest)))
+        ## the groups of patterns, each a list of the index of its first
+        ## pattern, the types of its packets, the fields looked up and
+        ## the patterns by the values of those fields, in order
+        self.groups = groups.values()
+        self.groups.sort()
+
+    def match(self, chain):
+        """Return the index of the first pattern which matches the
+        chain, or None."""
+        packets = chain.packets
+        npackets = len(packets)
+        best = None
+        for (first, classes, keys, table) in self.groups:
+            if best is not None and first >= best:
+                break
+            if npackets < len(classes):
+                continue
+            for i in xrange(len(classes)):
+                if not isinstance(packets[i], classes[i]):
+                    break
+            else:
+                try:
+                    values = tuple([packets[i]._getvalue(name)
+                                    for (i, name) in keys])
+                    candidates = table.get(values)
+                except (KeyError, TypeError):
+                    continue
+                if candidates is None:
+                    continue
+                for (j, rest) in candidates:
+                    if best is not None and j >= best:
+                        break
+                    for (i, p, name, compare) in rest:
+                        if not compare(p, p._field(name), packets[i],
+                                       packets[i]._field(name)):
+                            break
+                    else:
+                        best = j
+                        break
+        return best
 
 class ConnNotImpError(Exception):
     """Calling a method that is not implemented raises this exception.
@@ -1732,6 +2748,7 @@ class Connector(object):
         delta = timeout
         self.matches = None
         self.match_index = None
+        matcher = Matcher(patterns)
         while True:
             result = self.poll_read(delta)
 
@@ -1782,16 +2799,12 @@ class Connector(object):
                 #print "expect() firstpass: saw", str(type(c.packets[2]))[:-2].split('.')[-1]
                 if limit is not None:
                     remaining -= 1
-                for j in xrange(length):
-                    filter = patterns[j]
-                    if isinstance(filter, Chain) and filter.matches(c):
-                        #print "matched at index", i
-                        #print "appending ip proto ", c.packets[1].protocol, \
-                        #   "with type ", type(c.packets[2]), "as match"
-                        matches.append(c)
-                        match_index = j
-                        next_chain = i+1
-                        break
+                j = matcher.match(c)
+                if j is not None:
+                    #print "matched at index", i
+                    matches.append(c)
+                    match_index = j
+                    next_chain = i+1
                 # We need to break out of the outer loop too if we match.
                 if match_index is not None or \
                    limit is not None and remaining == 0:
@@ -1841,24 +2854,46 @@ class PcapConnector(Connector):
     """
 
     def __init__(self, name=None, snaplen=65535, promisc=True, \
-                 timeout_ms=500):
+                 timeout_ms=500, lazy=False, buffer_size=0, \
+                 immediate=False, tstamp_type=None, \
+                 tstamp_precision=pcap.PCAP_TSTAMP_PRECISION_MICRO):
         """initialize a PcapConnector object
 
         name - the name of a file or network interface to open
         snaplen   - maximum number of bytes to capture for each packet
         promisc   - boolean to specify promiscuous mode sniffing
         timeout_ms - read timeout in milliseconds
+        lazy - boolean to decode the layers of each packet read only
+               when they are first looked at
+        buffer_size - size in bytes of the kernel capture buffer, or 0
+                      for pcap's default, which may be too small to
+                      hold a burst of packets
+        immediate - boolean to deliver each packet as soon as it
+                    arrives rather than when the buffer fills or the
+                    read times out
+        tstamp_type - a pcap.PCAP_TSTAMP_* source of timestamps for a
+                      network interface, or None for the default
+        tstamp_precision - pcap.PCAP_TSTAMP_PRECISION_MICRO or _NANO
         """
         super(PcapConnector, self).__init__()
+        self.lazy = lazy
+        self.timeout_ms = timeout_ms
         try:
-            self.file = pcap.pcap(name, snaplen, promisc, timeout_ms)
+            self.file = pcap.pcap(name, snaplen, promisc, timeout_ms,
+                                  immediate = immediate,
+                                  buffer_size = buffer_size,
+                                  tstamp_type = tstamp_type,
+                                  tstamp_precision = tstamp_precision)
         except:
             raise
 
         # Grab the underlying pcap objects members for convenience
         self.dloff = self.file.dloff
-        self.setfilter = self.file.setfilter
         self.dlink = self.file.datalink()
+        # Whether the user has set a filter of their own.
+        self.filtered = False
+        # Whether packets are read through a capture ring.
+        self.ring = False
 
         # Default to blocking I/O.
         self.file.setnonblock(False)
@@ -1890,6 +2925,17 @@ class PcapConnector(Connector):
     def poll_read(self, timeout=None):
         """Poll the underlying I/O layer for a read.
            Return TIMEOUT if the timeout was reached."""
+        if self.ring:
+            if timeout is None:
+                timeout_ms = -1
+            else:
+                timeout_ms = int(timeout * 1000)
+            n = self.file.waitring(timeout_ms)
+            if n == 0:
+                return TIMEOUT()
+            elif n == -2:
+                return EOF()
+            return None
         from select import select
         fd = self.file.fileno()
         # Switch to non-blocking mode if entered without.
@@ -1911,39 +2957,137 @@ class PcapConnector(Connector):
         # XXX legacy name.
         return self.read_packet()
 
+    def seek_packet(self, n):
+        """Make packet number n of a savefile, counting from 0, the next
+           to be read.  The savefile's index is used to find the packet,
+           see pcapfile.index_for()."""
+        from pcs import pcapfile
+        (offset, first) = pcapfile.index_for(self.file.name).locate(n)
+        self.file.seek(offset)
+        for i in xrange(n - first):
+            self.file.next()
+
+    def seek_time(self, t):
+        """Make the first packet of a savefile with a timestamp of t or
+           later the next to be read, and return its number.  The
+           packets of the savefile must be in order of time."""
+        from pcs import pcapfile
+        (offset, n) = pcapfile.index_for(self.file.name).locate_time(t)
+        self.file.seek(offset)
+        while True:
+            offset = self.file.tell()
+            record = self.file.next()
+            if record is None or record[0] >= t:
+                break
+            n += 1
+        self.file.seek(offset)
+        return n
+
+    def read_batch(self, n, decode = True):
+        """Read at most n packets from the pcap session in a single
+           call into pcap, and return them as a list of packets, or of
+           (timestamp, bytes) tuples if decode is False.  If n is -1,
+           read all of the packets in the buffer of a live capture.
+           The list is empty at the end of a savefile, or when a live
+           capture times out before a packet arrives.  With a capture
+           ring running, see start_ring(), the packets are taken from
+           the ring instead."""
+        if self.ring:
+            # The ring's buffers are reused once we call into it again.
+            batch = [(ts, str(p)) for (ts, p) in
+                     self.file.readring(n, self.timeout_ms)]
+        else:
+            batch = self.file.readbatch(n)
+        if not decode:
+            return batch
+        unpack = self.unpack
+        dlink = self.dlink
+        dloff = self.dloff
+        return [unpack(p, dlink, dloff, ts) for (ts, p) in batch]
+
+    def iter_batches(self, n, decode = True):
+        """Return an iterator over the pcap session which gives lists of
+           at most n packets at a time, see read_batch().  The iterator
+           stops at the first empty batch, which for a savefile is its
+           end."""
+        while True:
+            batch = self.read_batch(n, decode)
+            if len(batch) == 0:
+                return
+            yield batch
+
+    def start_ring(self, slots = 4096):
+        """Start a thread which reads packets from pcap into a ring of
+           slots, allocated once, without holding the interpreter lock,
+           so that a live capture keeps up while Python decodes the
+           packets read before.  When the ring is full the packets pcap
+           reads are dropped and counted, see ring_stats().  While the
+           ring runs, packets must be read only with read_batch(),
+           iter_batches() or expect().
+
+           slots - the number of packets the ring holds
+        """
+        self.file.startring(slots)
+        self.ring = True
+
+    def stop_ring(self):
+        """Stop the capture thread; packets left in the ring are lost."""
+        if self.ring:
+            self.ring = False
+            self.file.stopring()
+
+    def ring_stats(self):
+        """Return a tuple of the number of packets put into the capture
+           ring, and dropped because it was full."""
+        return self.file.ringstats()
+
     def try_read_n_chains(self, n):
         """Try to read at most n packet chains from the pcap session.
            Used by Connector.expect() to do the right thing with
            buffering live captures."""
         if n is None or n == 0:
             n = -1	# pcap: process all of the buffer in a live capture
-        result = []	# list of chain
-        ltp = []	# list of tuple (ts, packet)
-        def handler(ts, p, *args):
-            ltp = args[0]
-            ltp.append((ts, p))
-        self.file.dispatch(n, handler, ltp)
-        #print "PcapConnector.try_read_n_chains() read ", len(ltp)
-        for tp in ltp:
-            p = self.unpack(tp[1], self.dlink, self.dloff, tp[0])
-            c = p.chain()
-            result.append(c)
-        return result
+        return [p.chain() for p in self.read_batch(n)]
 
-    def expect(self, patterns=[], timeout=None, limit=None):
+    def expect(self, patterns=[], timeout=None, limit=None, prefilter=True):
         """PcapConnector needs to override expect to set it up for
            non-blocking I/O throughout. We do this to avoid losing
            packets between expect sessions.
-           Typically we would also set up pcap filter programs here
-           if performing potentially expensive matches."""
-        oldnblock = self.is_nonblocking
+
+           If prefilter is True and no filter has been set with
+           setfilter() or set_bpf_program(), the patterns are compiled
+           into a BPF program, see pcs.bpfprog, which is installed
+           while expect() runs.  Packets which cannot match any of the
+           patterns are then dropped by pcap, or by the kernel for a
+           live capture, without being read, and are lost to later
+           reads; the limit counts only the packets which are read."""
+        from pcs import bpfprog
+        program = None
+        # The capture thread of a ring owns the handle while it runs.
+        if prefilter and not self.filtered and not self.ring:
+            try:
+                program = bpfprog.compile(patterns, self.file.snaplen)
+                if program is not None:
+                    bpfprog.verify(program)
+                    self.file.setbpfprogram(bpfprog.program(program))
+            except (ValueError, OSError):
+                # The program is too long for pcap; match without it.
+                program = None
+        oldnblock = self.is_nonblocking or self.ring
         if oldnblock is False:
             self.file.setnonblock(True)
             self.is_nonblocking = True
-        result = Connector.expect(self, patterns, timeout, limit)
-        if oldnblock is False:
-            self.file.setnonblock(False)
-            self.is_nonblocking = False
+        try:
+            result = Connector.expect(self, patterns, timeout, limit)
+        finally:
+            if oldnblock is False:
+                self.file.setnonblock(False)
+                self.is_nonblocking = False
+            if program is not None:
+                # Accept every packet again.
+                self.file.setbpfprogram(bpfprog.program(
+                    [(bpfprog.BPF_RET|bpfprog.BPF_K, 0, 0,
+                      self.file.snaplen)]))
         return result
 
     def write(self, packet, bytes):
@@ -1972,120 +3116,1035 @@ class PcapConnector(Connector):
         dlink - a data link layer as defined in the pcap module
         dloff - a datalink offset as defined in the pcap module
         """
-        import packets.ethernet
-        import packets.localhost
-
-        if dlink == pcap.DLT_EN10MB:
-            return packets.ethernet.ethernet(packet, timestamp)
-        elif dlink == pcap.DLT_NULL:
-            return packets.localhost.localhost(packet, timestamp)
-        elif dlink == pcap.DLT_RAW:
-            return packets.ipv4.ipv4(packet, timestamp)
-        else:
-            raise UnpackError, "Could not interpret packet"
+        return unpack_frame(packet, dlink, timestamp, lazy = self.lazy)
                 
     def close(self):
         """Close the pcap file or interface."""
+        self.stop_ring()
         self.file.close()
 
-    def set_bpf_program(self, prog):
+    def setfilter(self, value, optimize=1):
+        """Set the capture filter to a pcap filter expression."""
+        self.file.setfilter(value, optimize)
+        self.filtered = True
+
+    def set_bpf_program(self, prog, optimize=True):
+        """Set the capture filter to a BPF program.
+
+        prog - a pcs.bpf.program
+        optimize - boolean to install a shorter program which does the
+                   same, see pcs.bpfprog.optimize()
+
+        The program is checked with pcs.bpfprog.verify() first, which
+        raises ValueError if it is wrong."""
         from pcs.bpf import program
+        from pcs import bpfprog
         if not isinstance(prog, program):
             raise ValueError, "not a BPF program"
+        insns = bpfprog.instructions(prog)
+        if optimize:
+            insns = bpfprog.optimize(insns)
+            prog = bpfprog.program(insns)
+        bpfprog.verify(insns)
+        self.filtered = True
         return self.file.setbpfprogram(prog)
 
-    # The intention is to offload some, but not all, of the filtering work
-    # from PCS to PCAP using BPF as an intermediate representation.
-    # Only add BPF match opcodes for discriminator fields which satisfy
-    # certain criteria.
-    # Relative branches are forward only up to 256 instructions.
-    # The length of each packet header may not be constant if optional
-    # fields are present in filter chain, so calculate offset into
-    # chain using getbytes() not sizeof().
-    # XXX We always assume a datalink header is present in the chain.
     def make_bpf_program(c):
-        """Given a filter chain c, create a simple BPF filter program."""
-        from pcs.bpf import program, ldw, ldb, ldh, jeq, ret
+        """Given a filter chain c, create a BPF filter program which
+           accepts the packets that may match it; see pcs.bpfprog."""
+        from pcs import bpfprog
         assert isinstance(c, Chain)
-        # XXX It seems necessary to compute offsets in bits. At the
-        # moment this code does no special handling of bytes within
-        # BPF's 32-bit words.
-        foff = 0
-        prog = program()
-        for p in c.packets:
-            for fn in p._layout:
-                f = p._fieldnames[fn.name]
-                #print "foff: ", foff
-                if isinstance(f, Field) and \
-                 f.compare is f.default_compare and \
-                 f.discriminator is True and (f.width % 8) == 0:
-                    if f.width == 8:
-                         prog.instructions.append(ldb(foff>>3))
-                    elif f.width == 16:
-                         prog.instructions.append(ldh(foff>>3))
-                    elif f.width == 32:
-                         prog.instructions.append(ldw(foff>>3))
-                    prog.instructions.append(jeq(0, 0, f.value))
-                foff += f.width
-        prog.instructions.append(ret(96))
-        prog.instructions.append(ret(0))
-        jfabs = len(prog.instructions) - 1
-        ii = 0
-        # Relative branch displacements are measured from the address of
-        # the following opcode.
-        for i in prog.instructions:
-            ii += 1
-            if isinstance(i, jeq):
-                assert ((jfabs - ii) <= 255), "Relative branch overflow."
-                i.jf = jfabs - ii
-        return prog
+        return bpfprog.program(bpfprog.compile([c]))
 
     make_bpf_program = staticmethod(make_bpf_program)
 
-class PcapDumpConnector(Connector):
-    """A connector for dumping packets to a file for later re-use.
+def unpack_frame(packet, dlink, timestamp = None, lazy = False,
+                 copy = True):
+    """Create a Packet from the bytes of a frame read from pcap.
+
+    packet - the bytes of the frame
+    dlink - a data link layer as defined in the pcap module
+    timestamp - the time at which the frame was captured
+    lazy - boolean to decode the layers of the frame only when they
+           are first looked at
+    copy - boolean to copy the bytes of the frame before decoding them,
+           False if they will not change under the packet
+    """
+    import packets.ethernet
+    import packets.localhost
+
+    # The bytes pcap hands us refer to its own buffer, which is
+    # reused for the next packet; the packets decoded below refer
+    # to the bytes they were decoded from, so copy them once here.
+    if copy:
+        packet = str(packet)
+
+    if dlink == pcap.DLT_EN10MB:
+        return packets.ethernet.ethernet(packet, timestamp, lazy = lazy)
+    elif dlink == pcap.DLT_NULL:
+        return packets.localhost.localhost(packet, timestamp, lazy = lazy)
+    elif dlink == pcap.DLT_RAW:
+        return packets.ipv4.ipv4(packet, timestamp, lazy = lazy)
+    else:
+        raise UnpackError, "Could not interpret packet"
+
+class SavefileConnector(Connector):
+    """The base of the connectors which read a savefile without libpcap
+
+    A subclass reads the records of its file format; next_record()
+    returns the next record of the file as a tuple of the timestamp
+    and bytes of a packet, and whatever else the format keeps about
+    it, or None at the end of the file.  The rest of the ways of
+    reading packets, one at a time or in batches, are built on that
+    here.  A subclass which can read many records at once faster than
+    one at a time overrides read_records(), one whose packets are not
+    all of the data link type in its dlink attribute overrides
+    decode_records(), and one whose records hold more than is given
+    for packets which are not decoded overrides raw_records().  Filters
+    are not applied as the file is read.
+    """
 
-    The PcapDump connector allows the programmer to write libpcap
-    compatible files full of packets.  Unlike the PcapConnector it
-    does not alloww the programmer to read from a dump file, for that
-    the PcapConnector class should be used.
+    def next_record(self):
+        """return the next record of the file, or None at its end"""
+        raise ConnNotImpError, "Cannot use base class"
+
+    def read_records(self, n):
+        """return a list of at most n records of the file, or of all of
+        those left if n is -1, read one at a time with next_record()"""
+        records = []
+        next_record = self.next_record
+        while n < 0 or len(records) < n:
+            record = next_record()
+            if record is None:
+                break
+            records.append(record)
+        return records
+
+    def decode_records(self, records):
+        """return the packets of a list of records, decoded by the data
+        link type of the file"""
+        unpack = self.unpack
+        dlink = self.dlink
+        dloff = self.dloff
+        return [unpack(record[1], dlink, dloff, record[0])
+                for record in records]
+
+    def read(self):
+        """read a packet from the file
+
+        returns the bytes of the packet; raises EOFError at the end of
+        the file
+        """
+        record = self.next()
+        if record is None:
+            raise EOFError
+        return record[1]
+
+    def next(self):
+        """return a packet with its timestamp, or None at the end of
+        the file"""
+        record = self.next_record()
+        if record is None:
+            return None
+        return (record[0], record[1])
+
+    def recv(self):
+        """recv a packet from the file"""
+        return self.read()
+
+    def recvfrom(self):
+        """recvfrom a packet from the file"""
+        return self.read()
+
+    def poll_read(self, timeout=None):
+        """A file can always be read from."""
+        return None
+
+    def read_packet(self):
+        """read a packet from the file and decode it; raises EOFError
+        at the end of the file"""
+        records = self.read_records(1)
+        if len(records) == 0:
+            raise EOFError
+        return self.decode_records(records)[0]
+
+    def readpkt(self):
+        # XXX legacy name.
+        return self.read_packet()
+
+    def raw_records(self, records):
+        """return a list of records as read_batch() gives packets which
+        are not decoded; the records themselves by default"""
+        return records
+
+    def read_batch(self, n, decode = True):
+        """Read at most n packets from the file, or all of those left
+           if n is -1, see PcapConnector.read_batch()."""
+        records = self.read_records(n)
+        if not decode:
+            return self.raw_records(records)
+        return self.decode_records(records)
+
+    def iter_batches(self, n, decode = True):
+        """Return an iterator over the file which gives lists of at most
+           n packets at a time, see read_batch()."""
+        while True:
+            batch = self.read_batch(n, decode)
+            if len(batch) == 0:
+                return
+            yield batch
+
+    def try_read_n_chains(self, n):
+        """Try to read at most n packet chains from the file.
+           Used by Connector.expect()."""
+        if n is None or n == 0:
+            n = 1
+        return [p.chain() for p in self.read_batch(n)]
+
+    def unpack(self, packet, dlink, dloff, timestamp):
+        """Create a Packet from the bytes of a frame read from the
+        file, without copying them; they are either not shared with
+        anything else or, for a MmapPcapConnector, refer to the file."""
+        return unpack_frame(packet, dlink, timestamp, lazy = self.lazy,
+                            copy = False)
+
+    def close(self):
+        """Close the file."""
+        self.file.close()
+
+class MmapPcapConnector(SavefileConnector):
+    """A connector which reads a pcap savefile by mapping it into memory
+
+    The MmapPcapConnector reads the same files as a PcapConnector opened
+    on a file, but does not go through libpcap.  The record headers are
+    all read when the file is opened, so that any packet in the file
+    can be read by its number as well as in order.  The packets read
+    refer to the mapped file rather than to copies of their bytes, and
+    so can no longer be looked at once the connector is closed; use
+    the tobytes() method of a packet to keep its bytes.  Filters are
+    not applied as the file is read, but filter() runs a BPF program
+    over the whole file at once.
     """
 
-    def __init__(self, dumpfile = None, dumptype = None):
-        """initialize a pcap dump connector"""
-        from pcap import pcap
-        try:
-            self.file = pcap(dumpfile = dumpfile, dumptype=dumptype)
-        except:
-            raise
+    def __init__(self, name, lazy = False):
+        """initialize a MmapPcapConnector object
+
+        name - the name of the pcap savefile to open
+        lazy - boolean to decode the layers of each packet read only
+               when they are first looked at
+        """
+        import mmap
+        from pcs import pcapfile
+        super(MmapPcapConnector, self).__init__()
+        self.lazy = lazy
+        self.name = name
+        self.file = open(name, "rb")
+        (self.order, self.tick, self.snaplen, self.dlink) = \
+                     pcapfile.header(self.file.read(pcapfile.FILE_HEADER_LEN),
+                                     name)
+        self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        self.dloff = pcap.dltoff.get(self.dlink, 0)
+        (self.offsets, self.caplens, self.seconds, self.fractions) = \
+                       pcapfile.index(self.map, self.order)
+        self.position = 0
+
+    def __len__(self):
+        """return the number of packets in the file"""
+        return len(self.offsets)
+
+    def __getitem__(self, n):
+        """return packet number n of the file, counting from 0"""
+        (timestamp, bytes) = self.record(n)
+        return unpack_frame(bytes, self.dlink, timestamp, lazy = self.lazy,
+                            copy = False)
+
+    def record(self, n):
+        """return packet number n of the file, counting from 0, as its
+        timestamp and a buffer which refers to its bytes"""
+        return (self.seconds[n] * 1000000000 + self.fractions[n] * self.tick,
+                buffer(self.map, self.offsets[n], self.caplens[n]))
+
+    def filter(self, program):
+        """return a list of the numbers of the packets of the file which
+        a BPF program, a pcs.bpf.program, accepts; the program is run
+        over every packet of the mapped file in one call"""
+        return program.filter_batch(self.map, self.offsets, self.caplens)
+
+    def seek(self, n):
+        """make packet number n the next to be read"""
+        if n < 0 or n > len(self.offsets):
+            raise IndexError, "no packet %d in %s" % (n, self.name)
+        self.position = n
+
+    def tell(self):
+        """return the number of the next packet to be read"""
+        return self.position
+
+    def seek_packet(self, n):
+        """make packet number n the next to be read, see
+        PcapConnector.seek_packet()"""
+        self.seek(n)
+
+    def seek_time(self, t):
+        """make the first packet with a timestamp of t or later the next
+        to be read, and return its number, see PcapConnector.seek_time()"""
+        lo = 0
+        hi = len(self.offsets)
+        tick = self.tick
+        while lo < hi:
+            mid = (lo + hi) / 2
+            if self.seconds[mid] * 1000000000 + self.fractions[mid] * tick < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        self.position = lo
+        return lo
+
+    def next_record(self):
+        """return the timestamp of the next packet and a buffer which
+        refers to its bytes, or None at the end of the file"""
+        if self.position >= len(self.offsets):
+            return None
+        self.position += 1
+        return self.record(self.position - 1)
+
+    next = next_record
+
+    def read_records(self, n):
+        """return a list of at most n packets of the file, or of all of
+        those left if n is -1, each as its timestamp and a buffer,
+        straight from the index of the file"""
+        end = len(self.offsets)
+        if n >= 0:
+            end = min(self.position + n, end)
+        records = [self.record(i) for i in xrange(self.position, end)]
+        self.position = max(self.position, end)
+        return records
+
+    def close(self):
+        """Close the file."""
+        self.map.close()
+        self.file.close()
+
+class CompressedPcapConnector(SavefileConnector):
+    """A connector which reads a compressed pcap savefile as a stream
+
+    The CompressedPcapConnector reads a savefile compressed with gzip,
+    bzip2 or xz, as told by the suffix of its name, without writing it
+    out uncompressed first.  A thread decompresses the file ahead of
+    the packets being read, see pcapfile.ReadAhead.  The file can only
+    be read in order, and filters are not applied.
+    """
+
+    def __init__(self, name, lazy = False, compression = None,
+                 chunk_size = 1 << 20, depth = 4):
+        """initialize a CompressedPcapConnector object
+
+        name - the name of the compressed savefile to open
+        lazy - boolean to decode the layers of each packet read only
+               when they are first looked at
+        compression - "gz", "bz2" or "xz", or None to go by the suffix
+                      of the name
+        chunk_size - the number of bytes decompressed at a time
+        depth - the number of chunks decompressed ahead of the reader
+        """
+        from pcs import pcapfile
+        super(CompressedPcapConnector, self).__init__()
+        self.lazy = lazy
+        self.name = name
+        if compression is None:
+            compression = pcapfile.compression(name)
+        self.file = pcapfile.ReadAhead(pcapfile.open_compressed(name, "rb",
+                                                                compression),
+                                       chunk_size, depth)
+        (self.order, self.tick, self.snaplen, self.dlink) = \
+                     pcapfile.header(self.file.read(pcapfile.FILE_HEADER_LEN),
+                                     name)
+        self.dloff = pcap.dltoff.get(self.dlink, 0)
+        self.record = struct.Struct(self.order + "IIII").unpack
+
+    def next_record(self):
+        """return the timestamp and bytes of the next packet, or None
+        at the end of the file"""
+        header = self.file.read(16)
+        if len(header) < 16:
+            return None
+        (sec, frac, caplen, length) = self.record(header)
+        bytes = self.file.read(caplen)
+        if len(bytes) < caplen:
+            return None
+        return (sec * 1000000000 + frac * self.tick, bytes)
+
+    next = next_record
+
+class PcapngConnector(SavefileConnector):
+    """A connector which reads a pcapng savefile without libpcap
+
+    A pcapng file may hold packets captured on several interfaces,
+    each with a data link type, snap length and timestamp resolution
+    of its own, and each packet is decoded by the data link type of its
+    interface.  The dlink and dloff attributes are those of the
+    interface of the next packet to be read.  The counts of the
+    Interface Statistics Blocks read so far are kept on the interfaces,
+    see stats().  The packets may be read by their number or time once
+    the offsets of their blocks have been gathered into an index, which
+    is done the first time it is needed.  A file compressed with gzip,
+    bzip2 or xz, as told by the suffix of its name, is read as a stream
+    as with a CompressedPcapConnector, and can only be read in order.
+    Filters are not applied.
+    """
+
+    def __init__(self, name, lazy = False, compression = None,
+                 chunk_size = 1 << 20, depth = 4):
+        """initialize a PcapngConnector object
+
+        name - the name of the pcapng file to open
+        lazy - boolean to decode the layers of each packet read only
+               when they are first looked at
+        compression - "gz", "bz2" or "xz", or None to go by the suffix
+                      of the name
+        chunk_size - the number of bytes decompressed at a time
+        depth - the number of chunks decompressed ahead of the reader
+        """
+        from pcs import pcapfile
+        from pcs import pcapng
+        super(PcapngConnector, self).__init__()
+        self.lazy = lazy
+        self.name = name
+        if compression is None:
+            compression = pcapfile.compression(name)
+        self.compression = compression
+        if compression is None:
+            self.file = open(name, "rb")
+        else:
+            self.file = pcapfile.ReadAhead(pcapfile.open_compressed(name, "rb",
+                                                                    compression),
+                                           chunk_size, depth)
+        self.reader = pcapng.Reader(self.file, name)
+        ## the index of the packets of the file, see packet_index()
+        self.index = None
+        ## the number of the next packet to be read
+        self.position = 0
+        ## the interface of the last packet read, and the length on
+        ## the wire and the options of its block
+        self.interface = None
+        self.length = None
+        self.options = None
+        # The next packet is read ahead, so that the data link type of
+        # the first interface is known once the file is opened.
+        self.pending = self.__read()
+        self.__set_dlink()
+
+    def __read(self):
+        """Read the next packet of the file, with its interface."""
+        record = self.reader.next()
+        if record is None:
+            return None
+        (ifid, timestamp, bytes, length, options) = record
+        return (timestamp, bytes, length, ifid, self.reader.interfaces[ifid],
+                options)
+
+    def __set_dlink(self):
+        """Take up the data link type of the next packet's interface."""
+        if self.pending is not None:
+            self.dlink = self.pending[4].linktype
+            self.dloff = pcap.dltoff.get(self.dlink, 0)
+        elif self.interface is None:
+            self.dlink = None
+            self.dloff = 0
+
+    def interfaces(self):
+        """the interfaces of the section being read, as
+        pcapng.Interface objects by number"""
+        return self.reader.interfaces
+
+    interfaces = property(interfaces)
+
+    def section(self):
+        """the section being read, which holds the comments of its
+        header"""
+        return self.reader.section
+
+    section = property(section)
+
+    def stats(self):
+        """return the counts of the latest Interface Statistics Block
+        of each interface of the section being read, as a list of
+        dictionaries by the names in pcapng.ISB_COUNTS"""
+        return [interface.stats for interface in self.reader.interfaces]
+
+    def packet_index(self):
+        """return the index of the packets of the file, a
+        pcapng.PcapngIndex, building it the first time"""
+        from pcs import pcapng
+        if self.index is None:
+            if self.compression is not None:
+                raise IOError, "cannot seek in a compressed file"
+            self.index = pcapng.build_index(self.name)
+        return self.index
+
+    def __len__(self):
+        """return the number of packets in the file"""
+        return len(self.packet_index())
+
+    def seek_packet(self, n):
+        """make packet number n, counting from 0, the next to be read"""
+        index = self.packet_index()
+        if n == len(index):
+            self.file.seek(0, 2)
+            self.pending = None
+        else:
+            (offset, section) = index.locate(n)
+            self.reader.seek(offset, section)
+            self.pending = self.__read()
+        self.position = n
+        self.__set_dlink()
+
+    def seek_time(self, t):
+        """make the first packet with a timestamp of t or later, in
+        integer nanoseconds since the epoch, the next to be read, and
+        return its number; the packets must be in order of time"""
+        n = self.packet_index().locate_time(t)
+        self.seek_packet(n)
+        return n
+
+    def tell(self):
+        """return the number of the next packet to be read"""
+        return self.position
+
+    def next_record(self):
+        """return the next packet of the file as a tuple of its
+        timestamp, or None for a Simple Packet Block, its bytes, its
+        length on the wire, the number of its interface, that
+        interface, a pcapng.Interface, and the options of its block,
+        or None at the end of the file"""
+        record = self.pending
+        if record is None:
+            return None
+        (timestamp, bytes, self.length, ifid, self.interface,
+         self.options) = record
+        self.position += 1
+        self.pending = self.__read()
+        self.__set_dlink()
+        return record
+
+    def decode_records(self, records):
+        """return the packets of a list of records, each decoded by the
+        data link type of its interface"""
+        unpack = self.unpack
+        dltoff = pcap.dltoff
+        return [unpack(p, i.linktype, dltoff.get(i.linktype, 0), ts)
+                for (ts, p, length, ifid, i, options) in records]
+
+    def raw_records(self, records):
+        """return a list of records as (timestamp, bytes, length,
+        interface number) tuples, which may be handed to the
+        write_many() method of a PcapDumpConnector or a
+        PcapngDumpConnector"""
+        return [record[:4] for record in records]
+
+class SavefileDumpConnector(Connector):
+    """The base of the connectors which write a savefile without libpcap
+
+    The file is written through a large buffer, and write_many() writes
+    a whole batch of records with a single call.  A subclass emits the
+    records of its file format; record_packer() gives the function
+    which returns the bytes of the record of one packet.  A subclass which moves its output on to a
+    new file between records overrides rotate() and new_file().
+    """
+
+    ## the number of bytes written by write_many() to the file being
+    ## written
+    size = 0
+    ## whether rotate() is to be asked before each record is written
+    rotating = False
+
+    def record_packer(self):
+        """Return a function for write_many() to call as pack(timestamp,
+        bytes, length, record) to get the bytes of the record of a
+        packet, captured at timestamp in integer nanoseconds since the
+        epoch, with the given bytes and length on the wire; record is
+        the tuple given to write_many() for it."""
+        raise ConnNotImpError, "Cannot use base class"
+
+    def rotate(self, timestamp, size):
+        """Return True if a record with a timestamp, which would make
+        the file size bytes long, is to go in a new file; only asked
+        if rotating is set, and the output is a single file by
+        default."""
+        return False
+
+    def new_file(self, timestamp):
+        """Close the file being written and open the next one of the
+        output, whose first record has the given timestamp."""
+        raise ConnNotImpError, "Cannot use base class"
+
+    def write_many(self, records):
+        """write a batch of records to the dumpfile
+
+        records - a sequence of (timestamp, bytes) tuples, as read with
+                  read_batch(n, decode = False), or of (timestamp,
+                  bytes, length) tuples where length is the length of
+                  the packet on the wire, or None; a subclass may take
+                  more, see PcapngDumpConnector.  Timestamps are integer
+                  nanoseconds since the epoch, and a timestamp of None
+                  is taken as now
+        """
+        pack = self.record_packer()
+        rotating = self.rotating
+        rotate = self.rotate
+        buffer_size = self.buffer_size
+        now = None
+        parts = []
+        size = 0
+        for record in records:
+            timestamp = record[0]
+            bytes = record[1]
+            if type(bytes) is not str:
+                bytes = str(bytes)
+            length = None
+            if len(record) > 2:
+                length = record[2]
+            if length is None:
+                length = len(bytes)
+            if timestamp is None:
+                if now is None:
+                    now = now_ns()
+                timestamp = now
+            block = pack(timestamp, bytes, length, record)
+            if rotating and rotate(timestamp, self.size + size + len(block)):
+                self.file.write("".join(parts))
+                self.size += size
+                parts = []
+                size = 0
+                self.new_file(timestamp)
+            parts.append(block)
+            size += len(block)
+            if size >= buffer_size:
+                self.file.write("".join(parts))
+                self.size += size
+                parts = []
+                size = 0
+        self.file.write("".join(parts))
+        self.size += size
+
+    def write_record(self, timestamp, bytes, length = None):
+        """write the bytes of one packet, captured at timestamp in
+        integer nanoseconds since the epoch, to the dumpfile"""
+        self.write_many([(timestamp, bytes, length)])
 
-        # Grab the underlying pcap objects members for convenience
-        self.dloff = self.file.dloff
-        self.setfilter = self.file.setfilter
-        
     def write(self, packet):
-        """write a packet to the dumpfile"""
-        if type(packet) is buffer:
-            packarg = "%ds" % len(packet)
-            packet = struct.unpack(packarg, packet)[0]
-        return self.file.dump(packet)
+        """write a packet to the dumpfile
+
+        packet - the bytes of the packet, or a Chain, or a Packet,
+                 which is written with the packets it holds; either is
+                 written with its own timestamp
+        """
+        if isinstance(packet, Packet):
+            packet = packet.chain()
+        if isinstance(packet, Chain):
+            self.write_many([(packet.timestamp, packet.bytes)])
+        else:
+            self.write_many([(None, packet)])
 
     def send(self, packet):
         """send a packet to the dumpfile
 
         calls the write() method"""
-        return self.file.dump(packet)
+        return self.write(packet)
 
     def sendto(self, packet, header):
         """sendto a packet to the dumpfile
 
-        calls the write() method"""
-        return self.file.dump(packet, header)
+        header - the pcap header of the packet, with sec and usec
+                 fields for its timestamp and a caplen field for the
+                 number of its bytes to write"""
+        timestamp = header.sec * 1000000000 + header.usec * 1000
+        self.write_many([(timestamp, packet[:header.caplen], len(packet))])
+
+    def close_file(self):
+        """Close the file being written, syncing it to disk first if
+        fsync was asked for."""
+        import os
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.file.close()
+
+    def flush(self):
+        """write out the buffer, and sync the file to disk if fsync was
+        asked for"""
+        import os
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
 
     def close(self):
-        """close the dumpfile"""
-        self.file.dump_close()
+        """close the dumpfile, syncing it to disk first if fsync was
+        asked for"""
+        if self.file is not None:
+            self.close_file()
+            self.file = None
 
+class PcapDumpConnector(SavefileDumpConnector):
+    """A connector for dumping packets to a file for later re-use.
+
+    The PcapDump connector allows the programmer to write libpcap
+    compatible files full of packets.  Unlike the PcapConnector it
+    does not alloww the programmer to read from a dump file, for that
+    the PcapConnector class should be used.
+
+    The file is written here rather than through libpcap, through a
+    large buffer, and write_many() writes a whole batch of records with
+    a single call.  Each record keeps the timestamp it is given, to
+    the microsecond or, in a nanosecond file, to the nanosecond.  The
+    output may be rotated into a new file once it reaches a size, or
+    once the records written to it span some time; the files after the
+    first are named after it with .1, .2 and so on appended.
+    """
+
+    def __init__(self, dumpfile = None, dumptype = None, snaplen = 65535,
+                 nanoseconds = False, buffer_size = 1 << 20, fsync = False,
+                 rotate_bytes = None, rotate_seconds = None):
+        """initialize a pcap dump connector
+
+        dumpfile - the name of the file to write
+        dumptype - the data link type of the packets, a pcap.DLT_* value
+        snaplen - the most bytes of a packet to write
+        nanoseconds - boolean to write a file with nanosecond timestamps
+        buffer_size - the size in bytes of the write buffer
+        fsync - boolean to sync the file to disk in flush(), and when it
+                is closed or rotated
+        rotate_bytes - the size in bytes after which the output moves
+                       on to a new file, or None
+        rotate_seconds - the time, by the timestamps of the records,
+                         after which the output moves on to a new file,
+                         or None
+        """
+        from pcs import pcapfile
+        super(PcapDumpConnector, self).__init__()
+        self.name = dumpfile
+        self.dlink = dumptype
+        self.dloff = pcap.dltoff.get(dumptype, 0)
+        self.snaplen = snaplen
+        self.nanoseconds = nanoseconds
+        self.buffer_size = buffer_size
+        self.fsync = fsync
+        self.rotate_bytes = rotate_bytes
+        if rotate_seconds is not None:
+            rotate_seconds = int(rotate_seconds * 1000000000)
+        self.rotate_ns = rotate_seconds
+        self.rotating = rotate_bytes is not None or rotate_seconds is not None
+        ## the names of the files written, the last being written now
+        self.files = []
+        self.header = pcapfile.file_header(snaplen, dumptype, nanoseconds)
+        self.record = struct.Struct("=IIII").pack
+        self.file = None
+        self.__open()
+
+    def __open(self):
+        """Open the next file of the output and write its header."""
+        name = self.file_name(len(self.files))
+        self.file = self.open_file(name)
+        self.file.write(self.header)
+        self.files.append(name)
+        self.size = len(self.header)
+        ## the timestamp of the first record of the file
+        self.started = None
+
+    def file_name(self, n):
+        """Return the name of file number n of the output, counting
+        from 0."""
+        if n == 0:
+            return self.name
+        return "%s.%d" % (self.name, n)
+
+    def open_file(self, name):
+        """Return a file object for writing the file name."""
+        return open(name, "wb", self.buffer_size)
+
+    def rotate(self, timestamp, size):
+        """Return True if a record with a timestamp, which would make
+        the file size bytes long, is to go in a new file."""
+        if self.started is None:
+            self.started = timestamp
+            return False
+        if self.rotate_bytes is not None and size > self.rotate_bytes:
+            return True
+        if (self.rotate_ns is not None and
+            timestamp - self.started >= self.rotate_ns):
+            return True
+        return False
+
+    def new_file(self, timestamp):
+        """Close the file being written and open the next one of the
+        output."""
+        self.close_file()
+        self.__open()
+        self.started = timestamp
+
+    def record_packer(self):
+        """Return a function which gives a pcap record header and the
+        bytes of a packet, cut to the snap length."""
+        header = self.record
+        snaplen = self.snaplen
+        nanoseconds = self.nanoseconds
+        def pack(timestamp, bytes, length, record):
+            if len(bytes) > snaplen:
+                bytes = bytes[:snaplen]
+            (sec, frac) = divmod(timestamp, 1000000000)
+            if not nanoseconds:
+                frac /= 1000
+            return header(sec, frac, len(bytes), length) + bytes
+        return pack
+
+class CompressedPcapDumpConnector(PcapDumpConnector):
+    """A connector which writes a compressed pcap savefile as a stream
+
+    The file is compressed with gzip, bzip2 or xz, as told by the
+    suffix of its name, as it is written.  The files after the first
+    of a rotated output are numbered before that suffix, so that
+    trace.pcap.gz is followed by trace.pcap.1.gz.  See
+    PcapDumpConnector for the rest of the arguments.
+    """
+
+    def __init__(self, dumpfile = None, dumptype = None, compression = None,
+                 level = 6, **kv):
+        """initialize a compressed pcap dump connector
+
+        compression - "gz", "bz2" or "xz", or None to go by the suffix
+                      of the name
+        level - the compression level, from 1 for the fastest to 9 for
+                the smallest
+        """
+        from pcs import pcapfile
+        if compression is None:
+            compression = pcapfile.compression(dumpfile)
+        self.compression = compression
+        self.level = level
+        PcapDumpConnector.__init__(self, dumpfile, dumptype, **kv)
+
+    def file_name(self, n):
+        """Return the name of file number n of the output, counting
+        from 0, numbered before the suffix of the compression."""
+        import os
+        if n == 0:
+            return self.name
+        (root, suffix) = os.path.splitext(self.name)
+        return "%s.%d%s" % (root, n, suffix)
+
+    def open_file(self, name):
+        """Return a file object which compresses what is written to
+        the file name."""
+        from pcs import pcapfile
+        return pcapfile.open_compressed(name, "wb", self.compression,
+                                        self.level)
+
+    def __sync(self):
+        """Sync the file being written to disk, through a descriptor of
+        its own as not every codec gives its file's."""
+        import os
+        fd = os.open(self.files[-1], os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close_file(self):
+        """Close the file being written, which writes out the end of
+        the compressed stream, then sync it if fsync was asked for."""
+        self.file.close()
+        if self.fsync:
+            self.__sync()
+
+    def flush(self):
+        """write out what has been compressed so far, where the codec
+        can, and sync the file to disk if fsync was asked for"""
+        if hasattr(self.file, "flush"):
+            self.file.flush()
+        if self.fsync:
+            self.__sync()
+
+class PcapngDumpConnector(SavefileDumpConnector):
+    """A connector which writes a pcapng savefile without libpcap
+
+    The file is one section, in the byte order of this host.  Packets
+    may be written for several interfaces, each added with
+    add_interface() and named by its number, which is the order it was
+    added in, counting from 0.  Each interface has a data link type,
+    snap length and timestamp resolution of its own, nanoseconds by
+    default.  Packets are written as Enhanced Packet Blocks, or as
+    Simple Packet Blocks, which have no timestamp, by write_simple(),
+    and the counts of an interface as an Interface Statistics Block by
+    write_stats().
+    """
+
+    def __init__(self, dumpfile = None, dumptype = None, snaplen = 65535,
+                 tsresol = 9, comment = None, buffer_size = 1 << 20,
+                 fsync = False):
+        """initialize a pcapng dump connector
+
+        dumpfile - the name of the file to write
+        dumptype - the data link type of the packets of interface 0, a
+                   pcap.DLT_* value, or None to add every interface
+                   with add_interface()
+        snaplen - the most bytes of a packet of interface 0 to write
+        tsresol - the resolution of the timestamps of the interfaces,
+                  coded as in the if_tsresol option: 9 for nanoseconds,
+                  6 for microseconds
+        comment - a comment on the section, or None
+        buffer_size - the size in bytes of the write buffer
+        fsync - boolean to sync the file to disk in flush(), and when it
+                is closed
+        """
+        from pcs import pcapng
+        super(PcapngDumpConnector, self).__init__()
+        self.name = dumpfile
+        self.tsresol = tsresol
+        self.buffer_size = buffer_size
+        self.fsync = fsync
+        ## the interfaces added, by number, as pcapng.Interface objects
+        self.interfaces = []
+        self.file = open(dumpfile, "wb", buffer_size)
+        options = []
+        if comment is not None:
+            options.append((pcapng.OPT_COMMENT, comment))
+        self.file.write(pcapng.section_header(options))
+        self.dlink = dumptype
+        self.dloff = pcap.dltoff.get(dumptype, 0)
+        if dumptype is not None:
+            self.add_interface(dumptype, snaplen)
+
+    def add_interface(self, linktype, snaplen = 65535, name = None,
+                      description = None, tsresol = None, comment = None):
+        """add an interface and return its number
+
+        linktype - the data link type of its packets, a pcap.DLT_* value
+        snaplen - the most bytes of a packet to write, 0 for no limit
+        name - the name of the interface, or None
+        description - a description of the interface, or None
+        tsresol - the resolution of its timestamps, or None for the
+                  resolution the connector was made with
+        comment - a comment on the interface, or None
+        """
+        from pcs import pcapng
+        if tsresol is None:
+            tsresol = self.tsresol
+        options = []
+        if comment is not None:
+            options.append((pcapng.OPT_COMMENT, comment))
+        if name is not None:
+            options.append((pcapng.IF_NAME, name))
+        if description is not None:
+            options.append((pcapng.IF_DESCRIPTION, description))
+        if tsresol != pcapng.DEFAULT_TSRESOL:
+            options.append((pcapng.IF_TSRESOL, chr(tsresol)))
+        self.file.write(pcapng.interface_description(linktype, snaplen,
+                                                     options))
+        self.interfaces.append(pcapng.Interface(linktype, snaplen, options))
+        return len(self.interfaces) - 1
+
+    def __interface(self, ifid):
+        """Return interface number ifid."""
+        if ifid < 0 or ifid >= len(self.interfaces):
+            raise IndexError, "no interface %d in %s" % (ifid, self.name)
+        return self.interfaces[ifid]
+
+    def record_packer(self):
+        """Return a function which gives an Enhanced Packet Block for a
+        packet of the interface whose number is the fourth item of the
+        record, 0 by default, cut to the snap length of that
+        interface."""
+        from pcs import pcapng
+        block = pcapng.enhanced_packet
+        find = self.__interface
+        def pack(timestamp, bytes, length, record):
+            ifid = 0
+            if len(record) > 3:
+                ifid = record[3]
+            interface = find(ifid)
+            if interface.snaplen and len(bytes) > interface.snaplen:
+                bytes = bytes[:interface.snaplen]
+            return block(ifid, interface.from_ns(timestamp), bytes, length)
+        return pack
+
+    def write_record(self, timestamp, bytes, length = None, interface = 0,
+                     comment = None, flags = None):
+        """write the bytes of one packet, captured at timestamp in
+        integer nanoseconds since the epoch, to the dumpfile
+
+        interface - the number of the interface of the packet
+        comment - a comment on the packet, or None
+        flags - the value of the epb_flags option, or None
+        """
+        from pcs import pcapng
+        if comment is None and flags is None:
+            self.write_many([(timestamp, bytes, length, interface)])
+            return
+        if type(bytes) is not str:
+            bytes = str(bytes)
+        if length is None:
+            length = len(bytes)
+        if timestamp is None:
+            timestamp = now_ns()
+        i = self.__interface(interface)
+        if i.snaplen and len(bytes) > i.snaplen:
+            bytes = bytes[:i.snaplen]
+        options = []
+        if comment is not None:
+            options.append((pcapng.OPT_COMMENT, comment))
+        if flags is not None:
+            options.append((pcapng.EPB_FLAGS, struct.pack("=I", flags)))
+        self.file.write(pcapng.enhanced_packet(interface, i.from_ns(timestamp),
+                                               bytes, length, options))
+
+    def write_simple(self, bytes, length = None):
+        """write the bytes of one packet of interface 0 as a Simple
+        Packet Block, which has no timestamp"""
+        from pcs import pcapng
+        if type(bytes) is not str:
+            bytes = str(bytes)
+        if length is None:
+            length = len(bytes)
+        snaplen = self.__interface(0).snaplen
+        if snaplen and len(bytes) > snaplen:
+            bytes = bytes[:snaplen]
+        self.file.write(pcapng.simple_packet(bytes, length))
+
+    def write_stats(self, interface = 0, timestamp = None, starttime = None,
+                    endtime = None, comment = None, **counts):
+        """write the counts of an interface as an Interface Statistics
+        Block
+
+        interface - the number of the interface
+        timestamp - the time of the counts, in integer nanoseconds
+                    since the epoch, or None for now
+        starttime - the time the counting started, or None
+        endtime - the time the counting ended, or None
+        comment - a comment on the counts, or None
+        counts - the counts by the names in pcapng.ISB_COUNTS, e.g.
+                 ifrecv = 1000, ifdrop = 2
+        """
+        from pcs import pcapng
+        i = self.__interface(interface)
+        if timestamp is None:
+            timestamp = now_ns()
+        options = []
+        if comment is not None:
+            options.append((pcapng.OPT_COMMENT, comment))
+        for (code, t) in [(pcapng.ISB_STARTTIME, starttime),
+                          (pcapng.ISB_ENDTIME, endtime)]:
+            if t is not None:
+                units = i.from_ns(t)
+                options.append((code, struct.pack("=II", units >> 32,
+                                                  units & 0xffffffff)))
+        codes = dict([(name, code)
+                      for (code, name) in pcapng.ISB_COUNTS.items()])
+        for name in sorted(counts, key = lambda name: codes[name]):
+            options.append((codes[name], struct.pack("=Q", counts[name])))
+        self.file.write(pcapng.interface_statistics(interface,
+                                                    i.from_ns(timestamp),
+                                                    options))
 
 class TapConnector(Connector):
     """A connector for capture and injection using the character
@@ -2172,12 +4231,11 @@ class TapConnector(Connector):
            currently available. Used by Connector.expect() to do the
            right thing with buffering live captures.
            Note that unlike pcap, timestamps are not real-time."""
-        from time import time
         result = []	# list of chain
         lpb = []	# list of strings (packet buffers) 
         if __debug__ and not self.is_nonblocking:
             print "WARNING: TapConnector.try_read_n_chains w/o O_NONBLOCK"
-        ts = time()
+        ts = now_ns()
         for i in xrange(n):
             pb = self.try_read_one()
             if pb is None:
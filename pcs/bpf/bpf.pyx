@@ -20,8 +20,12 @@ import sys
 import calendar
 import time
 
+cdef extern from "Python.h":
+    int     PyObject_AsReadBuffer(object obj, const void **buffer,
+                                  Py_ssize_t *buffer_len) except -1
+
 cdef extern from "pcap.h":
-    int     bpf_filter(bpf_insn *insns, char *buf, int len, int caplen)
+    int     bpf_filter(bpf_insn *insns, char *buf, int len, int caplen) nogil
     int     bpf_validate(bpf_insn *insns, int len)
     char   *bpf_image(bpf_insn *insns, int n)
 
@@ -404,6 +408,67 @@ cdef class progbuf:
         """Return boolean match for buf against our filter."""
         return bool(bpf_filter(self.bp.bf_insns, buf, buflen, buflen) != 0)
 
+    def filter_batch(self, object data, object offsets=None,
+                     object lengths=None):
+        """Run our filter over many packets in one call, without
+           holding the interpreter lock.  Return a list of the indices
+           of the packets it matches.
+
+           data - a list of strings or buffers, one per packet, or a
+                  single string, buffer or mmap holding all of them
+           offsets - if data is a single object, the offset in it of
+                     the bytes of each packet
+           lengths - if data is a single object, the length of each
+                     packet"""
+        cdef unsigned int i
+        cdef unsigned int n
+        cdef char **bufs
+        cdef unsigned int *lens
+        cdef int *results
+        cdef const void *base
+        cdef Py_ssize_t baselen
+        cdef const void *p
+        cdef Py_ssize_t plen
+        cdef bpf_insn *insns
+        if offsets is None:
+            # Hold our own tuple of the packets, which no other thread
+            # can change or free while the lock is released below.
+            data = tuple(data)
+            n = len(data)
+        else:
+            n = len(offsets)
+            if len(lengths) != n:
+                raise ValueError, "offsets and lengths differ in length"
+            PyObject_AsReadBuffer(data, &base, &baselen)
+        bufs = <char **> malloc(n * sizeof(char *) + 1)
+        lens = <unsigned int *> malloc(n * sizeof(unsigned int) + 1)
+        results = <int *> malloc(n * sizeof(int) + 1)
+        try:
+            if bufs == NULL or lens == NULL or results == NULL:
+                raise MemoryError, 'malloc'
+            # Gather the packets while we may still raise; the objects
+            # in our tuple keep their bytes for the length of the call.
+            for 0 <= i < n:
+                if offsets is None:
+                    PyObject_AsReadBuffer(data[i], &p, &plen)
+                    bufs[i] = <char *> p
+                    lens[i] = plen
+                else:
+                    if offsets[i] < 0 or lengths[i] < 0 or \
+                       offsets[i] + lengths[i] > baselen:
+                        raise ValueError, "packet %d is out of bounds" % i
+                    bufs[i] = (<char *> base) + <Py_ssize_t> offsets[i]
+                    lens[i] = lengths[i]
+            insns = self.bp.bf_insns
+            with nogil:
+                for 0 <= i < n:
+                    results[i] = bpf_filter(insns, bufs[i], lens[i], lens[i])
+            return [i for i from 0 <= i < n if results[i] != 0]
+        finally:
+            free(bufs)
+            free(lens)
+            free(results)
+
 # program acts as a proxy for progbuf.
 cdef class program:
     """program() -> BPF program object"""
@@ -453,6 +518,12 @@ cdef class program:
         buflen = len(buf)
         return self.__progbuf__().filter(buf, buflen)
 
+    def filter_batch(self, object data, object offsets=None,
+                     object lengths=None):
+        """Return a list of the indices of the packets our filter
+           matches, see progbuf.filter_batch()."""
+        return self.__progbuf__().filter_batch(data, offsets, lengths)
+
     def validate(self):
         """Return boolean True if BPF program is valid."""
         return self.__progbuf__().validate()
@@ -0,0 +1,848 @@
+#
+# Copyright (c) 2008, Neville-Neil Consulting
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# Neither the name of Neville-Neil Consulting nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# File: $Id: $
+#
+# Author: George V. Neville-Neil
+#
+# Description: Compile the patterns given to expect() into a BPF
+# program, so that the packets which cannot match any of them are
+# dropped before they are read.
+#
+# Instructions are kept here as tuples of (code, jt, jf, k), the
+# fields of a struct bpf_insn, so that programs can be built and
+# checked without the bpf module; program() turns them into a
+# pcs.bpf.program which may be installed with set_bpf_program().
+# optimize() shortens any program, compiled here or written by hand,
+# and verify() checks a program before it is installed.
+#
+# The program only ever accepts more packets than the patterns match,
+# never fewer.  Fields which cannot be reached at a known offset, and
+# fields with their own compare functions, are left for expect() to
+# check after the packet has been decoded.
+
+import struct
+
+## Instruction classes, sizes, modes and operations, as in <net/bpf.h>.
+BPF_LD = 0x00
+BPF_LDX = 0x01
+BPF_ST = 0x02
+BPF_STX = 0x03
+BPF_ALU = 0x04
+BPF_JMP = 0x05
+BPF_RET = 0x06
+BPF_MISC = 0x07
+
+BPF_W = 0x00
+BPF_H = 0x08
+BPF_B = 0x10
+
+BPF_IMM = 0x00
+BPF_ABS = 0x20
+BPF_IND = 0x40
+BPF_MEM = 0x60
+BPF_LEN = 0x80
+BPF_MSH = 0xa0
+
+BPF_ADD = 0x00
+BPF_SUB = 0x10
+BPF_MUL = 0x20
+BPF_DIV = 0x30
+BPF_OR = 0x40
+BPF_AND = 0x50
+BPF_LSH = 0x60
+BPF_RSH = 0x70
+BPF_NEG = 0x80
+
+BPF_JA = 0x00
+BPF_JEQ = 0x10
+BPF_JGT = 0x20
+BPF_JGE = 0x30
+BPF_JSET = 0x40
+
+BPF_K = 0x00
+BPF_X = 0x08
+BPF_A = 0x10
+
+BPF_TAX = 0x00
+BPF_TXA = 0x80
+
+## The number of words of scratch memory.
+BPF_MEMWORDS = 16
+
+## The load size for a run of 1, 2 or 4 bytes.
+sizes = { 1: BPF_B, 2: BPF_H, 4: BPF_W }
+
+def header_lengths():
+    """Return the packet classes whose headers vary in length, each
+    mapped to the name of the field which holds the length of its
+    header in 32 bit words."""
+    from pcs.packets.ipv4 import ipv4
+    from pcs.packets.tcp import tcp
+    return { ipv4: "hlen", tcp: "offset" }
+
+def checks(packet):
+    """Return the bytes of a packet which the fields of a pattern fix,
+    as a dictionary of (mask, value) by offset from the start of the
+    packet, and the bit offset at which the fields which may be reached
+    end."""
+    from pcs import Field, StringField
+    fixed = {}
+    bit = 0
+    for field in packet._layout:
+        if type(field) not in (Field, StringField):
+            break
+        width = field.width
+        if packet._getcompare(field.name) is field.default_compare:
+            value = packet._getvalue(field.name)
+            if type(field) is StringField and isinstance(value, str) and \
+               (bit % 8) == 0:
+                value = value[:width / 8]
+                for i in xrange(len(value)):
+                    fixed[bit / 8 + i] = (0xff, ord(value[i]))
+            elif type(field) is Field and isinstance(value, (int, long)):
+                first = bit / 8
+                end = (bit + width + 7) / 8
+                shift = end * 8 - bit - width
+                mask = ((1 << width) - 1) << shift
+                value = (value << shift) & mask
+                for i in xrange(end - first):
+                    down = (end - first - 1 - i) * 8
+                    m = (mask >> down) & 0xff
+                    v = (value >> down) & 0xff
+                    (om, ov) = fixed.get(first + i, (0, 0))
+                    fixed[first + i] = (om | m, ov | v)
+        bit += width
+    return (fixed, bit)
+
+def tests(fixed, indirect, base):
+    """Turn the bytes fixed in a packet into the steps which test them,
+    loading up to four bytes at a time."""
+    result = []
+    offsets = fixed.keys()
+    offsets.sort()
+    i = 0
+    while i < len(offsets):
+        # A run of bytes which follow one another.
+        j = i + 1
+        while j < len(offsets) and offsets[j] == offsets[j - 1] + 1:
+            j += 1
+        while i < j:
+            n = j - i
+            if n >= 4:
+                n = 4
+            elif n == 3:
+                n = 2
+            mask = 0
+            value = 0
+            for offset in offsets[i:i + n]:
+                (m, v) = fixed[offset]
+                mask = (mask << 8) | m
+                value = (value << 8) | v
+            result.append(("test", indirect, n, base + offsets[i],
+                           mask, value))
+            i += n
+    return result
+
+def steps(pattern):
+    """Return the steps a program takes to test the packets of a
+    pattern, in order.  Each step is a tuple, either a test of some
+    bytes, or the loading of the X register with the offset of a header
+    which follows a header whose length varies."""
+    from pcs import Field, StringField
+    variable = header_lengths()
+    result = []
+    # The offset of the current packet is base, from the start of the
+    # frame or, once a header whose length varies has been passed, from
+    # the value of X.
+    indirect = False
+    base = 0
+    pending = None
+    for packet in pattern.packets:
+        (fixed, reached) = checks(packet)
+        if len(fixed) > 0:
+            if pending is not None:
+                result.append(pending)
+                (indirect, base) = (True, pending[-1])
+                pending = None
+            result += tests(fixed, indirect, base)
+        # Work out where the next packet starts.
+        for cls in variable:
+            if isinstance(packet, cls):
+                name = variable[cls]
+                bit = 0
+                for fn in packet._layout:
+                    if fn.name == name:
+                        break
+                    bit += fn.width
+                width = fn.width
+                offset = base + bit / 8
+                shift = 8 - (bit % 8) - width
+                if pending is not None:
+                    # No field of this packet is tested, so its offset
+                    # is still to be loaded into X.
+                    result.append(pending)
+                    (indirect, base) = (True, pending[-1])
+                    offset = base + bit / 8
+                if not indirect and shift == 0 and width == 4:
+                    pending = ("msh", offset, base)
+                else:
+                    mask = ((1 << width) - 1) << shift
+                    pending = ("hlen", indirect, offset, mask, shift, base)
+                break
+        else:
+            for fn in packet._layout:
+                if type(fn) not in (Field, StringField):
+                    return result
+            if pending is not None:
+                pending = pending[:-1] + (pending[-1] + reached / 8,)
+            else:
+                base += reached / 8
+    return result
+
+class Node(object):
+    """A step of a program in the tree of the steps of all of its
+    patterns, which share the steps at the start they have in common."""
+
+    def __init__(self):
+        ## whether a packet which gets here is accepted
+        self.accept = False
+        ## the steps which may follow, each with the node it leads to
+        self.children = []
+
+    def insert(self, steps):
+        """Add the steps of a pattern below this node."""
+        node = self
+        for step in steps:
+            if node.accept:
+                return
+            for (s, child) in node.children:
+                if s == step:
+                    node = child
+                    break
+            else:
+                child = Node()
+                node.children.append((step, child))
+                node = child
+        node.accept = True
+        node.children = []
+
+    def loads_x(self):
+        """Return True if a step below this node loads X."""
+        for (step, child) in self.children:
+            if step[0] != "test" or child.loads_x():
+                return True
+        return False
+
+class Label(object):
+    """A place in a program which is jumped to."""
+    pass
+
+def compile(patterns, snaplen = 65535):
+    """Compile a list of patterns, as given to expect(), into a BPF
+    program which accepts every packet that may match one of them.
+    Return the program as a list of instructions, or None if there are
+    no Chains among the patterns.
+
+    patterns - a list of Chains, and of other objects such as EOF
+               which are ignored
+    snaplen - the number of bytes of each packet the program accepts
+    """
+    from pcs import Chain
+    root = Node()
+    found = False
+    for pattern in patterns:
+        if isinstance(pattern, Chain):
+            root.insert(steps(pattern))
+            found = True
+    if not found:
+        return None
+    code = []
+    reject = Label()
+    emit(code, root, reject, reject, [], snaplen)
+    code.append(reject)
+    code.append((BPF_RET|BPF_K, None, None, 0))
+    return layout(simplify(assemble(code)))
+
+def emit(code, node, fail, reject, path, snaplen):
+    """Emit the instructions for the steps below a node into a list,
+    with labels for jumps.  A packet which fails a test jumps to fail,
+    which is reject if no other pattern is left to try."""
+    if node.accept:
+        code.append((BPF_RET|BPF_K, None, None, snaplen))
+        return
+    clobbered = False
+    for i in xrange(len(node.children)):
+        (step, child) = node.children[i]
+        if i == len(node.children) - 1:
+            next = fail
+        else:
+            next = Label()
+        if clobbered:
+            # The steps before this one changed X; load it again.
+            for s in path:
+                if s[0] != "test":
+                    emit_step(code, s, None, False)
+        emit_step(code, step, next, next is not reject)
+        emit(code, child, next, reject, path + [step], snaplen)
+        if next is not fail:
+            code.append(next)
+        if step[0] != "test" or child.loads_x():
+            clobbered = len([s for s in path if s[0] != "test"]) > 0
+
+def emit_step(code, step, fail, guard):
+    """Emit the instructions of one step.  A load from beyond the end
+    of the packet makes the whole program reject it, so while other
+    patterns are left to try, guard is True and the length of the packet
+    is checked first."""
+    if step[0] == "test":
+        (kind, indirect, size, offset, mask, value) = step
+        if guard:
+            emit_guard(code, indirect, offset + size, fail)
+        mode = (indirect and BPF_IND) or BPF_ABS
+        code.append((BPF_LD|sizes[size]|mode, None, None, offset))
+        full = (1 << (size * 8)) - 1
+        if mask == full:
+            code.append((BPF_JMP|BPF_JEQ|BPF_K, None, fail, value))
+        elif (mask & (mask - 1)) == 0:
+            # A single bit.
+            if value:
+                code.append((BPF_JMP|BPF_JSET|BPF_K, None, fail, mask))
+            else:
+                code.append((BPF_JMP|BPF_JSET|BPF_K, fail, None, mask))
+        else:
+            code.append((BPF_ALU|BPF_AND|BPF_K, None, None, mask))
+            code.append((BPF_JMP|BPF_JEQ|BPF_K, None, fail, value))
+    elif step[0] == "msh":
+        if guard:
+            emit_guard(code, False, step[1] + 1, fail)
+        code.append((BPF_LDX|BPF_MSH|BPF_B, None, None, step[1]))
+    else:
+        (kind, indirect, offset, mask, shift, base) = step
+        if guard:
+            emit_guard(code, indirect, offset + 1, fail)
+        mode = (indirect and BPF_IND) or BPF_ABS
+        code.append((BPF_LD|BPF_B|mode, None, None, offset))
+        code.append((BPF_ALU|BPF_AND|BPF_K, None, None, mask))
+        # The length is in 32 bit words.
+        if shift > 2:
+            code.append((BPF_ALU|BPF_RSH|BPF_K, None, None, shift - 2))
+        elif shift < 2:
+            code.append((BPF_ALU|BPF_LSH|BPF_K, None, None, 2 - shift))
+        if indirect:
+            code.append((BPF_ALU|BPF_ADD|BPF_X, None, None, 0))
+        code.append((BPF_MISC|BPF_TAX, None, None, 0))
+
+def emit_guard(code, indirect, end, fail):
+    """Emit a check that a packet holds the bytes up to end, counted
+    from X if indirect, jumping to fail if it does not."""
+    code.append((BPF_LD|BPF_W|BPF_LEN, None, None, 0))
+    if indirect:
+        code.append((BPF_JMP|BPF_JGE|BPF_X, None, fail, 0))
+        code.append((BPF_ALU|BPF_SUB|BPF_X, None, None, 0))
+    code.append((BPF_JMP|BPF_JGE|BPF_K, None, fail, end))
+
+def assemble(code):
+    """Resolve the labels of a list of instructions and labels, and
+    return the instructions with the targets of their jumps as the
+    index of the instruction jumped to, see absolute()."""
+    where = {}
+    n = 0
+    for insn in code:
+        if isinstance(insn, Label):
+            where[insn] = n
+        else:
+            n += 1
+    result = []
+    for insn in code:
+        if isinstance(insn, Label):
+            continue
+        (op, jt, jf, k) = insn
+        here = len(result) + 1
+        if (op & 0x07) == BPF_JMP:
+            jt = (jt is not None and where[jt]) or here
+            jf = (jf is not None and where[jf]) or here
+        else:
+            (jt, jf) = (0, 0)
+        result.append((op, jt, jf, k))
+    return result
+
+def instructions(prog):
+    """Return the instructions of a pcs.bpf.program as tuples."""
+    return [(i.code, i.jt, i.jf, i.k) for i in prog.instructions]
+
+def program(insns):
+    """Return a pcs.bpf.program of a list of instructions."""
+    from pcs.bpf import program, op
+    return program([op(code, jt, jf, k) for (code, jt, jf, k) in insns])
+
+def is_ja(code):
+    """Return True for an unconditional jump."""
+    return (code & 0x07) == BPF_JMP and (code & 0xf0) == BPF_JA
+
+def is_branch(code):
+    """Return True for a conditional jump."""
+    return (code & 0x07) == BPF_JMP and (code & 0xf0) != BPF_JA
+
+def absolute(insns):
+    """Return a list of instructions with the targets of their jumps
+    given as the index of the instruction jumped to rather than as an
+    offset from the next instruction.  The targets of a conditional
+    jump are in jt and jf, and that of an unconditional jump in k."""
+    result = []
+    for i in xrange(len(insns)):
+        (code, jt, jf, k) = insns[i]
+        if is_ja(code):
+            k = i + 1 + k
+        elif is_branch(code):
+            jt = i + 1 + jt
+            jf = i + 1 + jf
+        result.append((code, jt, jf, k))
+    return result
+
+def layout(code):
+    """Turn the jumps of a list of instructions from absolute() back
+    into offsets.  A conditional jump reaches at most 255 instructions
+    ahead, so one to a target further away jumps instead to an
+    unconditional jump, a trampoline, put just after it."""
+    n = len(code)
+    # The targets of each conditional jump which need a trampoline.
+    far = [()] * n
+    while True:
+        position = []
+        p = 0
+        for i in xrange(n):
+            position.append(p)
+            p += 1 + len(far[i])
+        changed = False
+        for i in xrange(n):
+            (op, jt, jf, k) = code[i]
+            if not is_branch(op):
+                continue
+            for target in (jt, jf):
+                if target not in far[i] and \
+                   position[target] - position[i] - 1 > 255:
+                    far[i] = far[i] + (target,)
+                    changed = True
+        if not changed:
+            break
+    result = []
+    for i in xrange(n):
+        (op, jt, jf, k) = code[i]
+        here = position[i] + 1
+        if is_ja(op):
+            result.append((op, 0, 0, position[k] - here))
+        elif is_branch(op):
+            targets = []
+            for target in (jt, jf):
+                if target in far[i]:
+                    targets.append(far[i].index(target))
+                else:
+                    targets.append(position[target] - here)
+            result.append((op, targets[0], targets[1], k))
+            for target in far[i]:
+                result.append((BPF_JMP|BPF_JA, 0, 0,
+                               position[target] - len(result) - 1))
+        else:
+            result.append((op, jt, jf, k))
+    return result
+
+def optimize(insns):
+    """Return a shorter program which does the same as a list of
+    instructions.  Loads of values which are already in A or X are
+    removed, jumps to jumps, and to tests whose outcome is known, go
+    straight to where those lead, and code which cannot be reached is
+    removed.  Jumps too far for a conditional jump go through
+    trampolines."""
+    return layout(simplify(absolute(insns)))
+
+def simplify(code):
+    """Optimize a list of instructions from absolute(), and return it
+    in the same form; see optimize()."""
+    while True:
+        threaded = thread(code)
+        deleted = redundant(threaded)
+        deleted.update(unreachable(threaded))
+        if threaded == code and len(deleted) == 0:
+            return code
+        code = remove(threaded, deleted)
+
+def thread(code):
+    """Return the instructions with each jump going as far as may be
+    known from the jump alone."""
+    result = []
+    for i in xrange(len(code)):
+        (op, jt, jf, k) = code[i]
+        if is_ja(op):
+            k = follow(code, k, None, None)
+            if (code[k][0] & 0x07) == BPF_RET:
+                (op, jt, jf, k) = code[k]
+        elif is_branch(op):
+            jt = follow(code, jt, code[i], True)
+            jf = follow(code, jf, code[i], False)
+            if jt == jf:
+                (op, jt, jf, k) = (BPF_JMP|BPF_JA, 0, 0, jt)
+        result.append((op, jt, jf, k))
+    return result
+
+def follow(code, target, test, outcome):
+    """Return where a jump to target ends up, given the conditional
+    jump it is taken from, if any, and the outcome of its test."""
+    seen = 0
+    while seen < len(code):
+        seen += 1
+        (op, jt, jf, k) = code[target]
+        if is_ja(op):
+            target = k
+            continue
+        if test is None or not is_branch(op):
+            return target
+        # Neither A nor X changes along a jump, so the outcome of a
+        # test may be known from the one before it.
+        if op == test[0] and k == test[3]:
+            if outcome:
+                target = jt
+            else:
+                target = jf
+        elif op == test[0] == BPF_JMP|BPF_JEQ|BPF_K and outcome:
+            target = jf
+        else:
+            return target
+    return target
+
+def redundant(code):
+    """Return the set of the indices of the loads of A or X with a
+    value the register is known to hold already."""
+    deleted = set()
+    # The value in each register as an expression of how it was got,
+    # as each instruction is reached.  A register whose value is not
+    # known holds a value unique to the instruction.
+    states = [None] * len(code)
+    states[0] = (("imm", 0), ("imm", 0))
+    for i in xrange(len(code)):
+        (op, jt, jf, k) = code[i]
+        if states[i] is None:
+            # Not reached.
+            continue
+        (A, X) = states[i]
+        cls = op & 0x07
+        mode = op & 0xe0
+        if cls == BPF_LD:
+            if mode == BPF_ABS:
+                value = ("abs", op & 0x18, k)
+            elif mode == BPF_IND:
+                value = ("ind", op & 0x18, k, X)
+            elif mode == BPF_LEN:
+                value = ("len",)
+            elif mode == BPF_IMM:
+                value = ("imm", k)
+            else:
+                value = ("unknown", i)
+            if value == A:
+                deleted.add(i)
+            A = value
+        elif cls == BPF_LDX:
+            if mode == BPF_IMM:
+                value = ("imm", k)
+            elif mode == BPF_LEN:
+                value = ("len",)
+            elif mode == BPF_MSH:
+                value = ("msh", k)
+            else:
+                value = ("unknown", i)
+            if value == X:
+                deleted.add(i)
+            X = value
+        elif cls == BPF_ALU:
+            A = ("alu", op, k, A, (op & BPF_X) and X)
+        elif cls == BPF_MISC:
+            if (op & 0xf8) == BPF_TXA:
+                if A == X:
+                    deleted.add(i)
+                A = X
+            else:
+                if X == A:
+                    deleted.add(i)
+                X = A
+        if cls == BPF_RET:
+            continue
+        if is_ja(op):
+            targets = [k]
+        elif is_branch(op):
+            targets = [jt, jf]
+        else:
+            targets = [i + 1]
+        for t in targets:
+            if states[t] is None:
+                states[t] = (A, X)
+            else:
+                (a, x) = states[t]
+                if a != A:
+                    a = ("unknown", t, "A")
+                if x != X:
+                    x = ("unknown", t, "X")
+                states[t] = (a, x)
+    return deleted
+
+def unreachable(code):
+    """Return the set of the indices of the instructions which cannot
+    be reached, and of jumps to the next instruction."""
+    reached = set([0])
+    deleted = set()
+    for i in xrange(len(code)):
+        (op, jt, jf, k) = code[i]
+        if i not in reached:
+            deleted.add(i)
+        elif (op & 0x07) == BPF_RET:
+            continue
+        elif is_ja(op):
+            if k == i + 1:
+                deleted.add(i)
+            reached.add(k)
+        elif is_branch(op):
+            reached.add(jt)
+            reached.add(jf)
+        else:
+            reached.add(i + 1)
+    return deleted
+
+def remove(code, deleted):
+    """Return the instructions without those deleted.  A jump to an
+    instruction removed goes to the one after it instead."""
+    index = []
+    n = 0
+    for i in xrange(len(code)):
+        index.append(n)
+        if i not in deleted:
+            n += 1
+    result = []
+    for i in xrange(len(code)):
+        if i in deleted:
+            continue
+        (op, jt, jf, k) = code[i]
+        if is_ja(op):
+            k = index[k]
+        elif is_branch(op):
+            jt = index[jt]
+            jf = index[jf]
+        result.append((op, jt, jf, k))
+    return result
+
+## The most instructions a program may have, as in <net/bpf.h>.
+BPF_MAXINSNS = 512
+
+def verify(insns):
+    """Check a list of instructions before it is handed to pcap or the
+    kernel, as bpf_validate() does.  Raise ValueError, naming the first
+    instruction which is wrong, if a jump leaves the program, an
+    instruction is not known, a constant divisor is zero, scratch memory
+    is read before it is written, or the program does not end with a
+    return."""
+    n = len(insns)
+    if n == 0 or n > BPF_MAXINSNS:
+        raise ValueError, "a program has from 1 to %d instructions, " \
+              "not %d" % (BPF_MAXINSNS, n)
+    def wrong(i, reason):
+        raise ValueError, "instruction %d: %s" % (i, reason)
+    # The words of scratch memory which are written on every path to
+    # each instruction.
+    written = [None] * n
+    written[0] = frozenset()
+    for i in xrange(n):
+        (code, jt, jf, k) = insns[i]
+        cls = code & 0x07
+        mode = code & 0xe0
+        size = code & 0x18
+        stored = written[i]
+        reached = stored is not None
+        if not reached:
+            stored = frozenset()
+        if code > 0xff:
+            wrong(i, "unknown instruction")
+        if cls == BPF_LD:
+            if (mode in (BPF_ABS, BPF_IND) and size == 0x18) or \
+               (mode in (BPF_IMM, BPF_LEN, BPF_MEM) and size != BPF_W) or \
+               mode not in (BPF_IMM, BPF_ABS, BPF_IND, BPF_MEM, BPF_LEN):
+                wrong(i, "unknown load")
+        elif cls == BPF_LDX:
+            if code not in (BPF_LDX|BPF_W|BPF_IMM, BPF_LDX|BPF_W|BPF_MEM,
+                            BPF_LDX|BPF_W|BPF_LEN, BPF_LDX|BPF_B|BPF_MSH):
+                wrong(i, "unknown load of X")
+        elif cls in (BPF_ST, BPF_STX):
+            if code not in (BPF_ST, BPF_STX):
+                wrong(i, "unknown store")
+            if k >= BPF_MEMWORDS:
+                wrong(i, "no scratch memory word %d" % k)
+            stored = stored | frozenset([k])
+        elif cls == BPF_ALU:
+            operation = code & 0xf0
+            if operation not in (BPF_ADD, BPF_SUB, BPF_MUL, BPF_DIV,
+                                 BPF_OR, BPF_AND, BPF_LSH, BPF_RSH, BPF_NEG):
+                wrong(i, "unknown arithmetic")
+            if operation == BPF_DIV and not (code & BPF_X) and k == 0:
+                wrong(i, "division by zero")
+        elif cls == BPF_JMP:
+            operation = code & 0xf0
+            if operation not in (BPF_JA, BPF_JEQ, BPF_JGT, BPF_JGE, BPF_JSET):
+                wrong(i, "unknown jump")
+            if operation == BPF_JA:
+                targets = [i + 1 + k]
+            else:
+                targets = [i + 1 + jt, i + 1 + jf]
+            for t in targets:
+                if t >= n:
+                    wrong(i, "jump past the end of the program")
+                if written[t] is None:
+                    written[t] = stored
+                else:
+                    written[t] = written[t] & stored
+            continue
+        elif cls == BPF_RET:
+            if code not in (BPF_RET|BPF_K, BPF_RET|BPF_A):
+                wrong(i, "unknown return")
+            continue
+        elif cls == BPF_MISC:
+            if code not in (BPF_MISC|BPF_TAX, BPF_MISC|BPF_TXA):
+                wrong(i, "unknown instruction")
+        if cls in (BPF_LD, BPF_LDX) and mode == BPF_MEM:
+            if k >= BPF_MEMWORDS:
+                wrong(i, "no scratch memory word %d" % k)
+            if reached and k not in stored:
+                wrong(i, "scratch memory word %d is read before it is "
+                      "written" % k)
+        if i + 1 >= n:
+            wrong(i, "the program does not end with a return")
+        if written[i + 1] is None:
+            written[i + 1] = stored
+        else:
+            written[i + 1] = written[i + 1] & stored
+
+def execute(insns, bytes):
+    """Run a list of instructions over the bytes of a packet, as
+    bpf_filter() does, and return the number of bytes to accept.  This
+    is for checking programs where the bpf module is not at hand; it is
+    far slower than libpcap."""
+    A = 0
+    X = 0
+    M = [0] * BPF_MEMWORDS
+    buflen = len(bytes)
+    formats = { BPF_W: "!I", BPF_H: "!H", BPF_B: "!B" }
+    widths = { BPF_W: 4, BPF_H: 2, BPF_B: 1 }
+    pc = 0
+    while True:
+        (code, jt, jf, k) = insns[pc]
+        pc += 1
+        cls = code & 0x07
+        if cls == BPF_RET:
+            if (code & 0x18) == BPF_A:
+                return A
+            return k
+        elif cls == BPF_LD or cls == BPF_LDX:
+            mode = code & 0xe0
+            size = code & 0x18
+            if mode == BPF_IMM:
+                value = k
+            elif mode == BPF_LEN:
+                value = buflen
+            elif mode == BPF_MEM:
+                value = M[k]
+            elif mode == BPF_MSH:
+                if k >= buflen:
+                    return 0
+                value = (ord(bytes[k]) & 0xf) << 2
+            else:
+                offset = k
+                if mode == BPF_IND:
+                    offset += X
+                if offset + widths[size] > buflen:
+                    return 0
+                value = struct.unpack_from(formats[size], bytes, offset)[0]
+            if cls == BPF_LD:
+                A = value
+            else:
+                X = value
+        elif cls == BPF_ST:
+            M[k] = A
+        elif cls == BPF_STX:
+            M[k] = X
+        elif cls == BPF_ALU:
+            operation = code & 0xf0
+            if code & BPF_X:
+                operand = X
+            else:
+                operand = k
+            if operation == BPF_ADD:
+                A += operand
+            elif operation == BPF_SUB:
+                A -= operand
+            elif operation == BPF_MUL:
+                A *= operand
+            elif operation == BPF_DIV:
+                if operand == 0:
+                    return 0
+                A /= operand
+            elif operation == BPF_OR:
+                A |= operand
+            elif operation == BPF_AND:
+                A &= operand
+            elif operation == BPF_LSH:
+                A <<= operand
+            elif operation == BPF_RSH:
+                A >>= operand
+            elif operation == BPF_NEG:
+                A = -A
+            A &= 0xffffffff
+        elif cls == BPF_JMP:
+            operation = code & 0xf0
+            if operation == BPF_JA:
+                pc += k
+                continue
+            if code & BPF_X:
+                operand = X
+            else:
+                operand = k
+            if operation == BPF_JEQ:
+                taken = A == operand
+            elif operation == BPF_JGT:
+                taken = A > operand
+            elif operation == BPF_JGE:
+                taken = A >= operand
+            else:
+                taken = (A & operand) != 0
+            if taken:
+                pc += jt
+            else:
+                pc += jf
+        else:
+            if (code & 0xf8) == BPF_TXA:
+                A = X
+            else:
+                X = A
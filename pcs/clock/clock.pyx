@@ -7,6 +7,10 @@
 
 This module provides a Python front-end for POSIX clocks as well
 as conversion functions for timespecs to datetime
+
+The *_ns functions give and take times as integer nanoseconds, which
+unlike a float keep the full resolution of a timespec at the time of
+day; PCS keeps packet timestamps in the same form.
 """
 
 __author__ = 'Bruce M. Simpson <bms@incunabulum.net>'
@@ -89,6 +93,44 @@ def getres(clockid_t clock_id):
         result = _timespec_to_double(&t)
         return result
 
+def gettime_ns(clockid_t clock_id):
+    """Get the time kept by a POSIX clock in integer nanoseconds.
+    Return long or None."""
+    IF UNAME_SYSNAME == "Windows":
+        return None
+    ELSE:
+        cdef timespec t
+        cdef int rc
+        rc = clock_gettime(clock_id, &t)
+        if rc != 0:
+            return None
+        return _timespec_to_ns(&t)
+
+def settime_ns(clockid_t clock_id, long long value):
+    """Set the time for a POSIX clock from integer nanoseconds.
+    Return boolean success."""
+    IF UNAME_SYSNAME == "Windows":
+        return False
+    ELSE:
+        cdef timespec t
+        cdef int rc
+        _ns_to_timespec(value, &t)
+        rc = clock_settime(clock_id, &t)
+        return bool(rc == 0)
+
+def getres_ns(clockid_t clock_id):
+    """Get the resolution of a POSIX clock in integer nanoseconds.
+    Return long or None."""
+    IF UNAME_SYSNAME == "Windows":
+        return None
+    ELSE:
+        cdef timespec t
+        cdef int rc
+        rc = clock_getres(clock_id, &t)
+        if rc != 0:
+            return None
+        return _timespec_to_ns(&t)
+
 
 cdef class TimeSpec:
     """timespec(seconds, nanoseconds) -> timespec object
@@ -110,6 +152,9 @@ cdef class TimeSpec:
         result = _timespec_to_double(&self.ts)
         return result
 
+    def toNanoseconds(self):
+        return _timespec_to_ns(&self.ts)
+
 # This looks gnarly. We need to preserve the precision of the POSIX
 # timespec, but doing this needs to be somewhat munged to use plain
 # C arithmetic in Pyrex syntax.
@@ -129,3 +174,12 @@ cdef double _timespec_to_double(timespec *tp):
     result = tp[0].tv_sec * 1.0
     result = result + (tp[0].tv_nsec * 1.0e-9)
     return result
+
+cdef object _timespec_to_ns(timespec *tp):
+    """Convert a normalized timespec to integer nanoseconds."""
+    return <long long>tp[0].tv_sec * 1000000000 + tp[0].tv_nsec
+
+cdef void _ns_to_timespec(long long ns, timespec *tp):
+    """Convert integer nanoseconds to a normalized timespec."""
+    tp[0].tv_sec = <unsigned int>(ns / 1000000000)
+    tp[0].tv_nsec = <long>(ns % 1000000000)
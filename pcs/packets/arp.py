@@ -36,7 +36,6 @@
 import pcs
 import struct
 from socket import AF_INET, inet_ntop, inet_ntoa
-import time
 
 ARPHRD_ETHER = 1	# ethernet hardware format
 ARPHRD_IEEE802 = 6	# token-ring hardware format
@@ -72,9 +71,8 @@ class arp(pcs.Packet):
                                    sha, spa, tha, tpa], bytes = bytes, **kv)
         self.description = "ARP"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         self.data = None
 
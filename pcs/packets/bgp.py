@@ -36,7 +36,6 @@
 #
 
 import struct
-import time
 
 import pcs
 import pcs.packets.payload
@@ -75,9 +74,8 @@ class notification(pcs.Packet):
         self.description = "RFC 4271 BGP NOTIFICATION message."
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -108,9 +106,8 @@ class update(pcs.Packet):
         self.description = "RFC 4271 BGP UPDATE message."
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = nwithdrawn.width
@@ -144,9 +141,8 @@ class open(pcs.Packet):
         self.description = "RFC 4271 BGP OPEN message."
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         # TODO: Parse the Capabilities TLV (RFC 3392).
         if bytes is not None:
@@ -187,9 +183,8 @@ class header(pcs.Packet):
         self.description = "RFC 4271 BGP message header."
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
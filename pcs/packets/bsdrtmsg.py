@@ -36,7 +36,6 @@
 #
 
 import struct
-import time
 
 import pcs
 import payload
@@ -224,9 +223,8 @@ class if_link_msg(pcs.Packet):
         self.description = "BSD Routing socket -- link-state message (if_msghdr)"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -265,9 +263,8 @@ class if_addr_msg(pcs.Packet):
         self.description = "BSD Routing socket -- protocol address message (ifa_msghdr) "
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -291,9 +288,8 @@ class if_maddr_msg(pcs.Packet):
         self.description = "BSD Routing socket -- multicast group message (ifma_msghdr) "
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -317,9 +313,8 @@ class if_state_msg(pcs.Packet):
         self.description = "BSD Routing socket -- interface-state message (if_announcemsghdr)"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -341,9 +336,8 @@ class ieee80211_join_event(pcs.Packet):
         pcs.Packet.__init__(self, [address], bytes = bytes, **kv)
         self.description = "BSD Routing socket -- IEEE 802.11 join event"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
         if bytes is not None:
             offset = self.sizeof()
             self.data = payload.payload(bytes[offset:len(bytes)])
@@ -360,9 +354,8 @@ class ieee80211_leave_event(pcs.Packet):
         pcs.Packet.__init__(self, [address], bytes = bytes, **kv)
         self.description = "BSD Routing socket -- IEEE 802.11 leave event"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
         if bytes is not None:
             offset = self.sizeof()
             self.data = payload.payload(bytes[offset:len(bytes)])
@@ -385,9 +378,8 @@ class ieee80211_replay_event(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "BSD Routing socket -- IEEE 802.11 replay event"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
         if bytes is not None:
             offset = self.sizeof()
             self.data = payload.payload(bytes[offset:len(bytes)])
@@ -408,9 +400,8 @@ class ieee80211_michael_event(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "BSD Routing socket -- IEEE 802.11 MICHAEL failure event"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
         if bytes is not None:
             offset = self.sizeof()
             self.data = payload.payload(bytes[offset:len(bytes)])
@@ -457,9 +448,8 @@ class if_ieee80211_msg(pcs.Packet):
         self.description = "BSD Routing socket -- IEEE 802.11 state messages (if_announcemsghdr)"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -505,9 +495,8 @@ class rt_msg(pcs.Packet):
         self.description = " Define the common rtmsg header; see <net/route.h>. "
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -592,9 +581,8 @@ class rtmsghdr(pcs.Packet):
         self.description = " Define the common rtmsg header; see <net/route.h>. "
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             # XXX Workaround Packet.next() -- it only returns something
@@ -29,7 +29,7 @@
 # $Id: crc32c.py 23 2006-11-08 15:45:33Z dugsong $
 #
 
-import array
+import struct
 
 # CRC-32C Checksum
 # http://tools.ietf.org/html/rfc3309
@@ -89,10 +89,32 @@ crc32c_table = (
     0xAD7D5351L
     )
 
+# Slicing-by-8: table k gives the CRC of a byte followed by k zero
+# bytes, so that eight bytes can be folded into the CRC with eight
+# lookups and one trip around the loop rather than eight.
+crc32c_tables = [tuple([int(crc) for crc in crc32c_table])]
+for k in range(1, 8):
+    prev = crc32c_tables[k - 1]
+    crc32c_tables.append(tuple([(prev[i] >> 8) ^ crc32c_tables[0][prev[i] & 0xff]
+                                for i in range(256)]))
+(t0, t1, t2, t3, t4, t5, t6, t7) = crc32c_tables
+
 def add(crc, buf):
-    buf = array.array('B', buf)
-    for b in buf:
-        crc = (crc >> 8) ^ crc32c_table[(crc ^ b) & 0xff]
+    """Add the bytes in buf, which may be a string, buffer or
+    memoryview, to a running CRC-32c."""
+    crc = int(crc)
+    n = len(buf) >> 3
+    if n > 0:
+        words = struct.unpack_from("<%dL" % (n << 1), buf)
+        for i in xrange(0, n << 1, 2):
+            crc ^= words[i]
+            w = words[i + 1]
+            crc = (t7[crc & 0xff] ^ t6[(crc >> 8) & 0xff] ^
+                   t5[(crc >> 16) & 0xff] ^ t4[crc >> 24] ^
+                   t3[w & 0xff] ^ t2[(w >> 8) & 0xff] ^
+                   t1[(w >> 16) & 0xff] ^ t0[w >> 24])
+    for b in bytearray(buf[n << 3:]):
+        crc = (crc >> 8) ^ t0[(crc ^ b) & 0xff]
     return crc
 
 def done(crc):
@@ -107,3 +129,7 @@ def done(crc):
 def cksum(buf):
     """Return computed CRC-32c checksum."""
     return done(add(0xffffffffL, buf))
+
+def cksum_many(buffers):
+    """Return a list of the CRC-32c checksums of each of the buffers."""
+    return [done(add(0xffffffffL, buf)) for buf in buffers]
@@ -41,7 +41,6 @@ sys.path.append("../src")
 
 import pcs
 import struct
-import time
 
 from socket import inet_ntop
 #from pcs.packets.ethernet import ether_btoa
@@ -102,9 +101,8 @@ class dhcpv4(pcs.Packet):
 	self.description = "Initialize a DHCPv4 packet. "
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 	# Always point beyond the static payload so that we take the
 	# correct slice as a vanilla payload iff no options are parsed.
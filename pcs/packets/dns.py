@@ -36,8 +36,6 @@
 
 import pcs
 
-import time
-
 class dnsheader(pcs.Packet):
     """DNS Header"""
     _layout = pcs.Layout()
@@ -78,9 +76,8 @@ class dnsheader(pcs.Packet):
 
         self.description = "Define the fields of a DNS (RFC 1035) header"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         # Unconditionally the last packet in a chain
         # XXX This is obviously incorrect. We need to decode payload
@@ -96,7 +93,7 @@ class dnsheader(pcs.Packet):
         if self.is_tcp is True:
             self.length = len(self.getbytes()) - 2
             if self._head is not None:
-                self.length += len(self._head.collate_following(self))
+                self.length += self._head.length_following(self)
 
 class dnslabel(pcs.Packet):
     """DNS Label""" 
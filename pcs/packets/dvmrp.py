@@ -38,7 +38,6 @@
 
 import pcs
 import struct
-import time
 
 from pcs.packets import payload
 from pcs.packets.igmpv2 import *
@@ -92,9 +91,8 @@ class dvmrp(pcs.Packet):
         self.description = "initialize a header very similar to that of IGMPv1/v2"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 	# XXX optional bytes not processed yet.
 
@@ -40,8 +40,6 @@ import pcs.packets.ipv4
 from pcs.packets.ipv6 import ipv6
 from pcs.packets.arp import arp
 
-import time
-
 def ETHER_IS_MULTICAST(e):
     return (e[0] & 0x01) == 0x01
 
@@ -54,26 +52,22 @@ def ETHER_MAP_IPV6_MULTICAST(i):
 
 class ethernet(pcs.Packet):
     """Ethernet"""
-    _layout = pcs.Layout()
+    _layout = pcs.Layout([pcs.StringField("dst", 48),
+                          pcs.StringField("src", 48),
+                          pcs.Field("type", 16, discriminator=True)])
     _map = ethernet_map.map
     
     def __init__(self, bytes = None, timestamp = None, **kv):
         """initialize an ethernet packet"""
-        src = pcs.StringField("src", 48)
-        dst = pcs.StringField("dst", 48)
-        type = pcs.Field("type", 16, discriminator=True)
-
-        pcs.Packet.__init__(self, [dst, src, type], bytes = bytes, **kv)
+        pcs.Packet.__init__(self, None, bytes = bytes, **kv)
         self.description = "Ethernet"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
-            self.data = self.next(bytes[self.sizeof():len(bytes)],
-                                  timestamp = timestamp)
+            self.decapsulate(bytes, self.sizeof(), timestamp = timestamp)
         else:
             self.data = None
 
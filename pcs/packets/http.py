@@ -36,8 +36,6 @@
 
 import pcs
 
-import time
-
 class http(pcs.Packet):
     """HTTP"""
     _layout = pcs.Layout()
@@ -54,9 +52,8 @@ class http(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "initialize a TCP packet"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 
         self.data = None
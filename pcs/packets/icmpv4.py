@@ -36,8 +36,6 @@
 
 import pcs
 
-import time
-
 #
 # ICMP types.
 #
@@ -113,9 +111,8 @@ class icmpv4echo(pcs.Packet):
         pcs.Packet.__init__(self, [id, seq], bytes, **kv)
         self.description = "ICMPv4 Echo"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -140,32 +137,27 @@ descr = {
 class icmpv4(pcs.Packet):
     """ICMPv4"""
 
-    _layout = pcs.Layout()
+    _layout = pcs.Layout([pcs.Field("type", 8, discriminator=True),
+                          pcs.Field("code", 8),
+                          pcs.Field("checksum", 16)])
     _map = icmp_map
     _descr = descr
 
     def __init__(self, bytes = None, timestamp = None, **kv):
         """initialize a ICMPv4 packet"""
-        type = pcs.Field("type", 8, discriminator=True)
-        code = pcs.Field("code", 8)
-        cksum = pcs.Field("checksum", 16)
-        pcs.Packet.__init__(self, [type, code, cksum], bytes, **kv)
+        pcs.Packet.__init__(self, None, bytes, **kv)
         self.description = "ICMPv4"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
             # XXX Workaround Packet.next() -- it only returns something
             # if it can discriminate.
-            self.data = self.next(bytes[offset:len(bytes)],
-                                  timestamp = timestamp)
-            if self.data is None:
-                from pcs.packets.payload import payload
-                self.data = payload(bytes[offset:len(bytes)])
+            self.decapsulate(bytes, offset, timestamp = timestamp,
+                             fallback = True)
         else:
             self.data = None
 
@@ -189,5 +181,5 @@ class icmpv4(pcs.Packet):
         """Walk the entire packet and pretty print the values of the fields."""
         retval = self._descr[self.type] + "\n"
         for field in self._layout:
-            retval += "%s %s\n" % (field.name, field.value)
+            retval += "%s %s\n" % (field.name, getattr(self, field.name))
         return retval
@@ -36,7 +36,6 @@
 #
 
 import struct
-import time
 
 import pcs
 import pcs.packets.llc
@@ -215,9 +214,8 @@ class frame(pcs.Packet):
         self.description = "IEEE 802.11 frame header"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -298,9 +296,8 @@ class plcp(pcs.Packet):
         self.description = "IEEE 802.11 PLCP"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             self.data = frame(bytes[self.sizeof():len(bytes)],
@@ -36,7 +36,6 @@
 #
 
 import struct
-import time
 
 import pcs
 import pcs.packets.payload
@@ -80,9 +79,8 @@ class garp(pcs.Packet):
         self.description = "IEEE 802.1d GARP PDU"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
         if bytes is not None:
             offset = self.sizeof()
             curr = offset
@@ -121,9 +119,8 @@ class stp(pcs.Packet):
         self.description = "IEEE 802.1d STP PDU"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -165,9 +162,8 @@ class bpdu(pcs.Packet):
         self.description = "IEEE 802.1d bridge PDU header"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
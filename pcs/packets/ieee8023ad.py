@@ -36,7 +36,6 @@
 #
 
 import struct
-import time
 
 import pcs
 import pcs.packets.payload
@@ -118,9 +117,8 @@ class lacp(pcs.Packet):
         self.description = "IEEE 802.3ad Slow Protocols -- LACP"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = 0
@@ -157,9 +155,8 @@ class marker(pcs.Packet):
         self.description = "IEEE 802.3ad Slow Protocols -- Marker"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             self.data = payload(bytes[self.sizeof():len(bytes)],
@@ -188,9 +185,8 @@ class slowhdr(pcs.Packet):
         self.description = "IEEE 802.3ad Slow Protocols -- common header"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             self.data = frame(bytes[self.sizeof():len(bytes)],
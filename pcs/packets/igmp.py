@@ -2,7 +2,6 @@ import pcs
 from socket import AF_INET, inet_ntop
 
 import struct
-import time
 
 import pcs.packets.ipv4
 import pcs.packets.igmpv2 as igmpv2
@@ -57,9 +56,8 @@ class igmp(pcs.Packet):
         self.description = "IGMP"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -37,7 +37,6 @@
 
 import pcs
 import struct
-import time
 
 from pcs.packets import payload
 from socket import AF_INET, inet_ntop, inet_ntoa
@@ -59,9 +58,8 @@ class igmpv2(pcs.Packet):
         self.description = "initialize an IGMPv1/v2 header"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -37,7 +37,6 @@
 
 import pcs
 import struct
-import time
 
 from pcs.packets import payload
 from pcs.packets.igmpv2 import *
@@ -92,9 +91,8 @@ class query(pcs.Packet):
 	self.description = "initialize an IGMPv3 query"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         # Decode source list if provided.
 	if bytes is not None:
@@ -205,7 +203,7 @@ class GroupRecordField(pcs.CompoundField):
     def __setattr__(self, name, value):
         object.__setattr__(self, name, value)
         if self.packet is not None:
-            self.packet.__needencode = True
+            self.packet._needencode = True
 
     # OptionList decode is funny. If you don't have the packet
     # contents reflected in the PCS representation already, then it will
@@ -343,9 +341,8 @@ class report(pcs.Packet):
         self.description = "initialize an IGMPv3 report header"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         # Decode additional bytes into group records, if provided.
         # Group records are variable length structures.
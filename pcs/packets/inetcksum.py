@@ -0,0 +1,125 @@
+#
+# Copyright (c) 2008, Neville-Neil Consulting
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# Neither the name of Neville-Neil Consulting nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# File: $Id: $
+#
+# Author: George V. Neville-Neil
+#
+# Description: The Internet checksum (RFC 1071) used by IPv4, ICMP,
+# IGMP, TCP and UDP, with incremental updates as in RFC 1624.
+
+import array
+import sys
+
+# The one's complement sum does not depend on byte order (RFC 1071
+# section 2(B)), so the words are summed as the host sees them and
+# only the folded result is swapped into network order.
+swap = (sys.byteorder == 'little')
+
+def fold(total):
+    """Fold a sum of 16 bit words into 16 bits, in network order."""
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    total &= 0xffff
+    if swap:
+        total = ((total & 0xff) << 8) | (total >> 8)
+    return total
+
+def cksum(bytes):
+    """Return the Internet checksum of a string or buffer of bytes.
+       The bytes are summed in one pass over an array of words."""
+    words = array.array('H')
+    if len(bytes) & 1:
+        words.fromstring(bytes[:] + "\0")
+    else:
+        words.fromstring(bytes)
+    return ~fold(sum(words)) & 0xffff
+
+def partial(bytes):
+    """Return the one's complement sum of a string or buffer of bytes,
+       in network order, folded to 16 bits but not complemented.
+       Partial sums of consecutive runs of bytes may be put together
+       with combine() and turned into a checksum with finish()."""
+    words = array.array('H')
+    if len(bytes) & 1:
+        words.fromstring(bytes[:] + "\0")
+    else:
+        words.fromstring(bytes)
+    return fold(sum(words))
+
+def combine(first, second, length):
+    """Return the partial sum of two runs of bytes, one after the
+       other, given the partial sum of each and the length of the
+       first.  A run which starts on an odd byte has its sum swapped
+       (RFC 1071 section 2(B))."""
+    if length & 1:
+        second = ((second & 0xff) << 8) | (second >> 8)
+    total = first + second
+    return (total & 0xffff) + (total >> 16)
+
+def finish(total):
+    """Return the Internet checksum for a partial sum."""
+    return ~total & 0xffff
+
+def cksum_many(buffers):
+    """Return a list of the Internet checksums of each of the strings
+       or buffers given.  The bytes are put into a single array of
+       words and each checksum is summed over its part of that array,
+       which is quicker than checksumming many small buffers apart."""
+    bytes = []
+    for b in buffers:
+        if len(b) & 1:
+            bytes.append(b[:] + "\0")
+        else:
+            bytes.append(b[:])
+    words = array.array('H')
+    words.fromstring("".join(bytes))
+    result = []
+    start = 0
+    for b in bytes:
+        end = start + (len(b) >> 1)
+        result.append(~fold(sum(words[start:end])) & 0xffff)
+        start = end
+    return result
+
+def update(cksum, old, new, width = 16):
+    """Return the checksum cksum updated for a field which changed from
+       old to new, without summing the rest of the packet again (RFC
+       1624, eqn. 3).  A field wider than 16 bits, such as an address,
+       is given with its width and is taken 16 bits at a time.  A field
+       narrower than 16 bits must be given as the 16 bit word which
+       holds it, for example ttl << 8 | protocol for the IPv4 TTL."""
+    total = ~cksum & 0xffff
+    for shift in range(0, width, 16):
+        total += (~(old >> shift) & 0xffff) + ((new >> shift) & 0xffff)
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
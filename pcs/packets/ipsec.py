@@ -37,8 +37,6 @@
 
 import pcs
 
-import time
-
 class ah(pcs.Packet):
     """AH"""
 
@@ -57,9 +55,8 @@ class ah(pcs.Packet):
                             bytes, **kv)
         self.description = "initialize an AH packet header"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         
 class esp(pcs.Packet):
@@ -82,8 +79,7 @@ class esp(pcs.Packet):
                             bytes, **kv)
         self.description = "initialize an ESP packet header"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 
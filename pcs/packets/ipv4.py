@@ -38,9 +38,9 @@ import pcs
 from pcs import UnpackError
 from socket import AF_INET, inet_ntop
 import ipv4_map
+import inetcksum
 
 import struct
-import time
 
 #
 # IPv4 address constants.
@@ -107,37 +107,33 @@ class ipv4opt(pcs.TypeLengthValueField):
 class ipv4(pcs.Packet):
     """IPv4"""
 
-    _layout = pcs.Layout()
+    _layout = pcs.Layout([pcs.Field("version", 4, default=4),
+                          pcs.Field("hlen", 4, default=5),
+                          pcs.Field("tos", 8),
+                          pcs.Field("length", 16, default=20),
+                          pcs.Field("id", 16),
+                          pcs.Field("flags", 3),
+                          pcs.Field("offset", 13, default=0),
+                          pcs.Field("ttl", 8, default=64),
+                          pcs.Field("protocol", 8, discriminator=True),
+                          pcs.Field("checksum", 16),
+                          pcs.Field("src", 32),
+                          pcs.Field("dst", 32),
+                          pcs.OptionListField("options")])
     _map = ipv4_map.map
 
     def __init__(self, bytes = None, timestamp = None, **kv):
         """ define the fields of an IPv4 packet, from RFC 791."""
-        version = pcs.Field("version", 4, default=4)
-        hlen = pcs.Field("hlen", 4, default=5)
-        tos = pcs.Field("tos", 8)
-        length = pcs.Field("length", 16, default=20)
-        id = pcs.Field("id", 16)
-        flags = pcs.Field("flags", 3)
-        offset = pcs.Field("offset", 13, default=0)
-        ttl = pcs.Field("ttl", 8, default=64)
-        protocol = pcs.Field("protocol", 8, discriminator=True)
-        checksum = pcs.Field("checksum", 16)
-        src = pcs.Field("src", 32)
-        dst = pcs.Field("dst", 32)
-        options = pcs.OptionListField("options")
-        pcs.Packet.__init__(self,
-                            [version, hlen, tos, length, id, flags, offset,
-                             ttl, protocol, checksum, src, dst, options],
-                            bytes = bytes, **kv)
+        pcs.Packet.__init__(self, None, bytes, **kv)
         # Description MUST be set after the PCS layer init
         self.description = "IPv4"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
+            options = self.options
             hlen_bytes = self.hlen * 4
             options_len = hlen_bytes - self.sizeof()
 
@@ -149,7 +145,7 @@ class ipv4(pcs.Packet):
             if options_len > 0:
                 curr = self.sizeof()
                 while curr < hlen_bytes:
-                    option = struct.unpack('!B', bytes[curr])[0]
+                    option = ord(bytes[curr])
 
                     if option == IPOPT_EOL:
                         options.append(pcs.Field("end", 8, default = IPOPT_EOL))
@@ -160,7 +156,7 @@ class ipv4(pcs.Packet):
                         curr += 1
                         continue
 
-                    optlen = struct.unpack('!B', bytes[curr+1])[0]
+                    optlen = ord(bytes[curr+1])
                     if option == IPOPT_RA:
                         # The IPv4 Router Alert option (RFC 2113) is a
                         # single 16 bit value. Its existence indicates
@@ -170,7 +166,7 @@ class ipv4(pcs.Packet):
                             raise UnpackError, \
                                   "Bad length %d for IP option %d, " \
                                   "should be %d" % (optlen, option, 4)
-                        value = struct.unpack("!H", bytes[curr+2:curr+4])[0]
+                        value = struct.unpack_from("!H", bytes, curr+2)[0]
                         options.append(pcs.TypeLengthValueField("ra",
                                        pcs.Field("t", 8, default = option),
                                        pcs.Field("l", 8, default = optlen),
@@ -188,11 +184,8 @@ class ipv4(pcs.Packet):
 
         if (bytes is not None):
             offset = self.hlen << 2
-            self.data = self.next(bytes[offset:len(bytes)],
-                                  timestamp = timestamp)
-            if self.data is None:
-                from pcs.packets.payload import payload
-                self.data = payload(bytes[offset:len(bytes)])
+            self.decapsulate(bytes, offset, timestamp = timestamp,
+                             fallback = True)
             #if __debug__:
             #    print "decoded IPv4 payload proto", self.protocol, "as", type(self.data)
         else:
@@ -202,13 +195,12 @@ class ipv4(pcs.Packet):
         """Walk the entire packet and pretty print the values of the fields."""
         retval = "IPv4\n"
         for fn in self._layout:
-            f = self._fieldnames[fn.name]
             if (fn.name == "src" or fn.name == "dst"):
                 value = inet_ntop(AF_INET,
-                                  struct.pack('!L', f.value))
+                                  struct.pack('!L', getattr(self, fn.name)))
                 retval += "%s %s\n" % (fn.name, value)
             else:
-                retval += "%s %s\n" % (fn.name, f.value)
+                retval += "%s %s\n" % (fn.name, getattr(self, fn.name))
         return retval
 
     def pretty(self, attr):
@@ -228,21 +220,12 @@ class ipv4(pcs.Packet):
         self.hlen = (len(tmpbytes) >> 2)
         self.length = len(tmpbytes)
         if self._head is not None:
-            self.length += len(self._head.collate_following(self))
+            self.length += self._head.length_following(self)
 
     def ipv4_cksum(bytes):
         """Static method to: Calculate and return the IPv4 header checksum
            over the string of bytes provided."""
-
-        tmpbytes = bytes
-        total = 0
-        if len(tmpbytes) % 2 == 1:
-            tmpbytes += "\0"
-        for i in range(len(tmpbytes)/2):
-            total += (struct.unpack("!H", tmpbytes[2*i:2*i+2])[0])
-        total = (total >> 16) + (total & 0xffff)
-        total += total >> 16
-        return ~total & 0xffff
+        return inetcksum.cksum(bytes)
 
     ipv4_cksum = staticmethod(ipv4_cksum)
 
@@ -270,8 +253,7 @@ class pseudoipv4(pcs.Packet):
         # Description MUST be set after the PCS layer init"For a pseudo header we only need the source and destination ddresses."
         self.description = "IPv4 Pseudo Header"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         self.data = None
@@ -173,10 +173,9 @@ class ipv4sar(object):
         if mtu >= len(ip.getbytes()) + remaining:
             return [chain]
 
-        # Take a deep copy of the IP header, and construct the
+        # Take a copy of the IP header, and construct the
         # fragmentation headers.
-        from copy import deepcopy
-        fip = deepcopy(ip)		# first IP fragment header
+        fip = ip.clone()		# first IP fragment header
         fip.ip_flags = IP_MF
         assert (len(fip.getbytes()) % 4) == 0, \
                "First IPv4 fragment header not on 4-byte boundary."
@@ -208,7 +207,7 @@ class ipv4sar(object):
         rmtu -= rmtu % 8
         while remaining >= rmtu:
             sip.ip_off = off >> 3
-            result.append(Chain([deepcopy(sip), \
+            result.append(Chain([sip.clone(), \
                                  ipv4frag(bytes=tmpbytes[off:rmtu])]))
             off += rmtu
             remaining -= rmtu
@@ -221,7 +220,7 @@ class ipv4sar(object):
             sip.ip_off = off >> 3
             if not (ip.ip_flags & IP_MF):
                 sip.ip_flags = 0
-            result.append(Chain([deepcopy(sip), \
+            result.append(Chain([sip.clone(), \
                                  ipv4frag(bytes=tmpbytes[off:remaining])]))
             off += remaining
             remaining -= remaining
@@ -41,7 +41,6 @@ import ipv6_map
 
 import os
 from socket import AF_INET6, inet_ntop
-import time
 
 # extension header next header field.
 IPV6_HOPOPTS = 0
@@ -55,34 +54,29 @@ IPV6_DSTOPTS = 60
 class ipv6(pcs.Packet):
     """IPv6"""
 
-    _layout = pcs.Layout()
+    _layout = pcs.Layout([pcs.Field("version", 4, default = 6),
+                          pcs.Field("traffic_class", 8),
+                          pcs.Field("flow", 20),
+                          pcs.Field("length", 16),
+                          pcs.Field("next_header", 8, discriminator=True),
+                          pcs.Field("hop", 8),
+                          pcs.StringField("src", 16 * 8),
+                          pcs.StringField("dst", 16 * 8)])
     _map = ipv6_map.map
     
     def __init__(self, bytes = None, timestamp = None, **kv):
         """IPv6 Packet from RFC 2460"""
-        version = pcs.Field("version", 4, default = 6)
-        traffic = pcs.Field("traffic_class", 8)
-        flow = pcs.Field("flow", 20)
-        length = pcs.Field("length", 16)
-        next_header = pcs.Field("next_header", 8, discriminator=True)
-        hop = pcs.Field("hop", 8)
-        src = pcs.StringField("src", 16 * 8)
-        dst = pcs.StringField("dst", 16 * 8)
-        pcs.Packet.__init__(self,
-                            [version, traffic, flow, length, next_header, hop,
-                             src, dst], bytes, **kv)
+        pcs.Packet.__init__(self, None, bytes, **kv)
         self.description = "IPv6"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 
         if (bytes is not None):
             ## 40 bytes is the standard size of an IPv6 header
             offset = 40
-            self.data = self.next(bytes[offset:len(bytes)],
-                                  timestamp = timestamp)
+            self.decapsulate(bytes, offset, timestamp = timestamp)
         else:
             self.data = None
         
@@ -91,10 +85,10 @@ class ipv6(pcs.Packet):
         retval = ""
         for field in self._layout:
             if (field.name == "src" or field.name == "dst"):
-                value = inet_ntop(AF_INET6, field.value)
+                value = inet_ntop(AF_INET6, getattr(self, field.name))
                 retval += "%s %s\n" % (field.name, value)
             else:
-                retval += "%s %d\n" % (field.name, field.value)
+                retval += "%s %d\n" % (field.name, getattr(self, field.name))
         return retval
 
     def getipv6(self, iface):
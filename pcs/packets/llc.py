@@ -36,7 +36,6 @@
 #
 
 import struct
-import time
 
 import pcs
 from pcs.packets import payload
@@ -94,9 +93,8 @@ class llc(pcs.Packet):
         self.description = "IEEE 802.2 LLC"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
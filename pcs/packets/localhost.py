@@ -41,8 +41,6 @@ from pcs.packets import ipv6
 
 import localhost_map
 
-import time
-
 class localhost(pcs.Packet):
     """Localhost"""
     _layout = pcs.Layout()
@@ -56,13 +54,11 @@ class localhost(pcs.Packet):
         pcs.Packet.__init__(self, [type], bytes = bytes, **kv)
         self.description = "Localhost"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
-            self.data = self.next(bytes[lolen:len(bytes)],
-                                  timestamp = timestamp)
+            self.decapsulate(bytes, lolen, timestamp = timestamp)
         else:
             self.data = None
 
@@ -36,7 +36,6 @@
 #
 
 import struct
-import time
 
 import pcs
 import pcs.packets.payload
@@ -101,9 +100,8 @@ class ldpmsg(pcs.Packet):
         self.description = "RFC 3036 LDP message header "
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -129,9 +127,8 @@ class ldphdr(pcs.Packet):
         self.description = "RFC 3036 LDP packet header "
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -157,9 +154,8 @@ class lse(pcs.Packet):
         self.description = "RFC 3032 MPLS label stack entry"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
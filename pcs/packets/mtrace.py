@@ -48,7 +48,6 @@
 
 import pcs
 import struct
-import time
 
 from pcs.packets import payload
 from socket import AF_INET, inet_ntop, inet_ntoa
@@ -76,9 +75,8 @@ class query(pcs.Packet):
         self.description = "initialize the MTRACE query header."
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
             offset = self.sizeof()
@@ -111,9 +109,8 @@ class reply(pcs.Packet):
         self.description = "initialize the MTRACE response header."
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
             offset = self.sizeof()
@@ -38,8 +38,6 @@ import pcs
 
 import icmpv6 # All neighbor discovery messages are inserted in ICMPv6 packets
 
-import time
-
 class nd6_solicit(pcs.Packet):
     """Neighbor Discovery"""
 
@@ -52,7 +50,6 @@ class nd6_solicit(pcs.Packet):
         pcs.Packet.__init__(self, [reserved, target], bytes, **kv)
         self.description = "initialize a Neighbor Solicitaion header"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
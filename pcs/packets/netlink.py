@@ -36,7 +36,6 @@
 #
 
 import struct
-import time
 
 import pcs
 import payload
@@ -97,9 +96,8 @@ class nlmsg_error(pcs.Packet):
         self.description = "If type is NLMSG_ERROR, original message generating error is returned as payload with error code prepended, just like ICMP."
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         # XXX To avoid introducing a circular dependency in this module,
         # the caller is responsible for trying to decode the payload
@@ -153,9 +151,8 @@ class nlmsghdr(pcs.Packet):
         self.description = " Define the common Netlink message header."
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
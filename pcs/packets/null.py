@@ -36,8 +36,6 @@
 
 import pcs
 
-import time
-
 class null(pcs.Packet):
     """NULL."""
     _layout = pcs.Layout()
@@ -49,9 +47,8 @@ class null(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "NULL"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 
         if (bytes is not None):
@@ -38,7 +38,6 @@
 import pcs
 
 from pprint import pformat
-import time
 
 class payload(pcs.Packet):
     """Payload"""
@@ -56,9 +55,8 @@ class payload(pcs.Packet):
         pcs.Packet.__init__(self, [payload], bytes = bytes, **kv)
         self.description = "Payload"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         # Unconditionally the last packet in a chain
         self.data = None
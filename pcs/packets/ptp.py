@@ -34,7 +34,6 @@
 # aka PTPv2.
 
 import pcs
-import time
 
 PTP_SUBDOMAIN_NAME_LENGTH = 16
 PTP_CODE_STRING_LENGTH = 4
@@ -70,9 +69,8 @@ class Announce(pcs.Packet):
         self.description = "PTP Announce"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
             self.data = self.next(bytes[self.sizeof():len(bytes)],
@@ -95,9 +93,8 @@ class Sync(pcs.Packet):
         self.description = "PTP Sync"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
             self.data = self.next(bytes[self.sizeof():len(bytes)],
@@ -125,9 +122,8 @@ class DelayRequest(pcs.Packet):
         self.description = "PTP DelayRequest"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
             self.data = self.next(bytes[self.sizeof():len(bytes)],
@@ -157,9 +153,8 @@ class Followup(pcs.Packet):
         self.description = "Followup"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
             self.data = self.next(bytes[self.sizeof():len(bytes)],
@@ -189,9 +184,8 @@ class DelayResponse(pcs.Packet):
         self.description = "Delay Response "
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
             self.data = self.next(bytes[self.sizeof():len(bytes)],
@@ -34,7 +34,6 @@
 
 import pcs
 import ptp_map
-import time
 
 PTP_SUBDOMAIN_NAME_LENGTH = 16
 PTP_CODE_STRING_LENGTH = 4
@@ -74,9 +73,8 @@ class Common(pcs.Packet):
         self.description = "PTP Common Header"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
             self.data = self.next(bytes[self.sizeof():len(bytes)],
@@ -34,7 +34,6 @@
 # aka PTPv1, which is to be deprecated.
 
 import pcs
-import time
 
 PTP_SUBDOMAIN_NAME_LENGTH = 16
 PTP_CODE_STRING_LENGTH = 4
@@ -129,9 +128,8 @@ class SyncV1(pcs.Packet):
         self.description = "PTP Sync"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
             self.data = self.next(bytes[self.sizeof():len(bytes)],
@@ -234,9 +232,8 @@ class DelayRequestV1(pcs.Packet):
         self.description = "PTP DelayRequest"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
             self.data = self.next(bytes[self.sizeof():len(bytes)],
@@ -271,9 +268,8 @@ class FollowupV1(pcs.Packet):
         self.description = "Followup Header "
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
             self.data = self.next(bytes[self.sizeof():len(bytes)],
@@ -316,9 +312,8 @@ class DelayResponseV1(pcs.Packet):
         self.description = "Followup Header "
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
             self.data = self.next(bytes[self.sizeof():len(bytes)],
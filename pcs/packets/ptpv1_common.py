@@ -35,7 +35,6 @@
 
 import pcs
 import ptp_map
-import time
 
 PTP_SUBDOMAIN_NAME_LENGTH = 16
 PTP_CODE_STRING_LENGTH = 4
@@ -71,9 +70,8 @@ class CommonV1(pcs.Packet):
         self.description = "initialize the common header "
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
             self.data = self.next(bytes[self.sizeof():len(bytes)],
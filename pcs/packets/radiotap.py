@@ -39,7 +39,6 @@ import pcs.packets.payload
 #import pcs.packets.ieee80211	#notyet
 
 import struct
-import time
 
 # TODO: Move this into pcap.pyx.
 DLT_IEEE802_11_RADIO = 127	# 802.11 with radiotap in front
@@ -206,9 +205,8 @@ class radiotap(pcs.Packet):
         self.description = "initialize an ethernet packet"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
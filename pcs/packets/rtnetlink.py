@@ -37,7 +37,6 @@
 #
 
 import struct
-import time
 
 import pcs
 import payload
@@ -379,7 +378,7 @@ class NexthopField(pcs.CompoundField):
     def __setattr__(self, name, value):
         object.__setattr__(self, name, value)
         if self.packet is not None:
-            self.packet.__needencode = True
+            self.packet._needencode = True
 
     def decode(self, bytes, curr, byteBR):
         start = curr
@@ -476,9 +475,8 @@ class ifaddrmsg(pcs.Packet):
         self.description = "RFC 3549 interface address message."
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -520,9 +518,8 @@ class ifinfomsg(pcs.Packet):
         self.description = "RFC 3549 interface information message."
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -561,9 +558,8 @@ class prefixmsg(pcs.Packet):
         self.description = " Define the common RTNetlink message header."
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -604,9 +600,8 @@ class rtmsg(pcs.Packet):
         self.description = " Define the common RTNetlink message header."
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
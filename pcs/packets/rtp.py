@@ -36,7 +36,6 @@
 #
 
 import struct
-import time
 
 import pcs
 from pcs.packets import payload
@@ -71,9 +70,8 @@ class rtp(pcs.Packet):
         self.description = "RFC 3550 Real Time Protocol"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -128,9 +126,8 @@ class rtcp(pcs.Packet):
         self.description = "RFC 3550 Real Time Control Protocol header"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
@@ -159,9 +156,8 @@ class sender(pcs.Packet):
         self.description = "RFC 3550 Real Time Control Protocol sender message portion"
 
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if bytes is not None:
             offset = self.sizeof()
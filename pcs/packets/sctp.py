@@ -39,10 +39,9 @@
 
 import pcs
 import pcs.packets.crc32c
+import pcs.packets.payload
 import pcs.packets.sctp_map
 
-import time
-
 # TODO: Add calc_length() methods.
 
 class common(pcs.Packet):
@@ -61,26 +60,48 @@ class common(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "SCTP common header class"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None and len(bytes) > self.sizeof() ):
             self.data = self.next(bytes[self.sizeof():len(bytes)],
                                   discriminator = bytes[self.sizeof() + 1],
                                   timestamp = timestamp)
+            # Keep chunks we cannot decode, they are needed to verify
+            # the checksum.
+            if self.data is None:
+                self.data = pcs.packets.payload.payload(bytes[self.sizeof():len(bytes)])
         else:
             self.data = None
 
-    def calc_checksum():
+    def cksum(self, data = ""):
+        """Calculate the CRC32C of this SCTP message outside of a chain,
+           with the checksum field taken as zero (RFC 3309)."""
+        bytes = self.getbytes()
+        return pcs.packets.crc32c.cksum(bytes[0:8] + "\0\0\0\0" +
+                                        bytes[12:] + data)
+
+    def calc_checksum(self):
         """Calculate and store the checksum for this SCTP message.
            Unlike other IP transports, SCTP does *not* need to see
            preceding header fields when calculating the CRC32C."""
-        self.checksum = 0xffffffff
-        tmpbytes = self.bytes
+        self.checksum = self.cksum(self.__chunks())
+
+    def verify_checksum(self):
+        """Return True if the checksum of this SCTP message is right."""
+        return self.checksum == self.cksum(self.__chunks())
+
+    def __chunks(self):
+        """Return the bytes of the chunks which follow this header,
+           from its chain if it is in one."""
         if self._head is not None:
-            tmpbytes += self._head.collate_following(self)
-        self.checksum = crc32c.cksum(tmpbytes)
+            return self._head.collate_following(self)
+        tmpbytes = ""
+        packet = self.data
+        while packet is not None:
+            tmpbytes += packet.getbytes()
+            packet = packet.data
+        return tmpbytes
 
 class payload(pcs.Packet):
     """SCTP payload chunk class"""
@@ -106,9 +127,8 @@ class payload(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "SCTP payload chunk class"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 
         if (bytes is not None):
@@ -141,9 +161,8 @@ class init(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "SCTP init or init ack chunk"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 
         if (bytes is not None):
@@ -174,9 +193,8 @@ class sack(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "common header initialization"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 
         if (bytes is not None):
@@ -199,9 +217,8 @@ class heartbeat(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "SCTP heartbeat chunk"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 
         if (bytes is not None):
@@ -225,9 +242,8 @@ class abort(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "SCTP abort chunk"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 
         if (bytes is not None):
@@ -251,9 +267,8 @@ class shutdown(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "SCTP shutdown chunk"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 
         if (bytes is not None):
@@ -276,9 +291,8 @@ class shutdown_ack(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "SCTP Shutdown ACK Chunk"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 
         if (bytes is not None):
@@ -301,9 +315,8 @@ class operation_error(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "SCTP operation error chunk"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 
         if (bytes is not None):
@@ -326,9 +339,8 @@ class cookie_echo(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "SCTP Cookie Echo Chunk"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 
         if (bytes is not None):
@@ -351,9 +363,8 @@ class cookie_ack(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "SCP Cookie ACK"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
             self.data = self.next(bytes[0:len(bytes)],
@@ -376,9 +387,8 @@ class shutdown_complete(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "SCTP Shutdown Complete"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 
         if (bytes is not None):
@@ -39,8 +39,6 @@ import struct
 import pcs.packets.ipv4
 from pcs.packets.pseudoipv6 import *
 
-import time
-
 class tcpv6(pcs.Packet):
     """TCPv6"""
     _layout = pcs.Layout()
@@ -67,9 +65,8 @@ class tcpv6(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "initialize a TCP packet for IPv6"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
     def __str__(self):
         """Walk the entire packet and pretty print the values of the fields.  Addresses are printed if and only if they are set and not 0."""
@@ -38,31 +38,27 @@ import pcs
 import udp_map
 
 import socket
-import time
 
 
 class udp(pcs.Packet):
     """UDP"""
 
-    _layout = pcs.Layout()
+    _layout = pcs.Layout([pcs.Field("sport", 16),
+                          pcs.Field("dport", 16),
+                          pcs.Field("length", 16),
+                          pcs.Field("checksum", 16)])
     _map = None
 
     def __init__(self, bytes = None, timestamp = None, **kv):
         """initialize a UDP packet"""
-        sport = pcs.Field("sport", 16)
-        dport = pcs.Field("dport", 16)
-        length = pcs.Field("length", 16)
-        checksum = pcs.Field("checksum", 16)
-        pcs.Packet.__init__(self, [sport, dport, length, checksum],
-                            bytes, **kv)
+        pcs.Packet.__init__(self, None, bytes, **kv)
         self.description = "UDP"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
         if (bytes is not None):
-            self.data = self.next(bytes[8:len(bytes)], timestamp)
+            self.decapsulate(bytes, 8, timestamp = timestamp)
         else:
             self.data = None
 
@@ -72,9 +68,11 @@ class udp(pcs.Packet):
     def next(self, bytes, timestamp):
         """Decode higher level services."""
         if (self.dport in udp_map.map):
-            return udp_map.map[self.dport](bytes, timestamp = timestamp)
+            return udp_map.map[self.dport](bytes, timestamp = timestamp,
+                                           lazy = self._lazy)
         if (self.sport in udp_map.map):
-            return udp_map.map[self.sport](bytes, timestamp = timestamp)
+            return udp_map.map[self.sport](bytes, timestamp = timestamp,
+                                           lazy = self._lazy)
 
         return None
 
@@ -123,36 +121,28 @@ class udp(pcs.Packet):
         """Calculate and store the checksum for the UDP datagram
            when encapsulated as an IPv4 payload with the given header."""
         #print "udp.calc_checksum_v4()"
-        from pcs.packets.ipv4 import ipv4
         from pcs.packets.ipv4 import pseudoipv4
         self.checksum = 0
-        payload = self._head.collate_following(self)
         pip = pseudoipv4()
         pip.src = ip.src
         pip.dst = ip.dst
         pip.protocol = socket.IPPROTO_UDP
-        pip.length = len(self.getbytes()) + len(payload)
-        tmpbytes = pip.getbytes() + self.getbytes() + payload
-        self.checksum = ipv4.ipv4_cksum(tmpbytes)
+        self.checksum = self._head.payload_cksum(self, pip)
 
     def calc_checksum_v6(self, ip6):
         """Calculate and store the checksum for the UDP datagram
            when encapsulated as an IPv6 payload with the given header."""
         #print "udp.calc_checksum_v6()"
-        from pcs.packets.ipv4 import ipv4
         from pcs.packets.pseudoipv6 import pseudoipv6
         self.checksum = 0
-        payload = self._head.collate_following(self)
         pip6 = pseudoipv6()
         pip6.src = ip6.src
         pip6.dst = ip6.dst
         pip6.next_header = ip6.next_header
-        pip6.length = len(self.getbytes()) + len(payload)
-        tmpbytes = pip6.getbytes() + self.getbytes() + payload
-        self.checksum = ipv4.ipv4_cksum(tmpbytes)
+        self.checksum = self._head.payload_cksum(self, pip6)
 
     def calc_length(self):
         """Calculate and store the length field(s) for this packet."""
         self.length = len(self.getbytes())
         if self._head is not None:
-            self.length += len(self._head.collate_following(self))
+            self.length += self._head.length_following(self)
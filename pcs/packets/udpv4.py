@@ -42,7 +42,6 @@ import pcs.packets.udp
 
 class udpv4(pcs.packets.udp.udp):
 
-    _layout = pcs.Layout()
     _map = None
 
     def __init__(self, bytes = None, timestamp = None, **kv):
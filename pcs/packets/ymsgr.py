@@ -36,8 +36,6 @@
 
 import pcs
 
-import time
-
 # ymsg packet = { int magic = "YMSG", short version, short id, short
 # len (does not include header), short command, int status, int
 # sessionid, data[]} data is a set of key/value pairs keys must always
@@ -68,9 +66,8 @@ class ymsg_hdr(pcs.Packet):
                             bytes = bytes, **kv)
         self.description = "Define the fields for a Yahoo Messenger header"
         if timestamp is None:
-            self.timestamp = time.time()
-        else:
-            self.timestamp = timestamp
+            timestamp = pcs.now_ns()
+        self.timestamp = timestamp
 
 
 class ymsg_key_value(pcs.Packet):
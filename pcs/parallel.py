@@ -0,0 +1,152 @@
+#
+# Copyright (c) 2008, Neville-Neil Consulting
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# Neither the name of Neville-Neil Consulting nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# File: $Id: $
+#
+# Author: George V. Neville-Neil
+#
+# Description: Analyze a pcap savefile on several processors at once.
+#
+# The file is cut into shards, each a run of whole records, by walking
+# the record headers.  Each shard is decoded in its own process and
+# handed to a mapper function, and the results of the shards are
+# folded together with a reducer function, for example:
+#
+#     def count(packets):
+#         return len(list(packets))
+#
+#     total = pcs.parallel.run("big.pcap", count, operator.add)
+#
+# The mapper is sent to the other processes so it must be
+# defined at the top level of a module.
+
+import pcs
+from pcs import pcapfile
+from pcs.pcapfile import PcapFormatError, FILE_HEADER_LEN, RECORD_HEADER_LEN
+
+import os
+import struct
+
+def header(filename):
+    """Read the file header of a pcap savefile, see pcapfile.header()."""
+    file = open(filename, "rb")
+    bytes = file.read(FILE_HEADER_LEN)
+    file.close()
+    return pcapfile.header(bytes, filename)
+
+def shards(filename, n):
+    """Cut a pcap savefile into at most n shards of about the same size.
+       Return a list of (start, end) byte offsets, each the start of a
+       record or the end of the file.  Only the record headers are
+       read."""
+    (order, tick, snaplen, dlink) = header(filename)
+    size = os.path.getsize(filename)
+    step = max((size - FILE_HEADER_LEN) / max(n, 1), 1)
+    record = struct.Struct(order + "IIII")
+    file = open(filename, "rb")
+    result = []
+    start = FILE_HEADER_LEN
+    offset = FILE_HEADER_LEN
+    cut = start + step
+    while offset + RECORD_HEADER_LEN <= size:
+        if offset >= cut:
+            result.append((start, offset))
+            start = offset
+            cut = start + step
+        file.seek(offset)
+        (sec, frac, caplen, length) = record.unpack(file.read(RECORD_HEADER_LEN))
+        offset += RECORD_HEADER_LEN + caplen
+    file.close()
+    if offset > start:
+        result.append((start, min(offset, size)))
+    return result
+
+def packets(filename, start, end, lazy = False):
+    """Return an iterator over the packets of a pcap savefile which
+       start at byte offset start and before byte offset end."""
+    (order, tick, snaplen, dlink) = header(filename)
+    record = struct.Struct(order + "IIII")
+    file = open(filename, "rb")
+    file.seek(start)
+    offset = start
+    try:
+        while offset + RECORD_HEADER_LEN <= end:
+            (sec, frac, caplen, length) = record.unpack(file.read(RECORD_HEADER_LEN))
+            bytes = file.read(caplen)
+            if len(bytes) < caplen:
+                break
+            offset += RECORD_HEADER_LEN + caplen
+            yield pcs.unpack_frame(bytes, dlink,
+                                   sec * 1000000000 + frac * tick,
+                                   lazy = lazy)
+    finally:
+        file.close()
+
+def map_shard(args):
+    """Run the mapper over one shard.  Used by run() in the processes
+       of its pool."""
+    (filename, start, end, mapper, lazy) = args
+    return mapper(packets(filename, start, end, lazy))
+
+def run(filename, mapper, reducer, initial = None, processes = None,
+        shards_per_process = 4, lazy = False):
+    """Analyze a pcap savefile in parallel.
+
+    filename - the pcap savefile to analyze
+    mapper - a function which is given an iterator over the packets of
+             one shard and returns a result for it
+    reducer - a function of two results which returns their combination
+    initial - if not None, the result the others are reduced into
+    processes - the number of processes to run, by default the number
+                of processors
+    shards_per_process - the number of shards to cut per process, so
+                         that a slow shard does not hold up the others
+    lazy - boolean to decode the layers of each packet only when they
+           are first looked at
+
+    The results of the shards are reduced in the order of the file.
+    """
+    import multiprocessing
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    work = [(filename, start, end, mapper, lazy) for (start, end) in
+            shards(filename, processes * shards_per_process)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(map_shard, work, 1)
+    finally:
+        pool.close()
+        pool.join()
+    if initial is not None:
+        results.insert(0, initial)
+    if len(results) == 0:
+        return None
+    return reduce(reducer, results)
@@ -24,6 +24,7 @@ import time
 
 cdef extern from "Python.h":
     object PyBuffer_FromMemory(char *s, int len)
+    object PyString_FromStringAndSize(char *s, int len)
     int    PyGILState_Ensure()
     void   PyGILState_Release(int gil)
     void   Py_BEGIN_ALLOW_THREADS()
@@ -85,10 +86,26 @@ cdef extern from "pcap.h":
 
 cdef extern from "pcap_ex.h":
     int     pcap_ex_immediate(pcap_t *p)
+    pcap_t *pcap_ex_open_live(char *name, int snaplen, int promisc, int to_ms,
+                              int immediate, int bufsize, int tstamp_type,
+                              int precision, char *ebuf)
+    pcap_t *pcap_ex_open_offline(char *name, int precision, char *ebuf)
     char   *pcap_ex_name(char *name)
     void    pcap_ex_setup(pcap_t *p)
     int     pcap_ex_next(pcap_t *p, pcap_pkthdr **hdr, char **pkt)
+    int     pcap_ex_seek(pcap_t *p, long long offset)
+    long long pcap_ex_tell(pcap_t *p)
     char   *pcap_ex_lookupdev(char *errbuf)
+    struct pcap_ex_ring:
+        pass
+    pcap_ex_ring *pcap_ex_ring_start(pcap_t *p, int nslots, char *ebuf)
+    int     pcap_ex_ring_wait(pcap_ex_ring *ring, int timeout_ms) nogil
+    pcap_pkthdr *pcap_ex_ring_take(pcap_ex_ring *ring)
+    void    pcap_ex_ring_stats(pcap_ex_ring *ring,
+                               unsigned long long *received,
+                               unsigned long long *overflow)
+    char   *pcap_ex_ring_geterr(pcap_ex_ring *ring)
+    void    pcap_ex_ring_stop(pcap_ex_ring *ring) nogil
 
 # XXX Lacks size_t; known Pyrex limitation
 cdef extern from *:
@@ -96,10 +113,17 @@ cdef extern from *:
     char *strdup(char *src)
     int   printf(char *, ...)
 
+cdef object __timestamp(pcap_pkthdr *hdr, long long tick):
+    """Return the timestamp of a packet in integer nanoseconds since
+    the epoch; tick is the number of nanoseconds in a unit of tv_usec,
+    which holds nanoseconds when pcap was opened for them."""
+    return <long long>hdr.ts.tv_sec * 1000000000 + hdr.ts.tv_usec * tick
+
 cdef struct pcap_handler_ctx:
     void *callback
     void *args
     int   got_exc
+    long long tick
 
 cdef void __pcap_handler(void *arg, pcap_pkthdr *hdr, char *pkt):
     cdef pcap_handler_ctx *ctx
@@ -107,17 +131,35 @@ cdef void __pcap_handler(void *arg, pcap_pkthdr *hdr, char *pkt):
     ctx = <pcap_handler_ctx *>arg
     gil = PyGILState_Ensure()
     try:
-        (<object>ctx.callback)(hdr.ts.tv_sec + (hdr.ts.tv_usec/1000000.0),
+        (<object>ctx.callback)(__timestamp(hdr, ctx.tick),
                                PyBuffer_FromMemory(pkt, hdr.caplen),
                                *(<object>ctx.args))
     except:
         ctx.got_exc = 1
     PyGILState_Release(gil)
 
+cdef void __pcap_batch_handler(void *arg, pcap_pkthdr *hdr, char *pkt):
+    cdef pcap_handler_ctx *ctx
+    cdef int gil
+    ctx = <pcap_handler_ctx *>arg
+    gil = PyGILState_Ensure()
+    (<object>ctx.callback).append((__timestamp(hdr, ctx.tick),
+                                   PyString_FromStringAndSize(pkt, hdr.caplen)))
+    PyGILState_Release(gil)
+
 PCAP_D_INOUT = 0
 PCAP_D_IN = 1
 PCAP_D_OUT = 2
 
+PCAP_TSTAMP_PRECISION_MICRO = 0
+PCAP_TSTAMP_PRECISION_NANO = 1
+
+PCAP_TSTAMP_HOST = 0
+PCAP_TSTAMP_HOST_LOWPREC = 1
+PCAP_TSTAMP_HOST_HIPREC = 2
+PCAP_TSTAMP_ADAPTER = 3
+PCAP_TSTAMP_ADAPTER_UNSYNCED = 4
+
 DLT_NULL =	0
 DLT_EN10MB =	1
 DLT_EN3MB =	2
@@ -176,6 +218,12 @@ cdef class pcap:
     immediate -- disable buffering, if possible
     dumpfile  -- name of a dumpfile to open, if necessary
     dumptype  -- only open a dumpfile and specify its type
+    buffer_size -- size in bytes of the kernel capture buffer,
+                 or 0 for the default
+    tstamp_type -- PCAP_TSTAMP_* source of timestamps for a device,
+                 or None for the default
+    tstamp_precision -- PCAP_TSTAMP_PRECISION_MICRO or _NANO, the
+                 precision of the timestamps pcap returns
     """
     cdef pcap_t *__pcap
     cdef char *__name
@@ -183,13 +231,27 @@ cdef class pcap:
     cdef char __ebuf[256]
     cdef int __dloff
     cdef pcap_dumper_t *__dumper
+    cdef pcap_ex_ring *__ring
+    cdef int __precision
+    cdef long long __tick
 
     def __init__(self, name=None, snaplen=65535, promisc=True,
                  timeout_ms=500, immediate=False,
-                 dumpfile="", dumptype=None):
+                 dumpfile="", dumptype=None, buffer_size=0,
+                 tstamp_type=None, tstamp_precision=PCAP_TSTAMP_PRECISION_MICRO):
         global dltoff
         cdef char *p
 
+        if tstamp_precision == PCAP_TSTAMP_PRECISION_NANO:
+            self.__tick = 1
+        elif tstamp_precision == PCAP_TSTAMP_PRECISION_MICRO:
+            self.__tick = 1000
+        else:
+            raise ValueError, "unknown timestamp precision %s" % tstamp_precision
+        self.__precision = tstamp_precision
+        if tstamp_type is None:
+            tstamp_type = -1
+
         if dumptype != None:
             try:
                 self.__pcap = pcap_open_dead(dumptype, snaplen)
@@ -204,12 +266,15 @@ cdef class pcap:
             else:
                 p = name
                     
-            self.__pcap = pcap_open_offline(p, self.__ebuf)
+            self.__pcap = pcap_ex_open_offline(p, tstamp_precision,
+                                               self.__ebuf)
                     
             if not self.__pcap:
-                self.__pcap = pcap_open_live(pcap_ex_name(p), snaplen,
-                                             promisc, timeout_ms,
-                                             self.__ebuf)
+                self.__pcap = pcap_ex_open_live(pcap_ex_name(p), snaplen,
+                                                promisc, timeout_ms,
+                                                immediate, buffer_size,
+                                                tstamp_type, tstamp_precision,
+                                                self.__ebuf)
 
         if not self.__pcap:
             raise OSError, self.__ebuf
@@ -225,8 +290,6 @@ cdef class pcap:
             dlt = pcap_datalink(self.__pcap)
             self.__dloff = dltoff[dlt]
         except KeyError: pass
-        if immediate and pcap_ex_immediate(self.__pcap) < 0:
-            raise OSError, "couldn't set BPF immediate mode"
             
     property name:
         """Network interface or dumpfile name."""
@@ -238,6 +301,11 @@ cdef class pcap:
         def __get__(self):
             return pcap_snapshot(self.__pcap)
         
+    property tstamp_precision:
+        """Precision of the timestamps returned, PCAP_TSTAMP_PRECISION_*."""
+        def __get__(self):
+            return self.__precision
+
     property dloff:
         """Datalink offset (length of layer-2 frame header)."""
         def __get__(self):
@@ -314,6 +382,20 @@ cdef class pcap:
             return True
         return False
     
+    def seek(self, offset):
+        """Move a savefile to the record whose header starts at byte
+        offset offset."""
+        if pcap_ex_seek(self.__pcap, offset) < 0:
+            raise OSError, "couldn't seek in %s" % self.__name
+
+    def tell(self):
+        """Return the byte offset of the next record of a savefile."""
+        cdef long long offset
+        offset = pcap_ex_tell(self.__pcap)
+        if offset < 0:
+            raise OSError, "couldn't tell offset in %s" % self.__name
+        return offset
+
     def datalink(self):
         """Return datalink type (DLT_* values)."""
         return pcap_datalink(self.__pcap)
@@ -325,7 +407,7 @@ cdef class pcap:
         pkt = <char *>pcap_next(self.__pcap, &hdr)
         if not pkt:
             return None
-        return (hdr.ts.tv_sec + (hdr.ts.tv_usec / 1000000.0),
+        return (__timestamp(&hdr, self.__tick),
                 PyBuffer_FromMemory(pkt, hdr.caplen))
 
     def __add_pkts(self, ts, pkt, pkts):
@@ -356,6 +438,7 @@ cdef class pcap:
         ctx.callback = <void *>callback
         ctx.args = <void *>args
         ctx.got_exc = 0
+        ctx.tick = self.__tick
         n = pcap_dispatch(self.__pcap, cnt, __pcap_handler,
                           <unsigned char *>&ctx)
         if ctx.got_exc:
@@ -363,6 +446,29 @@ cdef class pcap:
             raise exc[0], exc[1], exc[2]
         return n
 
+    def readbatch(self, cnt):
+        """Return a list of up to cnt (timestamp, packet) tuples read
+        in one call to pcap_dispatch(), without calling back into Python
+        for each packet.  The list is empty at the end of a savefile.
+        Each packet is copied out of the capture buffer, which pcap
+        reuses, so the packets stay valid after the call.
+
+        Arguments:
+
+        cnt      -- number of packets to read;
+                    or -1 to read all packets received in one buffer
+        """
+        cdef pcap_handler_ctx ctx
+        cdef int n
+        pkts = []
+        ctx.callback = <void *>pkts
+        ctx.tick = self.__tick
+        n = pcap_dispatch(self.__pcap, cnt, __pcap_batch_handler,
+                          <unsigned char *>&ctx)
+        if n == -1:
+            raise OSError, pcap_geterr(self.__pcap)
+        return pkts
+
     def loop(self, callback, *args):
         """Loop forever, processing packets with a user callback.
         The loop can be exited with an exception, including KeyboardInterrupt.
@@ -381,13 +487,97 @@ cdef class pcap:
             n = pcap_ex_next(self.__pcap, &hdr, &pkt)
             Py_END_ALLOW_THREADS
             if n == 1:
-                callback(hdr.ts.tv_sec + (hdr.ts.tv_usec / 1000000.0),
+                callback(__timestamp(hdr, self.__tick),
                          PyBuffer_FromMemory(pkt, hdr.caplen), *args)
             elif n == -1:
                 raise KeyboardInterrupt
             elif n == -2:
                 break
     
+    def startring(self, slots=4096):
+        """Start a thread which reads packets from pcap into a ring of
+        slots allocated once, each large enough for the snapshot length,
+        without taking the interpreter lock.  When the ring is full the
+        thread drops the packets it reads until slots are given back.
+        Nothing else may read from the handle while the ring runs.
+
+        Arguments:
+
+        slots    -- number of packets the ring holds, rounded up to a
+                    power of two
+        """
+        if self.__ring != NULL:
+            raise OSError, "a capture ring is already running"
+        self.__ring = pcap_ex_ring_start(self.__pcap, slots, self.__ebuf)
+        if self.__ring == NULL:
+            raise OSError, self.__ebuf
+
+    def waitring(self, timeout_ms=-1):
+        """Give back the slots returned by the last readring() and wait
+        for packets in the ring, return the number ready, 0 if none
+        came in time, or -2 at the end of a savefile.
+
+        Arguments:
+
+        timeout_ms -- milliseconds to wait, or -1 to wait until packets
+                      come
+        """
+        cdef int n
+        cdef int ms
+        if self.__ring == NULL:
+            raise OSError, "no capture ring is running"
+        ms = timeout_ms
+        with nogil:
+            n = pcap_ex_ring_wait(self.__ring, ms)
+        if n == -1:
+            raise OSError, pcap_ex_ring_geterr(self.__ring)
+        return n
+
+    def readring(self, cnt=-1, timeout_ms=-1):
+        """Return a list of up to cnt (timestamp, packet) tuples from
+        the ring, waiting as waitring() does if it is empty.  The list
+        is empty on a timeout or at the end of a savefile.  Each packet
+        is a buffer on its slot of the ring, not a copy, and is only
+        valid until the next call to readring() or waitring().
+
+        Arguments:
+
+        cnt        -- number of packets to read, or -1 for all ready
+        timeout_ms -- milliseconds to wait, or -1 to wait until packets
+                      come
+        """
+        cdef pcap_pkthdr *hdr
+        cdef int n
+        n = self.waitring(timeout_ms)
+        pkts = []
+        if cnt < 0 or cnt > n:
+            cnt = n
+        while cnt > 0:
+            hdr = pcap_ex_ring_take(self.__ring)
+            pkts.append((__timestamp(hdr, self.__tick),
+                         PyBuffer_FromMemory(<char *>(hdr + 1), hdr.caplen)))
+            cnt = cnt - 1
+        return pkts
+
+    def ringstats(self):
+        """Return a 2-tuple of the number of packets put into the ring,
+        and dropped because it was full."""
+        cdef unsigned long long received
+        cdef unsigned long long overflow
+        if self.__ring == NULL:
+            raise OSError, "no capture ring is running"
+        pcap_ex_ring_stats(self.__ring, &received, &overflow)
+        return (received, overflow)
+
+    def stopring(self):
+        """Stop the capture thread and free its ring."""
+        cdef pcap_ex_ring *ring
+        if self.__ring != NULL:
+            ring = self.__ring
+            self.__ring = NULL
+            with nogil:
+                pcap_ex_ring_stop(ring)
+
     def inject(self, packet, len):
         """Inject a packet onto an interface.
         May or may not work depending on platform.
@@ -434,6 +624,7 @@ cdef class pcap:
         pcap_dump_close(self.__dumper)
 
     def close(self):
+        self.stopring()
         if self.__pcap:
             pcap_close(self.__pcap)
             self.__pcap = NULL
@@ -463,7 +654,7 @@ cdef class pcap:
             n = pcap_ex_next(self.__pcap, &hdr, &pkt)
             Py_END_ALLOW_THREADS
             if n == 1:
-                return (hdr.ts.tv_sec + (hdr.ts.tv_usec / 1000000.0),
+                return (__timestamp(hdr, self.__tick),
                         PyBuffer_FromMemory(pkt, hdr.caplen))
             elif n == -1:
                 raise KeyboardInterrupt
@@ -471,6 +662,8 @@ cdef class pcap:
                 raise StopIteration
     
     def __dealloc__(self):
+        if self.__ring != NULL:
+            pcap_ex_ring_stop(self.__ring)
         if self.__name:
             free(self.__name)
         if self.__filter:
@@ -11,6 +11,8 @@
 # include <string.h>
 # include <signal.h>
 # include <unistd.h>
+# include <stdlib.h>
+# include <pthread.h>
 #endif
 
 #include <pcap.h>
@@ -40,6 +42,111 @@ pcap_ex_immediate(pcap_t *pcap)
 #endif
 }
 
+/*
+ * Open a device with pcap_create() and pcap_activate() where pcap has
+ * them, so the kernel buffer, immediate mode and timestamps may be set
+ * before capture starts.  bufsize 0 and tstamp_type -1 leave pcap's
+ * defaults.  Older pcap falls back to pcap_open_live(), which cannot
+ * set the buffer or the timestamps.
+ */
+pcap_t *
+pcap_ex_open_live(char *name, int snaplen, int promisc, int to_ms,
+    int immediate, int bufsize, int tstamp_type, int precision, char *ebuf)
+{
+	pcap_t *pcap;
+#ifdef HAVE_PCAP_CREATE
+	int ret;
+
+	if ((pcap = pcap_create(name, ebuf)) == NULL)
+		return (NULL);
+	pcap_set_snaplen(pcap, snaplen);
+	pcap_set_promisc(pcap, promisc);
+	pcap_set_timeout(pcap, to_ms);
+	if (bufsize > 0 && pcap_set_buffer_size(pcap, bufsize) != 0) {
+		strcpy(ebuf, "couldn't set the capture buffer size");
+		goto fail;
+	}
+# ifdef HAVE_PCAP_SET_IMMEDIATE_MODE
+	if (immediate && pcap_set_immediate_mode(pcap, 1) != 0) {
+		strcpy(ebuf, "couldn't set immediate mode");
+		goto fail;
+	}
+# endif
+# ifdef HAVE_PCAP_SET_TSTAMP_TYPE
+	/* A type the device lacks is only a warning, as in tcpdump. */
+	if (tstamp_type >= 0 && pcap_set_tstamp_type(pcap, tstamp_type) < 0) {
+		strcpy(ebuf, "couldn't set the timestamp type");
+		goto fail;
+	}
+# endif
+# ifdef HAVE_PCAP_SET_TSTAMP_PRECISION
+	if (precision != PCAP_TSTAMP_PRECISION_MICRO &&
+	    pcap_set_tstamp_precision(pcap, precision) != 0) {
+# else
+	if (precision != PCAP_TSTAMP_PRECISION_MICRO) {
+# endif
+		strcpy(ebuf, "timestamp precision not supported");
+		goto fail;
+	}
+	if ((ret = pcap_activate(pcap)) < 0) {
+		if (*pcap_geterr(pcap) != '\0')
+			strncpy(ebuf, pcap_geterr(pcap), PCAP_ERRBUF_SIZE - 1);
+		else
+			strncpy(ebuf, pcap_statustostr(ret), PCAP_ERRBUF_SIZE - 1);
+		ebuf[PCAP_ERRBUF_SIZE - 1] = '\0';
+		goto fail;
+	}
+# ifndef HAVE_PCAP_SET_IMMEDIATE_MODE
+	if (immediate && pcap_ex_immediate(pcap) < 0) {
+		strcpy(ebuf, "couldn't set BPF immediate mode");
+		goto fail;
+	}
+# endif
+	return (pcap);
+ fail:
+	pcap_close(pcap);
+	return (NULL);
+#else
+	if (precision != PCAP_TSTAMP_PRECISION_MICRO) {
+		strcpy(ebuf, "timestamp precision not supported");
+		return (NULL);
+	}
+	if ((pcap = pcap_open_live(name, snaplen, promisc, to_ms,
+	    ebuf)) == NULL)
+		return (NULL);
+	if (bufsize > 0) {
+# ifdef _WIN32
+		if (pcap_setbuff(pcap, bufsize) != 0) {
+			strcpy(ebuf, "couldn't set the capture buffer size");
+			pcap_close(pcap);
+			return (NULL);
+		}
+# endif
+	}
+	if (immediate && pcap_ex_immediate(pcap) < 0) {
+		strcpy(ebuf, "couldn't set BPF immediate mode");
+		pcap_close(pcap);
+		return (NULL);
+	}
+	return (pcap);
+#endif /* !HAVE_PCAP_CREATE */
+}
+
+/* Open a savefile, giving its timestamps in the precision asked for. */
+pcap_t *
+pcap_ex_open_offline(char *name, int precision, char *ebuf)
+{
+#ifdef HAVE_PCAP_SET_TSTAMP_PRECISION
+	return (pcap_open_offline_with_tstamp_precision(name, precision, ebuf));
+#else
+	if (precision != PCAP_TSTAMP_PRECISION_MICRO) {
+		strcpy(ebuf, "timestamp precision not supported");
+		return (NULL);
+	}
+	return (pcap_open_offline(name, ebuf));
+#endif
+}
+
 #ifdef _WIN32
 /* XXX - set device list in libdnet order. */
 static int
@@ -170,6 +277,41 @@ pcap_ex_fileno(pcap_t *pcap)
 #endif /* !_WIN32 */
 }
 
+int
+pcap_ex_seek(pcap_t *pcap, long long offset)
+{
+#ifdef _WIN32
+	/* XXX - savefiles are not seekable here. */
+	return (-1);
+#else
+# ifdef HAVE_PCAP_FILE
+	FILE *f = pcap_file(pcap);
+# else
+	FILE *f = pcap->sf.rfile;
+# endif
+	if (f == NULL)
+		return (-1);
+	return (fseeko(f, (off_t)offset, SEEK_SET));
+#endif /* !_WIN32 */
+}
+
+long long
+pcap_ex_tell(pcap_t *pcap)
+{
+#ifdef _WIN32
+	return (-1);
+#else
+# ifdef HAVE_PCAP_FILE
+	FILE *f = pcap_file(pcap);
+# else
+	FILE *f = pcap->sf.rfile;
+# endif
+	if (f == NULL)
+		return (-1);
+	return ((long long)ftello(f));
+#endif /* !_WIN32 */
+}
+
 static int __pcap_ex_gotsig;
 
 #ifdef _WIN32
@@ -303,3 +445,277 @@ pcap_ex_compile_nopcap(int snaplen, int dlt, struct bpf_program *fp, char *str,
 	return (ret);
 #endif
 }
+
+/*
+ * A ring of preallocated slots, each a pcap_pkthdr followed by the bytes
+ * of a packet, which a thread of its own fills from pcap without ever
+ * taking the Python interpreter lock.  The slots between tail and head
+ * hold packets; those before next have been handed to the reader, which
+ * gives them back on its next call to pcap_ex_ring_wait().  head, tail
+ * and next count slots from the start and are taken modulo nslots.
+ */
+#ifndef _WIN32
+struct pcap_ex_ring {
+	pcap_t		*pcap;
+	pthread_t	 thread;
+	pthread_mutex_t	 lock;
+	pthread_cond_t	 ready;
+	pthread_cond_t	 space;
+	u_char		*slots;
+	u_int		 nslots;
+	u_int		 slotsize;
+	u_int		 snaplen;
+	/* Shared with the reader, under lock. */
+	u_int		 head;
+	u_int		 tail;
+	unsigned long long received;
+	unsigned long long overflow;
+	int		 stop;
+	int		 done;		/* 1 = end of savefile, -1 = error */
+	char		 ebuf[PCAP_ERRBUF_SIZE];
+	/* The capture thread's own. */
+	u_int		 fill;
+	u_int		 limit;
+	unsigned long long dropped;
+	/* The reader's own. */
+	u_int		 next;
+	u_int		 seen;
+};
+
+#define RING_SLOT(r, n)	((struct pcap_pkthdr *)((r)->slots + \
+	    (size_t)((n) & ((r)->nslots - 1)) * (r)->slotsize))
+
+static void
+__pcap_ex_ring_handler(u_char *arg, const struct pcap_pkthdr *hdr,
+    const u_char *pkt)
+{
+	struct pcap_ex_ring *ring = (struct pcap_ex_ring *)arg;
+	struct pcap_pkthdr *slot;
+
+	if (ring->fill == ring->limit) {
+		ring->dropped++;
+		return;
+	}
+	slot = RING_SLOT(ring, ring->fill);
+	*slot = *hdr;
+	if (slot->caplen > ring->snaplen)
+		slot->caplen = ring->snaplen;
+	memcpy(slot + 1, pkt, slot->caplen);
+	ring->fill++;
+}
+
+static int
+__pcap_ex_ring_savefile(pcap_t *pcap)
+{
+#ifdef HAVE_PCAP_FILE
+	return (pcap_file(pcap) != NULL);
+#else
+	return (pcap->sf.rfile != NULL);
+#endif
+}
+
+static void *
+__pcap_ex_ring_thread(void *arg)
+{
+	struct pcap_ex_ring *ring = (struct pcap_ex_ring *)arg;
+	int savefile = __pcap_ex_ring_savefile(ring->pcap);
+	u_int start;
+	int cnt, n;
+
+	for (;;) {
+		pthread_mutex_lock(&ring->lock);
+		/*
+		 * A savefile is read no faster than its packets are taken,
+		 * so wait for free slots rather than dropping packets.
+		 */
+		while (savefile && !ring->stop &&
+		    ring->fill == ring->tail + ring->nslots)
+			pthread_cond_wait(&ring->space, &ring->lock);
+		if (ring->stop) {
+			pthread_mutex_unlock(&ring->lock);
+			break;
+		}
+		ring->limit = ring->tail + ring->nslots;
+		pthread_mutex_unlock(&ring->lock);
+
+		/*
+		 * Take no more packets than there are free slots, so that
+		 * every call publishes what it read.  A live capture with
+		 * no free slots still reads, and drops, what has arrived.
+		 */
+		start = ring->fill;
+		cnt = ring->limit - ring->fill;
+		if (cnt == 0)
+			cnt = -1;
+		n = pcap_dispatch(ring->pcap, cnt, __pcap_ex_ring_handler,
+		    (u_char *)ring);
+
+		pthread_mutex_lock(&ring->lock);
+		ring->head = ring->fill;
+		ring->received += ring->fill - start;
+		ring->overflow = ring->dropped;
+		if (n == -1) {
+			strncpy(ring->ebuf, pcap_geterr(ring->pcap),
+			    sizeof(ring->ebuf) - 1);
+			ring->done = -1;
+		} else if (n == 0 && savefile)
+			ring->done = 1;
+		if (ring->head != start || ring->done)
+			pthread_cond_broadcast(&ring->ready);
+		n = ring->done;
+		pthread_mutex_unlock(&ring->lock);
+		if (n != 0)
+			break;
+	}
+	return (NULL);
+}
+#endif /* !_WIN32 */
+
+struct pcap_ex_ring *
+pcap_ex_ring_start(pcap_t *pcap, int nslots, char *ebuf)
+{
+#ifdef _WIN32
+	strcpy(ebuf, "capture rings are not supported on this platform");
+	return (NULL);
+#else
+	struct pcap_ex_ring *ring;
+
+	if (nslots <= 0) {
+		strcpy(ebuf, "a capture ring needs at least one slot");
+		return (NULL);
+	}
+	if ((ring = calloc(1, sizeof(*ring))) == NULL) {
+		strcpy(ebuf, "out of memory");
+		return (NULL);
+	}
+	ring->pcap = pcap;
+	/* A power of two, so the counts may wrap. */
+	for (ring->nslots = 1; ring->nslots < (u_int)nslots; )
+		ring->nslots <<= 1;
+	ring->snaplen = pcap_snapshot(pcap);
+	/* Keep every header aligned. */
+	ring->slotsize = (sizeof(struct pcap_pkthdr) + ring->snaplen + 7) & ~7;
+	if ((ring->slots = malloc((size_t)ring->nslots * ring->slotsize)) ==
+	    NULL) {
+		free(ring);
+		strcpy(ebuf, "out of memory for the capture ring");
+		return (NULL);
+	}
+	pthread_mutex_init(&ring->lock, NULL);
+	pthread_cond_init(&ring->ready, NULL);
+	pthread_cond_init(&ring->space, NULL);
+	if (pthread_create(&ring->thread, NULL, __pcap_ex_ring_thread,
+	    ring) != 0) {
+		pthread_cond_destroy(&ring->space);
+		pthread_cond_destroy(&ring->ready);
+		pthread_mutex_destroy(&ring->lock);
+		free(ring->slots);
+		free(ring);
+		strcpy(ebuf, "couldn't start the capture thread");
+		return (NULL);
+	}
+	return (ring);
+#endif
+}
+
+/*
+ * Give back the slots handed out since the last call, and wait up to
+ * timeout_ms milliseconds, or for ever if it is negative, for packets.
+ * return codes: n > 0 = packets ready, 0 = timeout, -1 = error, -2 = EOF
+ */
+int
+pcap_ex_ring_wait(struct pcap_ex_ring *ring, int timeout_ms)
+{
+#ifdef _WIN32
+	return (-1);
+#else
+	struct timeval now;
+	struct timespec until;
+	int n;
+
+	pthread_mutex_lock(&ring->lock);
+	if (ring->tail != ring->next) {
+		ring->tail = ring->next;
+		pthread_cond_signal(&ring->space);
+	}
+	if (ring->head == ring->next && ring->done == 0) {
+		if (timeout_ms < 0) {
+			while (ring->head == ring->next && ring->done == 0)
+				pthread_cond_wait(&ring->ready, &ring->lock);
+		} else {
+			gettimeofday(&now, NULL);
+			until.tv_sec = now.tv_sec + timeout_ms / 1000;
+			until.tv_nsec = (now.tv_usec + (timeout_ms % 1000) * 1000)
+			    * 1000;
+			if (until.tv_nsec >= 1000000000) {
+				until.tv_sec++;
+				until.tv_nsec -= 1000000000;
+			}
+			while (ring->head == ring->next && ring->done == 0 &&
+			    pthread_cond_timedwait(&ring->ready, &ring->lock,
+			    &until) == 0)
+				;
+		}
+	}
+	ring->seen = ring->head;
+	n = ring->seen - ring->next;
+	if (n == 0 && ring->done != 0)
+		n = (ring->done < 0) ? -1 : -2;
+	pthread_mutex_unlock(&ring->lock);
+	return (n);
+#endif
+}
+
+/* Hand out the next packet found by pcap_ex_ring_wait(), or NULL. */
+struct pcap_pkthdr *
+pcap_ex_ring_take(struct pcap_ex_ring *ring)
+{
+#ifdef _WIN32
+	return (NULL);
+#else
+	if (ring->next == ring->seen)
+		return (NULL);
+	return (RING_SLOT(ring, ring->next++));
+#endif
+}
+
+void
+pcap_ex_ring_stats(struct pcap_ex_ring *ring, unsigned long long *received,
+    unsigned long long *overflow)
+{
+#ifndef _WIN32
+	pthread_mutex_lock(&ring->lock);
+	*received = ring->received;
+	*overflow = ring->overflow;
+	pthread_mutex_unlock(&ring->lock);
+#endif
+}
+
+char *
+pcap_ex_ring_geterr(struct pcap_ex_ring *ring)
+{
+#ifdef _WIN32
+	return ("capture rings are not supported on this platform");
+#else
+	return (ring->ebuf);
+#endif
+}
+
+/* Stop the capture thread and free the ring. */
+void
+pcap_ex_ring_stop(struct pcap_ex_ring *ring)
+{
+#ifndef _WIN32
+	pthread_mutex_lock(&ring->lock);
+	ring->stop = 1;
+	pthread_cond_signal(&ring->space);
+	pthread_mutex_unlock(&ring->lock);
+	pcap_breakloop(ring->pcap);
+	pthread_join(ring->thread, NULL);
+	pthread_cond_destroy(&ring->space);
+	pthread_cond_destroy(&ring->ready);
+	pthread_mutex_destroy(&ring->lock);
+	free(ring->slots);
+	free(ring);
+#endif
+}
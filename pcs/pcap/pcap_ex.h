@@ -3,10 +3,21 @@
 #ifndef PCAP_EX_H
 #define PCAP_EX_H
 
+#ifndef PCAP_TSTAMP_PRECISION_MICRO
+# define PCAP_TSTAMP_PRECISION_MICRO	0
+# define PCAP_TSTAMP_PRECISION_NANO	1
+#endif
+
 int   pcap_ex_immediate(pcap_t *pcap);
+pcap_t *pcap_ex_open_live(char *name, int snaplen, int promisc, int to_ms,
+          int immediate, int bufsize, int tstamp_type, int precision,
+          char *ebuf);
+pcap_t *pcap_ex_open_offline(char *name, int precision, char *ebuf);
 char *pcap_ex_name(char *name);
 char *pcap_ex_lookupdev(char *ebuf);
 int   pcap_ex_fileno(pcap_t *pcap);
+int   pcap_ex_seek(pcap_t *pcap, long long offset);
+long long pcap_ex_tell(pcap_t *pcap);
 void  pcap_ex_setup(pcap_t *pcap);
 void  pcap_ex_setnonblock(pcap_t *pcap, int nonblock, char *ebuf);
 int   pcap_ex_getnonblock(pcap_t *pcap, char *ebuf);
@@ -14,4 +25,14 @@ int   pcap_ex_next(pcap_t *pcap, struct pcap_pkthdr **hdr, u_char **pkt);
 int   pcap_ex_compile_nopcap(int snaplen, int dlt, struct bpf_program *fp,
           char *str, int optimize, unsigned int netmask);
 
+struct pcap_ex_ring;
+
+struct pcap_ex_ring *pcap_ex_ring_start(pcap_t *pcap, int nslots, char *ebuf);
+int   pcap_ex_ring_wait(struct pcap_ex_ring *ring, int timeout_ms);
+struct pcap_pkthdr *pcap_ex_ring_take(struct pcap_ex_ring *ring);
+void  pcap_ex_ring_stats(struct pcap_ex_ring *ring,
+          unsigned long long *received, unsigned long long *overflow);
+char *pcap_ex_ring_geterr(struct pcap_ex_ring *ring);
+void  pcap_ex_ring_stop(struct pcap_ex_ring *ring);
+
 #endif /* PCAP_EX_H */
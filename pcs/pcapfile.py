@@ -0,0 +1,382 @@
+#
+# Copyright (c) 2008, Neville-Neil Consulting
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# Neither the name of Neville-Neil Consulting nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# File: $Id: $
+#
+# Author: George V. Neville-Neil
+#
+# Description: The layout of pcap savefiles, for the code which reads
+# them without going through libpcap.
+#
+# A savefile is a file header followed by records, each a record
+# header followed by the bytes of one packet.  The headers are in the
+# byte order of the host which wrote the file, which is told by the
+# magic number at its start.
+
+import os
+import struct
+import array
+import threading
+import Queue
+
+class PcapFormatError(Exception):
+    """Error raised when a file is not a pcap savefile we can read."""
+    def __init__(self, message):
+        self.message = message
+    def __str__(self):
+        return self.message
+
+## The length of the pcap file header and of each record header.
+FILE_HEADER_LEN = 24
+RECORD_HEADER_LEN = 16
+
+## The magic numbers for microsecond and nanosecond savefiles.
+TCPDUMP_MAGIC = 0xa1b2c3d4
+NSEC_TCPDUMP_MAGIC = 0xa1b23c4d
+
+## The version of the format which is written.
+VERSION_MAJOR = 2
+VERSION_MINOR = 4
+
+def file_header(snaplen, dlink, nanoseconds = False):
+    """Return the file header of a pcap savefile written in the byte
+       order of this host, with microsecond timestamps or, if
+       nanoseconds is True, with nanosecond timestamps."""
+    if nanoseconds:
+        magic = NSEC_TCPDUMP_MAGIC
+    else:
+        magic = TCPDUMP_MAGIC
+    return struct.pack("=IHHiIII", magic, VERSION_MAJOR, VERSION_MINOR,
+                       0, 0, snaplen, dlink)
+
+def header(bytes, name = "file"):
+    """Decode the file header of a pcap savefile from its first bytes.
+       Return a tuple of the byte order of the file as a struct prefix,
+       the tick, the number of nanoseconds in a unit of the fraction of
+       a timestamp, the snap length and the data link type."""
+    if len(bytes) < FILE_HEADER_LEN:
+        raise PcapFormatError, "%s is too short for a pcap file" % name
+    for order in ["<", ">"]:
+        magic = struct.unpack_from(order + "I", bytes)[0]
+        if magic == TCPDUMP_MAGIC:
+            tick = 1000
+            break
+        if magic == NSEC_TCPDUMP_MAGIC:
+            tick = 1
+            break
+    else:
+        raise PcapFormatError, "%s is not a pcap file" % name
+    (snaplen, dlink) = struct.unpack_from(order + "II", bytes, 16)
+    return (order, tick, snaplen, dlink)
+
+def index(bytes, order):
+    """Walk the record headers of a whole savefile held in bytes, which
+       may be a string, buffer or mmap.  Return a tuple of arrays of the
+       offset of each packet's bytes, its captured length and the two
+       parts of its timestamp.  A last record cut short is left out."""
+    offsets = array.array('L')
+    caplens = array.array('L')
+    seconds = array.array('L')
+    fractions = array.array('L')
+    record = struct.Struct(order + "III")
+    unpack_from = record.unpack_from
+    end = len(bytes)
+    offset = FILE_HEADER_LEN
+    while offset + RECORD_HEADER_LEN <= end:
+        (sec, frac, caplen) = unpack_from(bytes, offset)
+        offset += RECORD_HEADER_LEN
+        if offset + caplen > end:
+            break
+        offsets.append(offset)
+        caplens.append(caplen)
+        seconds.append(sec)
+        fractions.append(frac)
+        offset += caplen
+    return (offsets, caplens, seconds, fractions)
+
+## A sidecar index of a savefile is kept next to it, in a file with
+## this suffix.  It holds the offset and timestamp of every Nth record
+## so that a packet can be found by its number or time without reading
+## the records before it.
+INDEX_SUFFIX = ".pcsidx"
+INDEX_MAGIC = "PCSI"
+INDEX_VERSION = 1
+
+## The default number of records between two entries of an index.
+INDEX_EVERY = 1024
+
+class PcapIndex(object):
+    """An index of every Nth record of a pcap savefile.
+
+       Entry i of the index is record number i * every of the file, and
+       is kept as the offset of its record header and its timestamp.
+       The size and modification time of the file are kept so that an
+       index saved for an older version of the file is not used."""
+
+    header = struct.Struct("!4sIIQQQ")
+    entry = struct.Struct("!QII")
+
+    def __init__(self, every, count, size, mtime, tick):
+        """initialize an empty index
+
+        every - the number of records between two entries
+        count - the number of records in the file
+        size - the size of the file in bytes
+        mtime - the modification time of the file in whole seconds
+        tick - the number of nanoseconds in a unit of the fraction of
+               a timestamp, see header()
+        """
+        self.every = every
+        self.count = count
+        self.size = size
+        self.mtime = mtime
+        self.tick = tick
+        self.offsets = array.array('L')
+        self.seconds = array.array('L')
+        self.fractions = array.array('L')
+
+    def __len__(self):
+        """return the number of entries in the index"""
+        return len(self.offsets)
+
+    def locate(self, n):
+        """Return a tuple of the offset of the indexed record at or
+           before record number n, and the number of that record."""
+        if n < 0 or n >= self.count:
+            raise IndexError, "no record %d in a file of %d" % (n, self.count)
+        i = n / self.every
+        return (self.offsets[i], i * self.every)
+
+    def locate_time(self, t):
+        """Return a tuple of the offset of the last indexed record with
+           a timestamp before t, or of the first record if there is
+           none, and the number of that record.  The records must be in
+           order of time."""
+        lo = 0
+        hi = len(self.offsets)
+        tick = self.tick
+        while lo < hi:
+            mid = (lo + hi) / 2
+            if self.seconds[mid] * 1000000000 + self.fractions[mid] * tick < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        i = max(lo - 1, 0)
+        return (self.offsets[i], i * self.every)
+
+    def save(self, filename):
+        """Write the index to a file."""
+        file = open(filename, "wb")
+        file.write(self.header.pack(INDEX_MAGIC, INDEX_VERSION, self.every,
+                                    self.count, self.size, self.mtime))
+        pack = self.entry.pack
+        for i in xrange(len(self.offsets)):
+            file.write(pack(self.offsets[i], self.seconds[i],
+                            self.fractions[i]))
+        file.close()
+
+def build_index(filename, every = INDEX_EVERY):
+    """Walk the record headers of a pcap savefile and return a
+       PcapIndex of every Nth record.  A last record cut short is not
+       counted."""
+    file = open(filename, "rb")
+    (order, tick, snaplen, dlink) = header(file.read(FILE_HEADER_LEN),
+                                           filename)
+    stat = os.fstat(file.fileno())
+    index = PcapIndex(every, 0, stat.st_size, int(stat.st_mtime), tick)
+    record = struct.Struct(order + "IIII")
+    size = stat.st_size
+    offset = FILE_HEADER_LEN
+    n = 0
+    while offset + RECORD_HEADER_LEN <= size:
+        file.seek(offset)
+        (sec, frac, caplen, length) = record.unpack(file.read(RECORD_HEADER_LEN))
+        if offset + RECORD_HEADER_LEN + caplen > size:
+            break
+        if n % every == 0:
+            index.offsets.append(offset)
+            index.seconds.append(sec)
+            index.fractions.append(frac)
+        offset += RECORD_HEADER_LEN + caplen
+        n += 1
+    file.close()
+    index.count = n
+    return index
+
+def load_index(filename, tick):
+    """Read an index written by PcapIndex.save().  Return None if the
+       file is not an index this code can read."""
+    file = open(filename, "rb")
+    bytes = file.read()
+    file.close()
+    if len(bytes) < PcapIndex.header.size:
+        return None
+    (magic, version, every, count, size, mtime) = \
+            PcapIndex.header.unpack_from(bytes)
+    if magic != INDEX_MAGIC or version != INDEX_VERSION:
+        return None
+    index = PcapIndex(every, count, size, mtime, tick)
+    unpack_from = PcapIndex.entry.unpack_from
+    end = len(bytes) - PcapIndex.entry.size + 1
+    for offset in xrange(PcapIndex.header.size, end, PcapIndex.entry.size):
+        (where, sec, frac) = unpack_from(bytes, offset)
+        index.offsets.append(where)
+        index.seconds.append(sec)
+        index.fractions.append(frac)
+    return index
+
+def index_for(filename, every = INDEX_EVERY):
+    """Return the index of a pcap savefile.  The index saved next to
+       the file is used if it is still up to date, otherwise the index
+       is built again and saved there if the directory is writable."""
+    file = open(filename, "rb")
+    (order, tick, snaplen, dlink) = header(file.read(FILE_HEADER_LEN),
+                                           filename)
+    stat = os.fstat(file.fileno())
+    file.close()
+    sidecar = filename + INDEX_SUFFIX
+    try:
+        index = load_index(sidecar, tick)
+        if (index is not None and index.size == stat.st_size and
+            index.mtime == int(stat.st_mtime) and index.every == every):
+            return index
+    except IOError:
+        pass
+    index = build_index(filename, every)
+    try:
+        index.save(sidecar)
+    except IOError:
+        pass
+    return index
+
+## The compressions a savefile may be stored with, by the suffix of
+## its name.
+COMPRESSIONS = { ".gz": "gz", ".bz2": "bz2", ".xz": "xz" }
+
+def compression(filename):
+    """Return the compression of a savefile by the suffix of its name,
+       one of "gz", "bz2" or "xz", or None."""
+    return COMPRESSIONS.get(os.path.splitext(filename)[1])
+
+def open_compressed(filename, mode, compression, level = 6):
+    """Open a compressed file as a stream of the bytes it holds.
+
+       filename - the name of the file
+       mode - "rb" to read the file or "wb" to write it
+       compression - "gz", "bz2" or "xz"
+       level - the compression level used when writing
+    """
+    if compression == "gz":
+        import gzip
+        return gzip.GzipFile(filename, mode, level)
+    if compression == "bz2":
+        import bz2
+        return bz2.BZ2File(filename, mode, compresslevel = level)
+    if compression == "xz":
+        # xz is only in the standard library from Python 3.3.
+        try:
+            import lzma
+        except ImportError:
+            try:
+                from backports import lzma
+            except ImportError:
+                raise PcapFormatError, \
+                      "xz files need the lzma or backports.lzma module"
+        if mode.startswith("w"):
+            return lzma.LZMAFile(filename, mode, preset = level)
+        return lzma.LZMAFile(filename, mode)
+    raise PcapFormatError, "unknown compression %s" % compression
+
+class ReadAhead(object):
+    """A file which a thread of its own reads ahead of its reader.
+
+       The thread reads the file a chunk at a time into a queue of at
+       most depth chunks, so that for a compressed file the codec,
+       which does not hold the interpreter lock while it works,
+       decompresses the next chunks while the reader decodes the
+       packets of this one."""
+
+    def __init__(self, file, chunk_size = 1 << 20, depth = 4):
+        """start reading a file ahead
+
+        file - the file to read, which is closed by close()
+        chunk_size - the number of bytes read at a time
+        depth - the number of chunks read ahead
+        """
+        self.file = file
+        self.chunk_size = chunk_size
+        self.queue = Queue.Queue(depth)
+        self.buffer = ""
+        self.offset = 0
+        self.done = False
+        self.stopped = False
+        self.thread = threading.Thread(target = self.__run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def __run(self):
+        """Read chunks of the file into the queue until its end."""
+        try:
+            while not self.stopped:
+                chunk = self.file.read(self.chunk_size)
+                self.queue.put(chunk)
+                if len(chunk) == 0:
+                    return
+        except Exception, e:
+            self.queue.put(e)
+
+    def read(self, n):
+        """Return the next n bytes of the file, or fewer at its end."""
+        end = self.offset + n
+        while end > len(self.buffer) and not self.done:
+            chunk = self.queue.get()
+            if isinstance(chunk, Exception):
+                self.done = True
+                raise chunk
+            if len(chunk) == 0:
+                self.done = True
+            self.buffer = self.buffer[self.offset:] + chunk
+            self.offset = 0
+            end = n
+        bytes = self.buffer[self.offset:end]
+        self.offset += len(bytes)
+        return bytes
+
+    def close(self):
+        """Stop the thread and close the file."""
+        self.stopped = True
+        # Make room for a thread blocked on a full queue.
+        while self.thread.isAlive():
+            try:
+                self.queue.get(True, 0.1)
+            except Queue.Empty:
+                pass
+        self.file.close()
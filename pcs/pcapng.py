@@ -0,0 +1,537 @@
+#
+# Copyright (c) 2008, Neville-Neil Consulting
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# Neither the name of Neville-Neil Consulting nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# File: $Id: $
+#
+# Author: George V. Neville-Neil
+#
+# Description: The layout of pcapng savefiles, for the code which
+# reads and writes them without going through libpcap.
+#
+# A pcapng file is a run of blocks, each a block type and length
+# followed by its body and the length again.  A Section Header Block
+# starts each section of the file and gives the byte order of the
+# blocks in it.  The Interface Description Blocks of a section give
+# the data link type, snap length and timestamp resolution of each
+# interface packets were captured on, and each packet block names the
+# interface of its packet by its number in the section.  Most blocks
+# may end with a list of options, each a code, a length and a value
+# padded to 32 bits.
+
+import struct
+import array
+
+from pcapfile import PcapFormatError
+
+## The types of the blocks which are read or written.
+SECTION_HEADER = 0x0a0d0d0a
+INTERFACE_DESCRIPTION = 0x00000001
+PACKET = 0x00000002
+SIMPLE_PACKET = 0x00000003
+NAME_RESOLUTION = 0x00000004
+INTERFACE_STATISTICS = 0x00000005
+ENHANCED_PACKET = 0x00000006
+
+## The blocks which hold a packet.
+PACKET_BLOCKS = (ENHANCED_PACKET, SIMPLE_PACKET, PACKET)
+
+## The magic number of a Section Header Block, from which the byte
+## order of its section is told.
+BYTE_ORDER_MAGIC = 0x1a2b3c4d
+
+## The version of the format which is written.
+VERSION_MAJOR = 1
+VERSION_MINOR = 0
+
+## The options common to every block.
+OPT_ENDOFOPT = 0
+OPT_COMMENT = 1
+
+## The options of a Section Header Block.
+SHB_HARDWARE = 2
+SHB_OS = 3
+SHB_USERAPPL = 4
+
+## The options of an Interface Description Block.
+IF_NAME = 2
+IF_DESCRIPTION = 3
+IF_TSRESOL = 9
+IF_FCSLEN = 13
+IF_TSOFFSET = 14
+
+## The options of an Enhanced Packet Block.
+EPB_FLAGS = 2
+
+## The options of an Interface Statistics Block, by code, and the
+## names of the counts they are kept under.
+ISB_STARTTIME = 2
+ISB_ENDTIME = 3
+ISB_COUNTS = { 4: "ifrecv", 5: "ifdrop", 6: "filteraccept", 7: "osdrop",
+               8: "usrdeliv" }
+
+## The timestamp resolution of an interface with no if_tsresol option,
+## as 10 to the minus 6, that is microseconds.
+DEFAULT_TSRESOL = 6
+
+def pad(length):
+    """Return the number of bytes which pad length bytes out to a
+       multiple of 32 bits."""
+    return -length & 3
+
+def decode_options(bytes, order, offset = 0):
+    """Decode the options of a block, which start at offset in its
+       body.  Return a list of (code, value) tuples, the value being a
+       string of bytes, in the order they were written."""
+    options = []
+    unpack_from = struct.Struct(order + "HH").unpack_from
+    end = len(bytes)
+    while offset + 4 <= end:
+        (code, length) = unpack_from(bytes, offset)
+        if code == OPT_ENDOFOPT:
+            break
+        offset += 4
+        options.append((code, bytes[offset:offset + length]))
+        offset += length + pad(length)
+    return options
+
+def encode_options(options):
+    """Encode a list of (code, value) tuples as the options of a block
+       in the byte order of this host, ending with opt_endofopt.  An
+       empty list is encoded as no bytes at all."""
+    if not options:
+        return ""
+    parts = []
+    for (code, value) in options:
+        parts.append(struct.pack("=HH", code, len(value)))
+        parts.append(value)
+        parts.append("\0" * pad(len(value)))
+    parts.append(struct.pack("=HH", OPT_ENDOFOPT, 0))
+    return "".join(parts)
+
+def comments(options):
+    """Return the comments among the options of a block."""
+    return [value for (code, value) in options if code == OPT_COMMENT]
+
+class Interface(object):
+    """An interface packets were captured on, as told by an Interface
+       Description Block, and the counts of its latest Interface
+       Statistics Block."""
+
+    def __init__(self, linktype, snaplen, options = [], order = "=",
+                 offset = None):
+        """initialize an interface
+
+        linktype - the data link type of its packets, a pcap.DLT_* value
+        snaplen - the most bytes of a packet captured, 0 for no limit
+        options - the options of its block, as from decode_options()
+        order - the byte order of the options, as a struct prefix
+        offset - the offset in the file of its block, if known
+        """
+        self.linktype = linktype
+        self.snaplen = snaplen
+        self.options = options
+        self.offset = offset
+        self.name = None
+        self.description = None
+        ## the resolution of the timestamps of its packets, coded as
+        ## in the if_tsresol option
+        self.tsresol = DEFAULT_TSRESOL
+        ## the seconds added to the timestamps of its packets
+        self.tsoffset = 0
+        self.fcslen = None
+        ## the counts of its latest statistics block, by name, with the
+        ## starttime and endtime in integer nanoseconds
+        self.stats = {}
+        ## the timestamp of its latest statistics block
+        self.stats_time = None
+        for (code, value) in options:
+            if code == IF_NAME:
+                self.name = value.rstrip("\0")
+            elif code == IF_DESCRIPTION:
+                self.description = value.rstrip("\0")
+            elif code == IF_TSRESOL and len(value) >= 1:
+                self.tsresol = ord(value[0])
+            elif code == IF_TSOFFSET and len(value) >= 8:
+                self.tsoffset = struct.unpack_from(order + "q", value)[0]
+            elif code == IF_FCSLEN and len(value) >= 1:
+                self.fcslen = ord(value[0])
+        self.__scale()
+
+    def __scale(self):
+        """Work out how a count of units of the timestamp resolution
+        is turned into nanoseconds: multiplied by mul, then divided by
+        div or shifted right by shift."""
+        self.mul = 1
+        self.div = 1
+        self.shift = 0
+        if self.tsresol & 0x80:
+            # A power of two.
+            self.mul = 1000000000
+            self.shift = self.tsresol & 0x7f
+        elif self.tsresol <= 9:
+            self.mul = 10 ** (9 - self.tsresol)
+        else:
+            self.div = 10 ** (self.tsresol - 9)
+
+    def comments(self):
+        """Return the comments of the interface's block."""
+        return comments(self.options)
+
+    def to_ns(self, units):
+        """Return a timestamp of the interface, in units of its
+        resolution, as integer nanoseconds since the epoch."""
+        ns = (units * self.mul >> self.shift) / self.div
+        if self.tsoffset:
+            ns += self.tsoffset * 1000000000
+        return ns
+
+    def from_ns(self, ns):
+        """Return a timestamp in integer nanoseconds since the epoch in
+        units of the interface's resolution."""
+        if self.tsoffset:
+            ns -= self.tsoffset * 1000000000
+        return (ns * self.div << self.shift) / self.mul
+
+class Section(object):
+    """A section of a pcapng file, with the byte order of its blocks,
+       the options of its header and its interfaces."""
+
+    def __init__(self, order, options = [], offset = None):
+        """initialize a section
+
+        order - the byte order of its blocks, as a struct prefix
+        options - the options of its header block
+        offset - the offset in the file of its header block, if known
+        """
+        self.order = order
+        self.options = options
+        self.offset = offset
+        self.interfaces = []
+
+    def comments(self):
+        """Return the comments of the section's header block."""
+        return comments(self.options)
+
+class Reader(object):
+    """A reader of the blocks of a pcapng file, in order.
+
+       The reader keeps the sections and interfaces it has read, and
+       the counts of the statistics blocks, and hands back only the
+       packets.  The file need only have a read() method, so that a
+       compressed file may be read as a stream, but seek() and
+       build_index() need a file which can seek."""
+
+    def __init__(self, file, name = "file"):
+        """initialize a reader
+
+        file - the file to read, positioned at the start of a section
+        name - the name of the file, for errors
+        """
+        self.file = file
+        self.name = name
+        ## the section being read
+        self.section = None
+        ## the interfaces of the section read so far, by number
+        self.interfaces = []
+        ## the offset in the file of the next block
+        self.offset = 0
+
+    def read_block(self, heads = False):
+        """Read the next block of the file.  Return a tuple of its
+        offset, type and body, or None at the end of the file or of a
+        last block cut short.  If heads is True, only the first 20
+        bytes of the body of a packet block are read and the rest is
+        skipped over."""
+        offset = self.offset
+        file = self.file
+        head = file.read(8)
+        if len(head) < 8:
+            return None
+        if head[:4] == "\x0a\x0d\x0d\x0a":
+            # The type of a Section Header Block is the same in either
+            # byte order, and its length is told by the magic after it.
+            magic = file.read(4)
+            if len(magic) < 4:
+                return None
+            for order in ["<", ">"]:
+                if struct.unpack(order + "I", magic)[0] == BYTE_ORDER_MAGIC:
+                    break
+            else:
+                raise PcapFormatError, \
+                      "%s has a bad byte order magic at %d" % (self.name,
+                                                               offset)
+            (length,) = struct.unpack(order + "I", head[4:])
+            self.__check(length, offset)
+            rest = length - 16
+            body = magic + file.read(rest)
+            if len(body) < rest + 4:
+                return None
+            self.section = Section(order, offset = offset)
+            self.interfaces = self.section.interfaces
+        else:
+            if self.section is None:
+                raise PcapFormatError, "%s is not a pcapng file" % self.name
+            (btype, length) = struct.unpack(self.section.order + "II", head)
+            self.__check(length, offset)
+            rest = length - 12
+            if heads and btype in PACKET_BLOCKS and rest > 20:
+                body = file.read(20)
+                if len(body) < 20:
+                    return None
+                file.seek(rest - 20, 1)
+            else:
+                body = file.read(rest)
+                if len(body) < rest:
+                    return None
+        if len(file.read(4)) < 4:
+            return None
+        self.offset = offset + length
+        (btype,) = struct.unpack(self.section.order + "I", head[:4])
+        return (offset, btype, body)
+
+    def __check(self, length, offset):
+        """Check the length of a block."""
+        if length < 12 or length & 3:
+            raise PcapFormatError, \
+                  "%s has a block of bad length %d at %d" % (self.name,
+                                                             length, offset)
+
+    def handle(self, offset, btype, body):
+        """Take in a block which does not hold a packet: keep the
+        options of a section, add an interface, or keep its counts.
+        Blocks of other types are skipped."""
+        order = self.section.order
+        if btype == SECTION_HEADER:
+            (magic, major, minor) = struct.unpack_from(order + "IHH", body)
+            if major != VERSION_MAJOR:
+                raise PcapFormatError, \
+                      "%s is pcapng version %d.%d" % (self.name, major, minor)
+            self.section.options = decode_options(body, order, 16)
+        elif btype == INTERFACE_DESCRIPTION:
+            (linktype, reserved, snaplen) = struct.unpack_from(order + "HHI",
+                                                               body)
+            self.interfaces.append(Interface(linktype, snaplen,
+                                             decode_options(body, order, 8),
+                                             order, offset))
+        elif btype == INTERFACE_STATISTICS:
+            (ifid, high, low) = struct.unpack_from(order + "III", body)
+            interface = self.interface(ifid)
+            interface.stats_time = interface.to_ns(high << 32 | low)
+            for (code, value) in decode_options(body, order, 12):
+                if len(value) < 8:
+                    continue
+                if code in (ISB_STARTTIME, ISB_ENDTIME):
+                    (high, low) = struct.unpack_from(order + "II", value)
+                    name = ("starttime", "endtime")[code - ISB_STARTTIME]
+                    interface.stats[name] = interface.to_ns(high << 32 | low)
+                elif code in ISB_COUNTS:
+                    interface.stats[ISB_COUNTS[code]] = \
+                        struct.unpack_from(order + "Q", value)[0]
+
+    def interface(self, ifid):
+        """Return interface number ifid of the section being read."""
+        if ifid >= len(self.interfaces):
+            raise PcapFormatError, \
+                  "%s names interface %d of %d" % (self.name, ifid,
+                                                   len(self.interfaces))
+        return self.interfaces[ifid]
+
+    def packet(self, btype, body):
+        """Decode a packet block.  Return a tuple of the number of its
+        interface, its timestamp in integer nanoseconds, or None for a
+        Simple Packet Block, its bytes, its length on the wire, and the
+        options of the block."""
+        order = self.section.order
+        if btype == ENHANCED_PACKET:
+            (ifid, high, low, caplen, length) = \
+                   struct.unpack_from(order + "IIIII", body)
+            start = 20
+        elif btype == PACKET:
+            (ifid, drops, high, low, caplen, length) = \
+                   struct.unpack_from(order + "HHIIII", body)
+            start = 20
+        else:
+            # A Simple Packet Block is of the first interface, and holds
+            # as much of the packet as its snap length allows.
+            (length,) = struct.unpack_from(order + "I", body)
+            snaplen = self.interface(0).snaplen
+            caplen = min(length, len(body) - 4)
+            if snaplen:
+                caplen = min(caplen, snaplen)
+            return (0, None, body[4:4 + caplen], length, [])
+        end = start + caplen
+        timestamp = self.interface(ifid).to_ns(high << 32 | low)
+        options = []
+        if len(body) > end + pad(caplen):
+            options = decode_options(body, order, end + pad(caplen))
+        return (ifid, timestamp, body[start:end], length, options)
+
+    def next(self):
+        """Return the next packet of the file as from packet(), or None
+        at the end of the file."""
+        read_block = self.read_block
+        while True:
+            block = read_block()
+            if block is None:
+                return None
+            (offset, btype, body) = block
+            if btype in PACKET_BLOCKS:
+                return self.packet(btype, body)
+            self.handle(offset, btype, body)
+
+    def seek(self, offset, section):
+        """Make the block at offset, in a section, the next to be read.
+        The interfaces described before that block are taken up again,
+        with the counts they have now."""
+        self.file.seek(offset)
+        self.offset = offset
+        self.section = section
+        self.interfaces = [i for i in section.interfaces if i.offset < offset]
+
+class PcapngIndex(object):
+    """An index of the packets of a pcapng file.
+
+       The index keeps the offset of the block and the timestamp of
+       every packet, and the sections they are in, so that a packet
+       can be found by its number or time without reading the blocks
+       before it."""
+
+    def __init__(self):
+        """initialize an empty index"""
+        self.offsets = array.array('L')
+        ## the timestamp of each packet, None for a Simple Packet Block
+        self.timestamps = []
+        ## the sections of the file, and the number of the first packet
+        ## of each
+        self.sections = []
+        self.firsts = []
+
+    def __len__(self):
+        """return the number of packets in the index"""
+        return len(self.offsets)
+
+    def locate(self, n):
+        """Return a tuple of the offset of the block of packet number n
+           and the section it is in."""
+        import bisect
+        if n < 0 or n >= len(self.offsets):
+            raise IndexError, "no packet %d in a file of %d" % \
+                  (n, len(self.offsets))
+        i = bisect.bisect_right(self.firsts, n) - 1
+        return (self.offsets[n], self.sections[i])
+
+    def locate_time(self, t):
+        """Return the number of the first packet with a timestamp of t
+           or later.  The packets must be in order of time."""
+        lo = 0
+        hi = len(self.offsets)
+        timestamps = self.timestamps
+        while lo < hi:
+            mid = (lo + hi) / 2
+            if timestamps[mid] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+def build_index(filename):
+    """Walk the blocks of a pcapng file, reading only the heads of the
+       packet blocks, and return a PcapngIndex of its packets.  A last
+       block cut short is not counted."""
+    file = open(filename, "rb")
+    reader = Reader(file, filename)
+    index = PcapngIndex()
+    unpack = struct.unpack_from
+    try:
+        while True:
+            block = reader.read_block(heads = True)
+            if block is None:
+                break
+            (offset, btype, body) = block
+            if btype == SECTION_HEADER:
+                index.sections.append(reader.section)
+                index.firsts.append(len(index.offsets))
+            if btype not in PACKET_BLOCKS:
+                reader.handle(offset, btype, body)
+                continue
+            order = reader.section.order
+            if btype == ENHANCED_PACKET:
+                (ifid, high, low) = unpack(order + "III", body)
+            elif btype == PACKET:
+                (ifid, drops, high, low) = unpack(order + "HHII", body)
+            else:
+                index.offsets.append(offset)
+                index.timestamps.append(None)
+                continue
+            index.offsets.append(offset)
+            index.timestamps.append(reader.interface(ifid).to_ns(high << 32 |
+                                                                 low))
+    finally:
+        file.close()
+    return index
+
+def block(btype, body):
+    """Return a block of a type with a body, in the byte order of this
+       host, padding the body to 32 bits."""
+    body += "\0" * pad(len(body))
+    length = len(body) + 12
+    return struct.pack("=II", btype, length) + body + struct.pack("=I", length)
+
+def section_header(options = []):
+    """Return a Section Header Block of unknown section length."""
+    return block(SECTION_HEADER,
+                 struct.pack("=IHHq", BYTE_ORDER_MAGIC, VERSION_MAJOR,
+                             VERSION_MINOR, -1) + encode_options(options))
+
+def interface_description(linktype, snaplen, options = []):
+    """Return an Interface Description Block."""
+    return block(INTERFACE_DESCRIPTION,
+                 struct.pack("=HHI", linktype, 0, snaplen) +
+                 encode_options(options))
+
+def enhanced_packet(ifid, units, bytes, length, options = []):
+    """Return an Enhanced Packet Block of the bytes of a packet, with
+       its timestamp in units of the resolution of its interface."""
+    return block(ENHANCED_PACKET,
+                 struct.pack("=IIIII", ifid, units >> 32, units & 0xffffffff,
+                             len(bytes), length) +
+                 bytes + "\0" * pad(len(bytes)) + encode_options(options))
+
+def simple_packet(bytes, length):
+    """Return a Simple Packet Block of the bytes of a packet."""
+    return block(SIMPLE_PACKET, struct.pack("=I", length) + bytes)
+
+def interface_statistics(ifid, units, options = []):
+    """Return an Interface Statistics Block, with its timestamp in units
+       of the resolution of its interface."""
+    return block(INTERFACE_STATISTICS,
+                 struct.pack("=III", ifid, units >> 32, units & 0xffffffff) +
+                 encode_options(options))
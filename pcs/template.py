@@ -0,0 +1,274 @@
+#
+# Copyright (c) 2008, Neville-Neil Consulting
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# Neither the name of Neville-Neil Consulting nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# File: $Id: $
+#
+# Author: George V. Neville-Neil
+#
+# Description: Stamp many variants of one frame without building packets.
+#
+# A Template is made from a Chain which has been fixed up.  It records
+# where each field of each packet lies in the bytes of the chain, and
+# stamps new values for a few fields straight into copies of those
+# bytes, for example:
+#
+#     chain = ethernet() / ipv4() / udp() / payload("x" * 18)
+#     chain.fixup()
+#     t = pcs.template.Template(chain)
+#     for frame in t.frames({ (ip, "id"): xrange(1000),
+#                             (udp, "sport"): ports }):
+#         dump.write(frame)
+#
+# The checksums of IPv4, ICMPv4, TCP and UDP headers in the chain are
+# updated incrementally (RFC 1624) for the fields which were stamped,
+# including the IPv4 and IPv6 addresses which TCP and UDP checksum as
+# part of their pseudo header.
+
+from pcs import Field, StringField, FieldBoundsError
+
+from binascii import hexlify, unhexlify
+import struct
+
+class Template(object):
+    """A frame made from a chain, into which new values of its fields
+    are stamped.
+
+    Fields are named by a tuple of the packet, or its index in the
+    chain, and the field's name.  Only plain Fields and StringFields
+    which come before any option list or other variable field of their
+    packet can be stamped."""
+
+    def __init__(self, chain):
+        """make a template from a chain
+
+        chain - the chain of packets, with its lengths and checksums
+                already set, e.g. by Chain.fixup()
+        """
+        ## the chain the template was made from
+        self.chain = chain
+        ## the bytes of the frame the variants are stamped into
+        self.bytes = chain.bytes
+        ## the number of bytes in a frame
+        self.size = len(self.bytes)
+        ## the offset in bytes of each packet in the frame
+        self.offsets = []
+        ## the bit offset and width in the frame of each field which
+        ## may be stamped, and its type, by packet index and name
+        self.fields = {}
+        offset = 0
+        for i in xrange(len(chain.packets)):
+            packet = chain.packets[i]
+            self.offsets.append(offset)
+            bit = offset * 8
+            for field in packet._layout:
+                if type(field) not in (Field, StringField):
+                    break
+                self.fields[(i, field.name)] = (bit, field.width, type(field))
+                bit += field.width
+            offset += len(packet.getbytes())
+        ## the checksums which may be updated, as tuples of the index
+        ## of their packet, the offset in bytes of the checksum field,
+        ## the offset of the first byte they cover, the offset after
+        ## their last byte, whether a sum of zero is sent as 0xffff, and
+        ## the packet whose addresses are part of their pseudo header
+        self.checksums = []
+        self.__find_checksums()
+
+    def __find_checksums(self):
+        """Find the checksums of the packets in the chain."""
+        from pcs.packets.ipv4 import ipv4
+        from pcs.packets.ipv6 import ipv6
+        from pcs.packets.icmpv4 import icmpv4
+        from pcs.packets.tcp import tcp
+        from pcs.packets.udp import udp
+        packets = self.chain.packets
+        for i in xrange(len(packets)):
+            packet = packets[i]
+            if (i, "checksum") not in self.fields:
+                continue
+            start = self.offsets[i]
+            field = self.fields[(i, "checksum")][0] / 8
+            pseudo = None
+            if isinstance(packet, ipv4):
+                end = start + packet.hlen * 4
+            elif isinstance(packet, icmpv4):
+                end = self.size
+            elif isinstance(packet, (tcp, udp)):
+                end = self.size
+                if i > 0 and isinstance(packets[i - 1], (ipv4, ipv6)):
+                    pseudo = i - 1
+            else:
+                continue
+            if isinstance(packet, udp) and packet.checksum == 0:
+                # The sender did not checksum this datagram.
+                continue
+            self.checksums.append((i, field, start, end,
+                                   isinstance(packet, udp), pseudo))
+
+    def field(self, packet, name):
+        """Return the bit offset in the frame, the width and the type
+        of a field which may be stamped.
+
+        packet - a packet of the chain, or its index in the chain
+        name - the name of the field
+        """
+        return self.fields[(self.__index(packet), name)]
+
+    def __index(self, packet):
+        """Return the index in the chain of a packet."""
+        if isinstance(packet, (int, long)):
+            return packet
+        return self.chain.index_of(packet)
+
+    def __plan(self, names):
+        """Work out how to stamp each of the fields named and which
+        words of the frame each checksum must sum again."""
+        plan = []
+        stamped = set()
+        for (packet, name) in names:
+            i = self.__index(packet)
+            (bit, width, ftype) = self.fields[(i, name)]
+            stamped.add(bit)
+            plan.append((i, name, bit, width, ftype))
+        sums = []
+        for (i, field, start, end, udp, pseudo) in self.checksums:
+            # A checksum which is itself stamped is left as it is given.
+            if field * 8 in stamped:
+                continue
+            # The 16 bit words which hold the stamped fields, counted
+            # from the first byte the checksum covers.  Fields which
+            # share a word, such as the IPv4 TTL and protocol, must
+            # have it summed only once.
+            words = set()
+            for (j, name, bit, width, ftype) in plan:
+                if start * 8 <= bit < end * 8:
+                    covered = start
+                elif j == pseudo and name in ("src", "dst"):
+                    covered = self.offsets[j]
+                else:
+                    continue
+                first = bit / 8
+                last = (bit + width + 7) / 8
+                first -= (first - covered) & 1
+                last += (last - covered) & 1
+                words.update(xrange(first, last, 2))
+            if not words:
+                continue
+            # Take the old words out of the sum once, and sum the new
+            # ones a run of adjacent words at a time once every field
+            # of a frame has been stamped.
+            total = ~struct.unpack_from("!H", self.bytes, field)[0] & 0xffff
+            runs = []
+            for first in sorted(words):
+                total += ~struct.unpack_from("!H", self.bytes, first)[0] & 0xffff
+                if runs and runs[-1][0] + runs[-1][1] * 2 == first:
+                    runs[-1][1] += 1
+                else:
+                    runs.append([first, 1])
+            runs = [(first, struct.Struct("!%dH" % count).unpack_from)
+                    for (first, count) in runs]
+            sums.append((field, total, udp, runs))
+        return (plan, sums)
+
+    def stamp(self, values, count = None):
+        """Stamp variants of the frame into a new buffer and return it,
+        a bytearray holding count frames of size bytes one after the
+        other.
+
+        values - a dictionary of the values of the fields of each frame,
+                 each a sequence by (packet, name) of the field
+        count - the number of frames, by default the length of the
+                shortest sequence of values
+        """
+        names = values.keys()
+        sequences = [values[name] for name in names]
+        if count is None:
+            count = min([len(s) for s in sequences])
+        (plan, sums) = self.__plan(names)
+        size = self.size
+        buf = bytearray(self.bytes * count)
+        steps = []
+        for n in xrange(len(plan)):
+            (i, name, bit, width, ftype) = plan[n]
+            steps.append((sequences[n], self.__writer(bit, width, ftype)))
+        pack_into = struct.Struct("!H").pack_into
+        for k in xrange(count):
+            base = k * size
+            for (seq, write) in steps:
+                write(buf, base, seq[k])
+            for (field, total, udp, runs) in sums:
+                for (first, unpack_from) in runs:
+                    total += sum(unpack_from(buf, base + first))
+                while total >> 16:
+                    total = (total & 0xffff) + (total >> 16)
+                total = ~total & 0xffff
+                if total == 0 and udp:
+                    total = 0xffff
+                pack_into(buf, base + field, total)
+        return buf
+
+    def frames(self, values, count = None):
+        """Return an iterator over variants of the frame, each a string
+        which may be handed to a connector's write(); see stamp()."""
+        buf = self.stamp(values, count)
+        for base in xrange(0, len(buf), self.size):
+            yield str(buffer(buf, base, self.size))
+
+    def __writer(self, bit, width, ftype):
+        """Return a function which writes a value of a field into a
+        frame in a buffer."""
+        formats = { 8: 'B', 16: 'H', 32: 'I', 64: 'Q' }
+        start = bit / 8
+        if ftype is StringField:
+            nbytes = width / 8
+            def write(buf, base, value):
+                if len(value) != nbytes:
+                    raise FieldBoundsError, "Value must be %d bytes long" % nbytes
+                buf[base + start:base + start + nbytes] = value
+            return write
+        if (bit % 8) == 0 and width in formats:
+            pack_into = struct.Struct("!" + formats[width]).pack_into
+            def write(buf, base, value):
+                pack_into(buf, base + start, value)
+            return write
+        # Fields which do not fill whole bytes are merged with the
+        # bits around them.
+        end = (bit + width + 7) / 8
+        shift = end * 8 - bit - width
+        mask = ((1 << width) - 1) << shift
+        nbytes = end - start
+        def write(buf, base, value):
+            if value < 0 or value >> width:
+                raise FieldBoundsError, "Value must be between 0 and %d but is %d" % ((1 << width) - 1, value)
+            old = int(hexlify(buf[base + start:base + end]), 16)
+            new = (old & ~mask) | (value << shift)
+            buf[base + start:base + end] = unhexlify("%0*x" % (nbytes * 2, new))
+        return write
@@ -64,33 +64,29 @@ def main():
 
     (options, args) = parser.parse_args()
 
-    file = pcs.PcapConnector(options.file)
+    file = pcs.PcapConnector(options.file, lazy = True)
 
     max = options.max
     
     mask = pcs.inet_atol(options.mask)
     
     network = pcs.inet_atol(options.network)
-    done = False
     
     srcmap = {}
     packets = 0
     in_network = 0
 
-    while not done:
-        try:
-            packet = file.readpkt()
-        except:
-            done = True
-        packets += 1
-        ip = packet.data
-        if (ip.src & mask) != network:
-            if ip.src in srcmap:
-                srcmap[ip.src] += 1
+    for batch in file.iter_batches(1024):
+        for packet in batch:
+            packets += 1
+            ip = packet.data
+            if (ip.src & mask) != network:
+                if ip.src in srcmap:
+                    srcmap[ip.src] += 1
+                else:
+                    srcmap[ip.src] = 1
             else:
-                srcmap[ip.src] = 1
-        else:
-            in_network +=1
+                in_network +=1
 
     print "%d packets in dumpfile" % packets
     print "%d unique source IPs" % len(srcmap)
@@ -118,7 +118,7 @@ def main():
                 (icmp.data.sequence < options.start)):
                 continue
                 
-            trace[icmp.data.sequence] = datetime.datetime.fromtimestamp(packet.timestamp)
+            trace[icmp.data.sequence] = datetime.datetime.fromtimestamp(packet.timestamp / 1e9)
 
         files.append(trace)
 
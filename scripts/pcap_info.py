@@ -121,7 +121,7 @@ def main():
                 srcmap[ip.src] = 1
 
             if options.ps is not None:
-                second = int(packet.timestamp)
+                second = packet.timestamp / 1000000000
                 try:
                     (count, length) = packets_per[second]
                     count += 1
@@ -130,7 +130,7 @@ def main():
                 except KeyError:
                     packets_per[second] = (1, len(packet.bytes))
             elif options.ppm is not None:
-                ts = datetime.datetime.fromtimestamp(packet.timestamp)
+                ts = datetime.datetime.fromtimestamp(packet.timestamp / 1e9)
                 ms = ts.microsecond / 1000
                 msecond = ts.strftime("%H:%M:%S")
                 msecond += (".%d") % ms
@@ -144,13 +144,14 @@ def main():
                 except KeyError:
                     packets_per[msecond] = (1, len(packet.bytes))
             elif options.ppu is not None:
+                usecond = packet.timestamp / 1000
                 try:
-                    (count, length) = packets_per[packet.timestamp]
+                    (count, length) = packets_per[usecond]
                     count += 1
                     length += len(packet.bytes)
-                    packets_per[packet.timestamp] = (count, length)
+                    packets_per[usecond] = (count, length)
                 except KeyError:
-                    packets_per[packet.timestamp] = (1, len(packet.bytes))
+                    packets_per[usecond] = (1, len(packet.bytes))
                     
 
         print "%d packets in dumpfile" % packets
@@ -197,7 +198,7 @@ def main():
                 print "Could not open file %s for writing." % options.ppu
                         
             for useconds in sorted(packets_per.keys()):
-                dt = datetime.datetime.fromtimestamp(useconds)
+                dt = datetime.datetime.fromtimestamp(useconds / 1e6)
                 data = ("%s, %d, %d\n" % (dt.strftime("%H:%M:%S.%f"),
                                           packets_per[useconds][0],
                                           packets_per[useconds][1]))
@@ -72,23 +72,21 @@ def main():
     
     last = options.last
 
-    done = False
-    
-    packets = 0
-    written = 0
-    while not done:
-        try:
-            packet = infile.read()
-        except:
-            done = True
-        packets += 1
-        if packets < first:
-            continue
-        if packets >= last:
-            done = True
+    # Packets are counted from 1 here, and from 0 by the connector.
+    if first > 1:
+        infile.seek_packet(first - 1)
 
-        outfile.write(packet)
-        written +=1 
+    written = 0
+    while last is None or written <= last - max(first, 1):
+        n = 4096
+        if last is not None:
+            n = min(n, last - max(first, 1) + 1 - written)
+        batch = infile.read_batch(n, decode = False)
+        if len(batch) == 0:
+            break
+        outfile.write_many(batch)
+        written += len(batch)
+    outfile.close()
 
     print "%d packets copied from %s to %s" % (written,
                                                options.infile,
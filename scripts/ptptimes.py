@@ -40,6 +40,7 @@ from pcs.packets.udpv4 import udpv4
 import pcs
 
 import datetime
+import time
 
 def main():
 
@@ -68,11 +69,12 @@ def main():
             continue
         if packet.data.data.data != None:
             if (options.natural == True):
-                ts = datetime.datetime.fromtimestamp(packet.data.data.timestamp)
-                ms = ts.microsecond / 1000
-                msecond = ts.strftime("%H:%M:%S")
-                msecond += (".%d") % ms
-                print msecond
+                # Timestamps are integer nanoseconds; a datetime would
+                # round them to microseconds.
+                ts = packet.data.data.timestamp
+                print "%s.%09d" % (time.strftime("%H:%M:%S",
+                                   time.localtime(ts / 1000000000)),
+                                   ts % 1000000000)
             else:
                 print packet.data.data.timestamp
             print packet.data.data.data
@@ -134,7 +134,10 @@ def main():
                       quad[1] + '-' + repr(quad[3]) + '.pcap'
             connection_map[quad] = pcs.PcapDumpConnector(outfile, file.dlink)
 
-        connection_map[quad].write(data)
+        connection_map[quad].write_record(timestamp, data)
+
+    for outfile in connection_map.itervalues():
+        outfile.close()
 
 # The canonical way to make a python module into a script.
 # Remove if unnecessary.
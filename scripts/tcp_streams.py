@@ -101,7 +101,7 @@ def main():
 
     (options, args) = parser.parse_args()
 
-    file = pcs.PcapConnector(options.file)
+    file = pcs.PcapConnector(options.file, lazy = True)
 
     done = False
     
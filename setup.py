@@ -60,12 +60,25 @@ class config_pcap(config.config):
         if os.path.exists(os.path.join(cfg['include_dirs'][0], 'pcap-int.h')):
             d['HAVE_PCAP_INT_H'] = 1
         buf = open(os.path.join(cfg['include_dirs'][0], 'pcap.h')).read()
+        # Newer pcap declares its functions in pcap/pcap.h.
+        if os.path.exists(os.path.join(cfg['include_dirs'][0], 'pcap',
+                                       'pcap.h')):
+            buf += open(os.path.join(cfg['include_dirs'][0], 'pcap',
+                                     'pcap.h')).read()
         if buf.find('pcap_file(') != -1:
             d['HAVE_PCAP_FILE'] = 1
         if buf.find('pcap_compile_nopcap(') != -1:
             d['HAVE_PCAP_COMPILE_NOPCAP'] = 1
         if buf.find('pcap_setnonblock(') != -1:
             d['HAVE_PCAP_SETNONBLOCK'] = 1
+        if buf.find('pcap_create(') != -1:
+            d['HAVE_PCAP_CREATE'] = 1
+        if buf.find('pcap_set_immediate_mode(') != -1:
+            d['HAVE_PCAP_SET_IMMEDIATE_MODE'] = 1
+        if buf.find('pcap_set_tstamp_type(') != -1:
+            d['HAVE_PCAP_SET_TSTAMP_TYPE'] = 1
+        if buf.find('pcap_set_tstamp_precision(') != -1:
+            d['HAVE_PCAP_SET_TSTAMP_PRECISION'] = 1
         f = open('pcs/pcap/config.h', 'w')
         for k, v in d.iteritems():
             f.write('#define %s %s\n' % (k, v))
@@ -108,7 +121,7 @@ pcap = Extension(name='pcs.pcap',
                  sources=[ 'pcs/pcap/pcap.pyx', 'pcs/pcap/pcap_ex.c' ],
                  include_dirs=['/usr/include/pcap', './pcs/bpf/', '.'],
                  library_dirs=['/usr/lib'],
-                 libraries=['pcap']
+                 libraries=['pcap', 'pthread']
 	)
 
 bpf = Extension(name='bpf',
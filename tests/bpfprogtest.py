@@ -0,0 +1,230 @@
+# Copyright (c) 2005, Neville-Neil Consulting
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# Neither the name of Neville-Neil Consulting nor the names of its 
+# contributors may be used to endorse or promote products derived from 
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#
+# File: $Id: $
+#
+# Author: George V. Neville-Neil
+#
+# Author: George V. Neville-Neil
+#
+# Description: This module checks that the BPF programs compiled from
+# expect() patterns accept every packet of some savefiles which the
+# patterns match, and reject the others.
+
+import unittest
+
+import sys
+
+if __name__ == '__main__':
+
+    if "-l" in sys.argv:
+        sys.path.insert(0, "../") # Look locally first
+        sys.argv.remove("-l") # Needed because unittest has issues
+                              # with extra arguments.
+
+    import pcs
+    from pcs import PcapConnector, Chain, Matcher, EOF, unpack_frame
+    from pcs import bpfprog
+    from pcs.packets.ethernet import ethernet
+    from pcs.packets.ipv4 import ipv4
+    from pcs.packets.tcp import tcp
+    from pcs.packets.udp import udp
+    from pcs.packets.icmpv4 import icmpv4
+    from pcs.packets.payload import payload
+
+def frames(filename):
+    """Return the bytes of each frame of a savefile and its chain."""
+    file = PcapConnector(filename)
+    result = []
+    for (ts, bytes) in file.read_batch(-1, decode = False):
+        result.append((bytes, unpack_frame(bytes, file.dlink, ts).chain()))
+    file.close()
+    return result
+
+class bpfprogTestCase(unittest.TestCase):
+    def check(self, patterns, filenames):
+        """Compile the patterns and run the program over the frames of
+        some savefiles, which must accept every frame the patterns
+        match.  Return the number of frames accepted."""
+        program = bpfprog.compile(patterns)
+        matcher = Matcher(patterns)
+        accepted = 0
+        for filename in filenames:
+            for (bytes, chain) in frames(filename):
+                result = bpfprog.execute(program, bytes)
+                if matcher.match(chain) is not None:
+                    self.assert_(result != 0,
+                                 "%s: %s" % (filename, repr(bytes[:64])))
+                if result:
+                    accepted += 1
+        return accepted
+
+    def test_compile_fields(self):
+        """Byte aligned fields, sub-byte fields, single bits and strings
+        are tested with as few loads as may be."""
+        pattern = ethernet(dst = "\x00\x10\xdb\x3a\x3a\x77") / \
+                  ipv4(version = 4, ttl = 64)
+        program = bpfprog.compile([pattern])
+        loads = [k for (code, jt, jf, k) in program
+                 if code & 0x07 == bpfprog.BPF_LD]
+        # dst in a word and a half word, type, version, ttl and protocol
+        self.assertEqual(loads, [0, 4, 12, 14, 22])
+        self.assertEqual(self.check([pattern], ["etherping.out"]), 5)
+
+        syn = ethernet() / ipv4() / tcp(syn = 1)
+        program = bpfprog.compile([syn])
+        self.assert_((bpfprog.BPF_JMP|bpfprog.BPF_JSET|bpfprog.BPF_K,
+                      0, 1, 2) in program)
+        self.assertEqual(self.check([syn], ["wwwtcp.out"]), 2)
+
+    def test_compile_variable(self):
+        """Fields after an IPv4 header are found through its length, and
+        fields after a TCP header through its offset."""
+        pattern = ethernet() / ipv4() / tcp(dport = 80)
+        program = bpfprog.compile([pattern])
+        self.assert_((bpfprog.BPF_LDX|bpfprog.BPF_MSH|bpfprog.BPF_B,
+                      0, 0, 14) in program)
+        self.assertEqual(self.check([pattern], ["wwwtcp.out"]), 9)
+
+        # Only the start of a payload is tested.
+        get = ethernet() / ipv4() / tcp() / payload(payload = "GET ")
+        self.assertEqual(self.check([get], ["wwwtcp.out"]), 1)
+
+    def test_compile_many(self):
+        """Patterns which start with the same tests share them, and a
+        packet too short for one pattern may still match another."""
+        patterns = [ethernet() / ipv4() / tcp(ack = 1) /
+                    payload(payload = "GET"),
+                    ethernet() / ipv4() / tcp(ack = 1, dport = 80),
+                    ethernet() / ipv4() / icmpv4(type = 8),
+                    ethernet() / ipv4() / udp(dport = 53),
+                    EOF()]
+        program = bpfprog.compile(patterns)
+        types = [k for (code, jt, jf, k) in program
+                 if code == bpfprog.BPF_LD|bpfprog.BPF_H|bpfprog.BPF_ABS
+                 and k == 12]
+        self.assertEqual(len(types), 1)
+        self.assertEqual(self.check(patterns, ["etherping.out", "wwwtcp.out",
+                                               "dns.out", "tcp_noopts.pcap"]),
+                         5 + 8 + 1)
+
+        self.assertEqual(bpfprog.compile([EOF()]), None)
+        self.assertEqual(bpfprog.compile([Chain([ethernet()])], 96),
+                         [(bpfprog.BPF_RET|bpfprog.BPF_K, 0, 0, 96)])
+
+    def test_compile_long(self):
+        """A program too long for the jumps of its tests to reach the
+        end goes through trampolines."""
+        patterns = [ethernet() / ipv4() / udp(sport = 1000 + i, dport = 53)
+                    for i in xrange(40)]
+        program = bpfprog.compile(patterns)
+        self.assert_(len(program) > 256)
+        self.assert_((bpfprog.BPF_JMP|bpfprog.BPF_JA) in
+                     [code for (code, jt, jf, k) in program])
+        bpfprog.verify(program)
+        patterns.append(ethernet() / ipv4() / udp(dport = 53))
+        self.assertEqual(self.check(patterns, ["dns.out"]), 1)
+
+    def test_optimize(self):
+        """The optimizer removes loads of values already loaded, jumps
+        to jumps, tests whose outcome is known and code which cannot be
+        reached, and the program does what it did."""
+        from pcs.bpfprog import BPF_LD, BPF_LDX, BPF_ALU, BPF_JMP, BPF_RET, \
+             BPF_MISC, BPF_H, BPF_B, BPF_ABS, BPF_IND, BPF_IMM, BPF_MSH, \
+             BPF_K, BPF_A, BPF_JA, BPF_JEQ, BPF_ADD, BPF_TAX
+        ldh = BPF_LD|BPF_H|BPF_ABS
+        ldb = BPF_LD|BPF_B|BPF_ABS
+        jeq = BPF_JMP|BPF_JEQ|BPF_K
+        ja = BPF_JMP|BPF_JA
+        ret = BPF_RET|BPF_K
+        program = [(ldh, 0, 0, 12),
+                   (jeq, 1, 0, 0x800),
+                   (ja, 0, 0, 9),               # to a jump to ret 0
+                   (ldh, 0, 0, 12),             # already in A
+                   (jeq, 0, 7, 0x800),          # known to be true
+                   (BPF_LDX|BPF_B|BPF_MSH, 0, 0, 14),
+                   (BPF_LDX|BPF_B|BPF_MSH, 0, 0, 14),
+                   (ldb, 0, 0, 23),
+                   (jeq, 0, 2, 1),
+                   (BPF_LD|BPF_B|BPF_IND, 0, 0, 14),
+                   (jeq, 1, 0, 8),
+                   (ja, 0, 0, 1),
+                   (ret, 0, 0, 96),
+                   (ret, 0, 0, 0),
+                   (ret, 0, 0, 1)]              # cannot be reached
+        optimized = bpfprog.optimize(program)
+        bpfprog.verify(program)
+        bpfprog.verify(optimized)
+        self.assertEqual(len(optimized), 9)
+        self.assertEqual(len([k for (code, jt, jf, k) in optimized
+                              if code == ldh]), 1)
+        accepted = 0
+        for (bytes, chain) in frames("etherping.out"):
+            result = bpfprog.execute(program, bytes)
+            self.assertEqual(bpfprog.execute(optimized, bytes), result)
+            if result:
+                accepted += 1
+        self.assertEqual(accepted, 5)
+
+        # A jump made far by threading goes through a trampoline.
+        far = [(ldh, 0, 0, 12),
+               (jeq, 1, 0, 0x800),
+               (ja, 0, 0, 300)] + \
+              [(BPF_ALU|BPF_ADD|BPF_K, 0, 0, 1)] * 300 + \
+              [(BPF_RET|BPF_A, 0, 0, 0)]
+        optimized = bpfprog.optimize(far)
+        bpfprog.verify(optimized)
+        self.assertEqual(optimized[1][:3], (jeq, 1, 0))
+        self.assertEqual(optimized[2][0], ja)
+        for (bytes, chain) in frames("etherping.out")[:2]:
+            self.assertEqual(bpfprog.execute(optimized, bytes),
+                             bpfprog.execute(far, bytes))
+
+    def test_verify(self):
+        """The verifier finds programs which are wrong."""
+        from pcs.bpfprog import BPF_LD, BPF_ST, BPF_ALU, BPF_JMP, BPF_RET, \
+             BPF_W, BPF_MEM, BPF_K, BPF_JEQ, BPF_DIV, BPF_MAXINSNS
+        ret = (BPF_RET|BPF_K, 0, 0, 96)
+        bpfprog.verify([ret])
+        bpfprog.verify([(BPF_ST, 0, 0, 3), (BPF_LD|BPF_W|BPF_MEM, 0, 0, 3),
+                        ret])
+        for wrong in [[],
+                      [ret] * (BPF_MAXINSNS + 1),
+                      [(BPF_JMP|BPF_JEQ|BPF_K, 0, 1, 0), ret],
+                      [(BPF_ALU|BPF_DIV|BPF_K, 0, 0, 0), ret],
+                      [(BPF_LD|BPF_W|BPF_MEM, 0, 0, 3), ret],
+                      [(BPF_ST, 0, 0, 16), ret],
+                      [(0x07 | 0x40, 0, 0, 0), ret],
+                      [(BPF_LD|BPF_W|BPF_MEM, 0, 0, 0)]]:
+            self.assertRaises(ValueError, bpfprog.verify, wrong)
+
+if __name__ == '__main__':
+    unittest.main()
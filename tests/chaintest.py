@@ -48,6 +48,7 @@ if __name__ == '__main__':
     import pcs
     from pcs.packets.ethernet import ethernet
     from pcs.packets.ipv4 import ipv4
+    import pcs.packets.payload
     from pcs import *
 
 
@@ -94,6 +95,56 @@ class chainTestCase(unittest.TestCase):
                          "strings not equal \ngot\n'%s'\nexpected\n'%s'" %
                          (string, test_string))
 
+    def test_chain_bytes(self):
+        """The bytes of a chain are put together when they are asked
+        for, and again after packets are added to the chain."""
+        ether = ethernet()
+        ether.src = "\x00\x00\x00\x00\x00\x01"
+        ip = ipv4(ttl = 64)
+        chain = ether / ip
+        self.assert_(chain._bytes is None)
+        self.assertEqual(chain.bytes, ether.bytes + ip.bytes)
+        self.assert_(chain.bytes is chain.bytes)
+
+        payload = pcs.packets.payload.payload("data")
+        chain.append(payload)
+        self.assert_(chain._bytes is None)
+        self.assertEqual(chain.bytes, ether.bytes + ip.bytes + "data")
+
+        ip.ttl = 32
+        self.assertNotEqual(chain.bytes[22], chr(32))
+        chain.encode()
+        self.assertEqual(chain.bytes[22], chr(32))
+
+    def test_chain_fixup(self):
+        """Fixing up a chain sets the lengths and checksums of each of
+        its packets, counting the packets they carry."""
+        from pcs.packets.ipv4 import pseudoipv4
+        from pcs.packets.tcp import tcp
+        from pcs.packets.udp import udp
+        from socket import IPPROTO_TCP, IPPROTO_UDP
+        for (transport, proto) in [(udp(sport = 53, dport = 1024),
+                                    IPPROTO_UDP),
+                                   (tcp(sport = 80, dport = 1024, syn = 1),
+                                    IPPROTO_TCP)]:
+            ip = ipv4(ttl = 64, protocol = proto, src = 0x7f000001,
+                      dst = 0x7f000002)
+            data = pcs.packets.payload.payload("odd")
+            chain = ethernet() / ip / transport / data
+            chain.fixup()
+            self.assertEqual(ip.length, 20 + len(transport.bytes) + 3)
+            self.assertEqual(ipv4.ipv4_cksum(ip.bytes), 0)
+            pip = pseudoipv4()
+            pip.src = ip.src
+            pip.dst = ip.dst
+            pip.protocol = proto
+            pip.length = len(transport.bytes) + 3
+            self.assertEqual(ipv4.ipv4_cksum(pip.bytes + transport.bytes +
+                                             "odd"), 0)
+            self.assertEqual(chain.bytes,
+                             "".join([p.bytes for p in chain.packets]))
+            self.assert_(chain._fixup is None)
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,251 @@
+# Copyright (c) 2013, Neville-Neil Consulting
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# Neither the name of Neville-Neil Consulting nor the names of its 
+# contributors may be used to endorse or promote products derived from 
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# File: $Id:$
+#
+# Author: George V. Neville-Neil
+#
+# Description: A test of the compiled layout codecs in PCS.
+
+import unittest
+import sys
+
+if __name__ == '__main__':
+
+    if "-l" in sys.argv:
+        sys.path.insert(0, "../") # Look locally first
+        sys.argv.remove("-l") # Needed because unittest has issues
+                              # with extra arguments.
+
+    import pcs
+    from pcs.packets.ipv4 import *
+    from pcs.packets.tcp import *
+    from pcs.packets.udp import *
+
+def walk_decode(layout, bytes):
+    """Decode a layout one field at a time, as PCS used to."""
+    curr = 0
+    byteBR = 8
+    for field in layout:
+        if curr > len(bytes):
+            break
+        [value, curr, byteBR] = field.decode(bytes, curr, byteBR)
+    return [field.value for field in layout]
+
+def walk_encode(layout, fieldnames):
+    """Encode a layout one field at a time, as PCS used to."""
+    byteBR = 8
+    byte = 0
+    bytearray = []
+    for field in layout:
+        [byte, byteBR] = field.encode(bytearray, fieldnames[field.name].value,
+                                      byte, byteBR)
+    return ''.join(bytearray)
+
+class codecTestCase(unittest.TestCase):
+    def test_codec_cache(self):
+        """Packets of the same class share one compiled codec."""
+        self.assertTrue(udp()._codec is udp()._codec)
+        self.assertTrue(ipv4()._codec is not udp()._codec)
+
+    def test_codec_ipv4(self):
+        """Sub-byte fields are extracted from their enclosing words."""
+        bytes = "\x46\x10\x00\x20\x12\x34\x40\x00\x40\x11\xab\xcd" \
+                "\x7f\x00\x00\x01\x7f\x00\x00\x02\x94\x04\x00\x00" \
+                "\x00\x00\x00\x00\x00\x00\x00\x00"
+        ip = ipv4(bytes)
+        self.assertEqual(ip.version, 4)
+        self.assertEqual(ip.hlen, 6)
+        self.assertEqual(ip.flags, IP_DF)
+        self.assertEqual(ip.offset, 0)
+        self.assertEqual(ip.protocol, 17)
+        self.assertEqual(ip.src, 0x7f000001)
+        self.assertEqual(ip.dst, 0x7f000002)
+        self.assertEqual(len(ip.options), 1)
+        self.assertEqual(ip.getbytes(), bytes[0:24])
+
+    def test_codec_tcp_flags(self):
+        """The TCP flag bits survive a round trip through the codec."""
+        packet = tcp(sport = 80, dport = 1024, syn = 1, ack = 1, ns = 1,
+                     window = 65535)
+        bytes = packet.getbytes()
+        self.assertEqual(bytes[12:14], "\x51\x12")
+        new_packet = tcp(bytes)
+        for field in packet._layout:
+            self.assertEqual(getattr(packet, field.name),
+                             getattr(new_packet, field.name),
+                             "%s not equal" % field.name)
+
+    def test_codec_matches_fields(self):
+        """The codec decodes and encodes exactly as walking the fields."""
+        import random
+        random.seed(1)
+        for packet in [ipv4(), tcp(), udp()]:
+            for length in [0, 3, 8, 19, 20, 40]:
+                bytes = ''.join([chr(random.randrange(256))
+                                 for i in xrange(length)])
+                if packet._declared is None:
+                    layout = packet._layout
+                    packet._codec.decode(layout, bytes)
+                    values = [field.value for field in layout]
+                    encoded = packet._codec.encode(layout,
+                                                   packet._fieldnames)
+                else:
+                    # The declared fields are shared, so walk copies
+                    # of them holding the packet's values.
+                    packet._codec.decode_values(packet._declared,
+                                                packet._values, bytes)
+                    values = [packet._getvalue(field.name)
+                              for field in packet._layout]
+                    encoded = packet._codec.encode_values(packet._declared,
+                                                          packet._values)
+                    layout = [packet._field(field.name).__copy__()
+                              for field in packet._layout]
+                fieldnames = dict([(field.name, field) for field in layout])
+                self.assertEqual(values, walk_decode(layout, bytes))
+                self.assertEqual(encoded, walk_encode(layout, fieldnames))
+
+    def test_codec_wide_field(self):
+        """Fields which are not 1, 2, 4 or 8 bytes wide are compiled."""
+        packet = pcs.Packet([pcs.Field("a", 4), pcs.Field("b", 44),
+                             pcs.Field("c", 72)])
+        packet.a = 0xf
+        packet.b = 0x123456789ab
+        packet.c = 0x0102030405060708ff
+        bytes = packet.getbytes()
+        self.assertEqual(bytes, "\xf1\x23\x45\x67\x89\xab"
+                                "\x01\x02\x03\x04\x05\x06\x07\x08\xff")
+        new_packet = pcs.Packet([pcs.Field("a", 4), pcs.Field("b", 44),
+                                 pcs.Field("c", 72)], bytes)
+        self.assertEqual(new_packet.a, 0xf)
+        self.assertEqual(new_packet.b, 0x123456789ab)
+        self.assertEqual(new_packet.c, 0x0102030405060708ff)
+
+    def test_declared_layout(self):
+        """Packets of a class which declares its layout keep the values
+        of their fields in a list of their own, and fields are got and
+        set through properties."""
+        class pair(pcs.Packet):
+            _layout = pcs.Layout([pcs.Field("a", 8, default = 1),
+                                  pcs.Field("b", 8, discriminator = True)])
+            def __init__(self, bytes = None, **kv):
+                pcs.Packet.__init__(self, None, bytes, **kv)
+
+        self.assertTrue(isinstance(pair.__dict__['a'], property))
+        first = pair("\x05\x06")
+        second = pair(b = 7)
+        self.assertEqual((first.a, first.b), (5, 6))
+        self.assertEqual((second.a, second.b), (1, 7))
+        self.assertEqual(second.getbytes(), "\x01\x07")
+        self.assertTrue(first._layout is pair._layout)
+        self.assertTrue(first._values is not second._values)
+        self.assertTrue(first._codec is pair._codec)
+        self.assertTrue(second._discriminator is pair._layout[1])
+        self.assertTrue(second._discriminator_inited)
+        self.assertEqual(second.sizeof(), 2)
+        # No field is copied for a packet until a compare function is
+        # attached to it, and its attributes are kept in slots rather
+        # than in a dictionary of its own.
+        import gc
+        self.assertTrue('_values' in pair.__slots__)
+        for packet in [first, second, udp(bytes = "\x00" * 8), tcp()]:
+            self.assertEqual(packet._fields, None)
+            for value in gc.get_referents(packet):
+                self.assertFalse(isinstance(value, (pcs.Field, dict)))
+
+        first.decode("\x08\x09")
+        self.assertEqual((first.a, first.b), (8, 9))
+        self.assertEqual((second.a, second.b), (1, 7))
+        first.a = 3
+        self.assertEqual(first.getbytes(), "\x03\x09")
+        self.assertRaises(pcs.FieldError, first.__add__, [pcs.Field("c", 8)])
+
+    def test_declared_ipv4_tcp(self):
+        """IPv4 and TCP declare their layouts, option lists included, and
+        each packet gets an option list of its own."""
+        for cls in [ipv4, tcp]:
+            self.assertTrue(cls._declared is not None)
+            self.assertTrue(isinstance(cls.__dict__['options'], property))
+        self.assertTrue(ipv4._discriminator is ipv4._layout[8])
+
+        bytes = "\x46\x00\x00\x18\x00\x01\x00\x00\x01\xfd\x00\x00" \
+                "\x0a\x00\x00\x01\xe0\x00\x00\x16\x94\x04\x00\x00"
+        ip = ipv4(bytes)
+        self.assertEqual((ip.hlen, ip.ttl, ip.protocol), (6, 1, 253))
+        self.assertEqual([option.name for option in ip.options._options],
+                         ["ra"])
+        self.assertEqual(ip.getbytes(), bytes)
+        self.assertEqual(len(ipv4().options), 0)
+        self.assertTrue(ip.options is not ipv4._layout[12])
+
+        bytes = "\x00\x50\x04\x00\x00\x00\x00\x01\x00\x00\x00\x00" \
+                "\x70\x02\xff\xff\x00\x00\x00\x00\x02\x04\x05\xb4" \
+                "\x01\x01\x00\x00"
+        segment = tcp(bytes)
+        self.assertEqual((segment.sport, segment.offset, segment.syn),
+                         (80, 7, 1))
+        self.assertEqual([option.name for option in segment.options._options],
+                         ["mss", "nop", "nop", "end", "end"])
+        self.assertEqual(segment.getbytes(), bytes)
+        self.assertEqual(len(tcp().options), 0)
+
+        # The discriminator is filled in from the packet which follows
+        # unless it was set by the caller.
+        chain = ipv4() / tcp()
+        self.assertEqual(chain.packets[0].protocol, 6)
+        chain = ipv4(protocol = 99) / tcp()
+        self.assertEqual(chain.packets[0].protocol, 99)
+
+    def test_declared_compare(self):
+        """Assigning a field of a declared packet makes matches() compare
+        it, and a compare function attached through _fieldnames is kept
+        on a copy of the field made for that packet alone."""
+        pattern = udp(dport = 53)
+        self.assertEqual(pattern._fields, None)
+        self.assertTrue(pattern.matches(udp(sport = 1, dport = 53)))
+        self.assertFalse(pattern.matches(udp(sport = 1, dport = 54)))
+
+        field = pattern._fieldnames["sport"]
+        self.assertTrue(field is pattern._fieldnames["sport"])
+        self.assertEqual(pattern._fields.keys(), ["sport"])
+        field.compare = lambda lp, lf, rp, rf: rf.value > 1000
+        self.assertTrue(pattern.matches(udp(sport = 2000, dport = 53)))
+        self.assertFalse(pattern.matches(udp(sport = 20, dport = 53)))
+        self.assertEqual(udp()._fields, None)
+
+        pattern.wildcard_mask(["dport"])
+        self.assertTrue(pattern.matches(udp(sport = 2000, dport = 1)))
+        pattern.wildcard_mask()
+        self.assertTrue(pattern.matches(udp(sport = 20, dport = 1)))
+        pattern.wildcard_mask(["dport"], False)
+        self.assertFalse(pattern.matches(udp(dport = 1)))
+
+if __name__ == '__main__':
+    unittest.main()
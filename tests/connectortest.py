@@ -190,6 +190,54 @@ class pcapTestCase(unittest.TestCase):
         assert (ipnew != None)
         self.assertEqual(ip, ipnew, "packets should be equal but are not")
 
+    def test_expect_matcher(self):
+        """A compiled list of patterns finds the same pattern as matching
+        each pattern in turn, and expect() uses it."""
+        chains = [p.chain() for p in
+                  PcapConnector("etherping.out").read_batch(-1)]
+        ids = [c.packets[1].id for c in chains]
+        patterns = [EOF()]
+        for id in ids[3:] + ids[:3]:
+            patterns.append(Chain([ethernet(), ipv4(id = id)]))
+        # A pattern with a compare function of its own, which comes
+        # before the patterns for the ids it matches.
+        odd = ipv4()
+        odd._fieldnames["id"].compare = lambda lp, lf, rp, rf: rf.value & 1
+        patterns.insert(4, Chain([ethernet(), odd]))
+        patterns.insert(2, Chain([ethernet(), ipv4(id = ids[5]),
+                                  icmpv4(type = 3)]))
+
+        matcher = Matcher(patterns)
+        for c in chains:
+            first = None
+            for j in xrange(len(patterns)):
+                if isinstance(patterns[j], Chain) and patterns[j].matches(c):
+                    first = j
+                    break
+            self.assertEqual(matcher.match(c), first)
+        self.assertEqual(matcher.match(Chain([localhost()])), None)
+
+        file = PcapConnector("etherping.out")
+        self.assertEqual(file.expect(patterns, limit = len(chains)),
+                         matcher.match(chains[0]))
+        self.assertEqual(file.matches[0].packets[1].id, ids[0])
+
+    def test_expect_prefilter(self):
+        """expect() filters out the packets which cannot match while it
+        runs, and lets every packet through once it returns."""
+        from pcs.packets.icmpv4 import ICMP_ECHO, ICMP_ECHOREPLY
+        chains = [p.chain() for p in
+                  PcapConnector("etherping.out").read_batch(-1)]
+        types = [c.packets[2].type for c in chains]
+        self.assertEqual(types[0], ICMP_ECHO)
+
+        file = PcapConnector("etherping.out")
+        reply = ethernet() / ipv4() / icmpv4(type = ICMP_ECHOREPLY)
+        self.assertEqual(file.expect([reply], limit = 1), 0)
+        self.assertEqual(file.matches[0], chains[types.index(ICMP_ECHOREPLY)])
+        self.assertEqual(file.readpkt().chain(),
+                         chains[types.index(ICMP_ECHOREPLY) + 1])
+
 if __name__ == '__main__':
     unittest.main()
 
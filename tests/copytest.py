@@ -409,5 +409,46 @@ class copyTestCase(unittest.TestCase):
         self.assert_(id(p2._fieldnames['id']) != id(p1._fieldnames['id']))
         pass
 
+    def test_clone_packet(self):
+        from pcs.packets.ipv4 import ipv4
+        from pcs.packets.udp import udp
+        for p1 in [ipv4(id=123), udp(sport=53)]:
+            bytes = p1.getbytes()
+            p2 = p1.clone()
+            self.assert_(isinstance(p2, p1.__class__))
+            storage = lambda p: p._declared and p._values or p._fieldnames
+            self.assert_(storage(p2) is storage(p1))
+            self.assert_(p2.getbytes() is bytes)
+            self.assert_(p2.data is None)
+
+            # Changing either packet copies its values and leaves the
+            # other one alone.
+            p3 = p1.clone()
+            p2._setfield(p1._layout[1].name, 7)
+            self.assert_(storage(p2) is not storage(p1))
+            self.assertNotEqual(p2.getbytes(), bytes)
+            self.assertEqual(p1.getbytes(), bytes)
+            self.assertEqual(p3.getbytes(), bytes)
+
+            p1.decode(p2.getbytes())
+            self.assertEqual(p1, p2)
+            self.assertEqual(p3.getbytes(), bytes)
+
+    def test_clone_chain(self):
+        from pcs.packets.ethernet import ethernet
+        from pcs.packets.ipv4 import ipv4
+        c1 = ethernet() / ipv4(ttl=64)
+        c1.packets[0].data = c1.packets[1]
+        c2 = c1.clone()
+        self.assert_(c2.packets[0] is not c1.packets[0])
+        self.assert_(c2.packets[1]._head is c2)
+        self.assert_(c2.packets[0].data is c2.packets[1])
+        self.assertEqual(c2.bytes, c1.bytes)
+
+        c2.packets[1].ttl = 32
+        c2.encode()
+        self.assertEqual(c1.packets[1].ttl, 64)
+        self.assertNotEqual(c2.bytes, c1.bytes)
+
 if __name__ == '__main__':
     unittest.main()
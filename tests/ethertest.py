@@ -175,6 +175,41 @@ class etherTestCase(unittest.TestCase):
                          "strings are not equal \nexpected %s \ngot %s " %
                          (test_string, string))
 
+    def test_ethernet_lazy(self):
+        """A lazy packet must not decode the layers above it until its
+        data is first looked at, and must then decode them exactly as
+        an eager packet does."""
+        file = PcapConnector("etherping.out", lazy = True)
+        ether = file.readpkt()
+        self.assert_(ether._deferred is not None)
+        self.assert_(ether._data is None)
+
+        ip = ether.data
+        self.assert_(ether._deferred is None)
+        self.assert_(ether.data is ip)
+        self.assert_(ip._deferred is not None)
+
+        eager = PcapConnector("etherping.out").readpkt()
+        self.assertEqual(ether.chain(), eager.chain(),
+                         "lazy and eager chains are not equal")
+
+    def test_ethernet_buffer(self):
+        """The layers of a decoded frame must refer to the frame's bytes
+        rather than copies of them, and hand out strings of their own
+        when their bytes are asked for."""
+        file = PcapConnector("etherping.out")
+        ether = file.readpkt()
+        ip = ether.data
+        icmp = ip.data
+        self.assert_(type(ip._bytes) is buffer)
+        self.assert_(type(icmp._bytes) is buffer)
+
+        bytes = ip.tobytes()
+        self.assert_(type(bytes) is str)
+        self.assertEqual(len(bytes), ip.sizeof())
+        self.assertEqual(bytes, ether.chain().bytes[14:14 + ip.sizeof()])
+        self.assert_(ip.bytes is bytes)
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -163,6 +163,19 @@ class ipTestCase(unittest.TestCase):
 
         self.assertEqual(packet.timestamp, ip.timestamp, "lower and upper layer timestamps are different but should not be")
 
+    def test_ipv4_time_ns(self):
+        """Timestamps are integer nanoseconds, and a packet decoded from
+        bytes without a timestamp gives its own to the layers in it."""
+        file = PcapConnector("loopping.out")
+        packet = file.readpkt()
+        self.assertEqual(packet.chain().timestamp, packet.timestamp)
+        self.assert_(isinstance(packet.timestamp, (int, long)))
+
+        ip = ipv4(packet.data.getbytes())
+        self.assert_(isinstance(ip.timestamp, (int, long)))
+        self.assertEqual(ip.data.timestamp, ip.timestamp)
+        self.assertEqual(ipv4(packet.data.getbytes(), 5).data.timestamp, 5)
+
     def test_ipv4_ra(self):
         # create one packet with the IP Router Alert option,
         # and check that it is as you'd expect.
@@ -195,6 +208,55 @@ class ipTestCase(unittest.TestCase):
 
 	self.assertEqual(expected, gotttted, "packet bytes not expected")
 
+    def test_ipv4_needencode(self):
+        """Reading fields must not force the packet to be encoded again,
+        while setting a field or changing the options in place must."""
+        ip = ipv4(src = inet_atol("192.0.2.1"), dst = inet_atol("192.0.2.2"))
+        bytes = ip.getbytes()
+        self.assertEqual(ip._needencode, False)
+
+        src = ip.src
+        ttl = ip.ttl
+        self.assertEqual(ip._needencode, False)
+        self.assert_(ip.getbytes() is bytes)
+
+        ip.ttl = 1
+        self.assertEqual(ip._needencode, True)
+        self.assertEqual(ip.getbytes()[8], "\x01")
+
+        bytes = ip.getbytes()
+        ip.options.append(ipv4opt(IPOPT_RA))
+        self.assertEqual(ip._needencode, True)
+        self.assertEqual(len(ip.getbytes()), len(bytes) + 4)
+
+    def test_ipv4_cksum(self):
+        """The checksum must match the one worked through in RFC 1071,
+        handle odd lengths, be the same whether taken one buffer or
+        many at a time, and be updated in place as in RFC 1624."""
+        from pcs.packets import inetcksum
+        bytes = "\x00\x01\xf2\x03\xf4\xf5\xf6\xf7"
+        self.assertEqual(ipv4.ipv4_cksum(bytes), ~0xddf2 & 0xffff)
+        self.assertEqual(ipv4.ipv4_cksum(bytes + "\x01"),
+                         ipv4.ipv4_cksum(bytes + "\x01\x00"))
+        self.assertEqual(ipv4.ipv4_cksum(buffer(bytes, 2)),
+                         ipv4.ipv4_cksum(bytes[2:]))
+
+        list = [bytes, bytes[1:], "", bytes * 3]
+        self.assertEqual(inetcksum.cksum_many(list),
+                         [ipv4.ipv4_cksum(b) for b in list])
+
+        ip = ipv4(ttl = 64, protocol = 17, src = inet_atol("192.0.2.1"),
+                  dst = inet_atol("192.0.2.2"))
+        ip.calc_checksum()
+        checksum = ip.checksum
+        ip.ttl = 63
+        ip.dst = inet_atol("198.51.100.7")
+        checksum = inetcksum.update(checksum, 64 << 8 | 17, 63 << 8 | 17)
+        checksum = inetcksum.update(checksum, inet_atol("192.0.2.2"),
+                                    ip.dst, 32)
+        ip.calc_checksum()
+        self.assertEqual(checksum, ip.checksum)
+
     def test_IN_LINKLOCAL(self):
 	linklocal = inet_atol("169.254.12.34")
 	self.assert_(IN_LINKLOCAL(linklocal) == True)
@@ -0,0 +1,92 @@
+# Copyright (c) 2005, Neville-Neil Consulting
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# Neither the name of Neville-Neil Consulting nor the names of its 
+# contributors may be used to endorse or promote products derived from 
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# File: $Id: $
+#
+# Author: George V. Neville-Neil
+#
+# Description: This module tests cutting a pcap savefile into shards
+# and analyzing them in parallel.
+
+import unittest
+
+import sys
+
+if __name__ == '__main__':
+
+    if "-l" in sys.argv:
+        sys.path.insert(0, "../") # Look locally first
+        sys.argv.remove("-l") # Needed because unittest has issues
+                              # with extra arguments.
+
+    from pcs import PcapConnector
+    from pcs.parallel import *
+
+def timestamps(packets):
+    return [p.timestamp for p in packets]
+
+def concat(a, b):
+    return a + b
+
+class parallelTestCase(unittest.TestCase):
+    def test_shards(self):
+        """The shards must cover every record of the file, in order,
+        each exactly once."""
+        file = PcapConnector("etherping.out")
+        expected = [p.timestamp for p in file.read_batch(-1)]
+
+        for n in [1, 2, 3, 100]:
+            cuts = shards("etherping.out", n)
+            self.assert_(len(cuts) <= n)
+            self.assertEqual(cuts[0][0], FILE_HEADER_LEN)
+            for i in range(1, len(cuts)):
+                self.assertEqual(cuts[i - 1][1], cuts[i][0])
+            got = []
+            for (start, end) in cuts:
+                got += timestamps(packets("etherping.out", start, end))
+            self.assertEqual(got, expected)
+
+    def test_run(self):
+        """Running over several processes must give the same result as
+        running over the file in one go."""
+        file = PcapConnector("etherping.out")
+        expected = [p.timestamp for p in file.read_batch(-1)]
+        got = run("etherping.out", timestamps, concat, processes = 2)
+        self.assertEqual(got, expected)
+        got = run("etherping.out", timestamps, concat, initial = [0],
+                  processes = 2)
+        self.assertEqual(got, [0] + expected)
+
+    def test_not_pcap(self):
+        """A file which is not a pcap savefile must be refused."""
+        self.assertRaises(PcapFormatError, shards, "paralleltest.py", 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -50,7 +50,9 @@ if __name__ == '__main__':
 
     from pcs import PcapConnector
     from pcs import PcapDumpConnector
+    from pcs import MmapPcapConnector
     from pcs.packets.ethernet import *
+    from pcs.pcap import DLT_EN10MB
 
 class pcapTestCase(unittest.TestCase):
     def test_pcap_read(self):
@@ -64,6 +66,153 @@ class pcapTestCase(unittest.TestCase):
                          "src not equal %s" % ether.dst)
         self.assertEqual(ether.type, 0x800, "type not equal %d" % ether.type)
 
+    def test_pcap_read_batch(self):
+        """Reading a savefile in batches must give the same packets as
+        reading it one packet at a time, and stop at its end."""
+        file = PcapConnector("etherping.out")
+        single = []
+        while True:
+            try:
+                single.append(file.readpkt())
+            except:
+                break
+
+        file = PcapConnector("etherping.out")
+        batches = list(file.iter_batches(3))
+        self.assertEqual([len(b) for b in batches[:-1]],
+                         [3] * (len(batches) - 1))
+        batched = [p for b in batches for p in b]
+        self.assertEqual(len(batched), len(single))
+        for (p1, p2) in zip(batched, single):
+            self.assertEqual(p1.chain(), p2.chain())
+            self.assertEqual(p1.timestamp, p2.timestamp)
+        self.assertEqual(file.read_batch(3), [])
+
+        file = PcapConnector("etherping.out")
+        (ts, bytes) = file.read_batch(1, decode = False)[0]
+        self.assertEqual(ts, single[0].timestamp)
+        self.assertEqual(bytes, single[0].chain().bytes)
+
+
+    def test_pcap_precision(self):
+        """A savefile opened for nanosecond timestamps gives exactly the
+        same times as one opened for microseconds, as integers."""
+        from pcs.pcap import PCAP_TSTAMP_PRECISION_NANO
+        file = PcapConnector("etherping.out")
+        expected = file.read_batch(-1)
+        file = PcapConnector("etherping.out",
+                             tstamp_precision = PCAP_TSTAMP_PRECISION_NANO)
+        self.assertEqual(file.file.tstamp_precision,
+                         PCAP_TSTAMP_PRECISION_NANO)
+        got = file.read_batch(-1)
+        self.assertEqual(len(got), len(expected))
+        self.assert_(isinstance(got[0].timestamp, (int, long)))
+        for (p1, p2) in zip(got, expected):
+            self.assertEqual(p1.timestamp, p2.timestamp)
+        self.assertRaises(ValueError, PcapConnector, "etherping.out",
+                          tstamp_precision = 2)
+
+    def test_pcap_ring(self):
+        """Reading a savefile through a capture ring must give the same
+        packets as reading it in batches, and stop at its end."""
+        file = PcapConnector("etherping.out")
+        expected = file.read_batch(-1)
+
+        file = PcapConnector("etherping.out")
+        file.start_ring(4)
+        self.assertRaises(OSError, file.start_ring)
+        got = [p for b in file.iter_batches(3) for p in b]
+        self.assertEqual(len(got), len(expected))
+        for (p1, p2) in zip(got, expected):
+            self.assertEqual(p1.chain(), p2.chain())
+            self.assertEqual(p1.timestamp, p2.timestamp)
+        self.assertEqual(file.read_batch(3), [])
+        file.close()
+
+    def test_pcap_mmap(self):
+        """Reading a savefile through mmap must give the same packets
+        as reading it through pcap, in order and by number."""
+        from pcs.pcap import DLT_EN10MB
+        file = PcapConnector("etherping.out")
+        expected = file.read_batch(-1)
+
+        file = MmapPcapConnector("etherping.out")
+        self.assertEqual(len(file), len(expected))
+        self.assertEqual(file.dlink, DLT_EN10MB)
+        self.assertEqual(file.dloff, 14)
+        for p in expected:
+            got = file.readpkt()
+            self.assertEqual(got.chain(), p.chain())
+            self.assertEqual(got.timestamp, p.timestamp)
+        self.assertEqual(file.next(), None)
+        self.assertEqual(file.read_batch(3), [])
+
+        last = len(expected) - 1
+        self.assertEqual(file[last].chain(), expected[last].chain())
+        self.assertEqual(file[0].chain(), expected[0].chain())
+        (ts, bytes) = file.record(1)
+        self.assert_(type(bytes) is buffer)
+        self.assertEqual(str(bytes), expected[1].chain().bytes)
+
+        file.seek(1)
+        self.assertEqual(file.tell(), 1)
+        batches = list(file.iter_batches(4))
+        self.assertEqual(len([p for b in batches for p in b]), last)
+        self.assertRaises(IndexError, file.seek, len(expected) + 1)
+        file.close()
+
+    def test_pcap_mmap_filter(self):
+        """A BPF program run over a whole mapped savefile accepts the
+        same packets as it does one at a time."""
+        from pcs import bpfprog
+        from pcs.packets.ipv4 import ipv4
+        from pcs.packets.icmpv4 import icmpv4, ICMP_ECHOREPLY
+        pattern = ethernet() / ipv4() / icmpv4(type = ICMP_ECHOREPLY)
+        program = bpfprog.compile([pattern])
+        file = MmapPcapConnector("etherping.out")
+        expected = [n for n in xrange(len(file))
+                    if bpfprog.execute(program, file.record(n)[1])]
+        self.assertEqual(len(expected), len(file) / 2)
+        self.assertEqual(file.filter(bpfprog.program(program)), expected)
+        buffers = [file.record(n)[1] for n in xrange(len(file))]
+        self.assertEqual(bpfprog.program(program).filter_batch(buffers),
+                         expected)
+        file.close()
+
+    def test_pcap_seek(self):
+        """Seeking to a packet by its number or time, through the index
+        of the savefile, must find the same packet as reading the file
+        from its start."""
+        import os
+        from pcs import pcapfile
+        file = PcapConnector("etherping.out")
+        expected = file.read_batch(-1)
+
+        index = pcapfile.build_index("etherping.out", 3)
+        self.assertEqual(index.count, len(expected))
+        self.assertEqual(len(index), (len(expected) + 2) / 3)
+        index.save("pcaptest.pcsidx")
+        loaded = pcapfile.load_index("pcaptest.pcsidx", index.tick)
+        os.remove("pcaptest.pcsidx")
+        self.assertEqual(loaded.count, index.count)
+        self.assertEqual(loaded.offsets, index.offsets)
+        self.assertEqual(loaded.seconds, index.seconds)
+        self.assertEqual(loaded.fractions, index.fractions)
+        self.assertEqual(loaded.locate(4), (index.offsets[1], 3))
+        self.assertRaises(IndexError, loaded.locate, len(expected))
+
+        for file in [PcapConnector("etherping.out"),
+                     MmapPcapConnector("etherping.out")]:
+            for n in [len(expected) - 1, 0, 5]:
+                file.seek_packet(n)
+                self.assertEqual(file.readpkt().chain(), expected[n].chain())
+            for n in [3, 0, len(expected) - 1]:
+                self.assertEqual(file.seek_time(expected[n].timestamp), n)
+                self.assertEqual(file.readpkt().timestamp,
+                                 expected[n].timestamp)
+            self.assertEqual(file.seek_time(expected[-1].timestamp + 1),
+                             len(expected))
+        os.remove("etherping.out" + pcapfile.INDEX_SUFFIX)
 
     def test_ethernet_write(self):
         """This test writes a fake ethernet packet to a dump file."""
@@ -101,7 +250,202 @@ class pcapTestCase(unittest.TestCase):
         # Re read what we just wrote.
         file = PcapConnector("pcapdump2.out", DLT_EN10MB)        
         ether = file.readpkt()
-        assert(ether.timestamp == 69.000069) 
+        assert(ether.timestamp == 69000069000)
+
+    def test_pcap_dump_many(self):
+        """Records written in a batch read back with the same bytes and
+        timestamps, to the nanosecond in a nanosecond file, and the
+        output rotates by size and by time."""
+        import os
+        from pcs.pcap import PCAP_TSTAMP_PRECISION_NANO
+        records = PcapConnector("etherping.out").read_batch(-1, decode = False)
+        records = [(ts + n, bytes) for (n, (ts, bytes)) in
+                   zip(xrange(len(records)), records)]
+        file = PcapDumpConnector("pcapdump3.out", DLT_EN10MB,
+                                 nanoseconds = True, buffer_size = 100)
+        file.write_many(records[:5])
+        file.write_many(iter(records[5:]))
+        file.close()
+        got = PcapConnector("pcapdump3.out",
+                            tstamp_precision = PCAP_TSTAMP_PRECISION_NANO)
+        self.assertEqual(got.read_batch(-1, decode = False), records)
+        got = PcapConnector("pcapdump3.out").read_batch(-1, decode = False)
+        self.assertEqual(got[1][0], records[1][0] / 1000 * 1000)
+        os.remove("pcapdump3.out")
+
+        size = 24 + 3 * max([16 + len(bytes) for (ts, bytes) in records])
+        file = PcapDumpConnector("pcapdump3.out", DLT_EN10MB,
+                                 rotate_bytes = size, fsync = True)
+        file.write_many(records)
+        file.close()
+        self.assertEqual(len(file.files), (len(records) + 2) / 3)
+        got = []
+        for name in file.files:
+            got += PcapConnector(name).read_batch(-1, decode = False)
+            os.remove(name)
+        self.assertEqual([bytes for (ts, bytes) in got],
+                         [bytes for (ts, bytes) in records])
+
+        span = records[-1][0] - records[0][0]
+        file = PcapDumpConnector("pcapdump3.out", DLT_EN10MB,
+                                 rotate_seconds = span / 2e9)
+        for (ts, bytes) in records:
+            file.write_record(ts, bytes)
+        file.close()
+        self.assert_(len(file.files) >= 2)
+        for name in file.files:
+            os.remove(name)
+
+    def test_pcap_dump_packet(self):
+        """A decoded packet is written whole, with the packets it holds,
+        and reads back as it was read."""
+        import os
+        from pcs.pcap import PCAP_TSTAMP_PRECISION_NANO
+        records = PcapConnector("etherping.out").read_batch(-1, decode = False)
+        packets = PcapConnector("etherping.out").read_batch(-1)
+        file = PcapDumpConnector("pcapdump3.out", DLT_EN10MB,
+                                 nanoseconds = True)
+        file.write(packets[0])
+        for packet in packets[1:]:
+            file.write(packet.chain())
+        file.close()
+        got = PcapConnector("pcapdump3.out",
+                            tstamp_precision = PCAP_TSTAMP_PRECISION_NANO)
+        self.assertEqual(got.read_batch(-1, decode = False), records)
+        os.remove("pcapdump3.out")
+
+    def test_pcap_compressed(self):
+        """A savefile written compressed reads back as a stream with the
+        same records, whichever codec it was written with."""
+        import os
+        from pcs import CompressedPcapConnector, CompressedPcapDumpConnector
+        records = PcapConnector("etherping.out").read_batch(-1, decode = False)
+        expected = PcapConnector("etherping.out").read_batch(-1)
+        for name in ["pcapdump3.pcap.gz", "pcapdump3.pcap.bz2"]:
+            file = CompressedPcapDumpConnector(name, DLT_EN10MB, fsync = True)
+            file.write_many(records)
+            file.flush()
+            file.close()
+            file = CompressedPcapConnector(name, chunk_size = 100, depth = 2)
+            self.assertEqual(file.dlink, DLT_EN10MB)
+            self.assertEqual(file.read_batch(3, decode = False), records[:3])
+            got = [p for b in file.iter_batches(4) for p in b]
+            self.assertEqual(len(got), len(expected) - 3)
+            for (p1, p2) in zip(got, expected[3:]):
+                self.assertEqual(p1.chain(), p2.chain())
+                self.assertEqual(p1.timestamp, p2.timestamp)
+            self.assertEqual(file.next(), None)
+            file.close()
+            os.remove(name)
+
+        # Closing a file before its end stops the thread reading it.
+        dump = CompressedPcapDumpConnector("pcapdump3.pcap.gz", DLT_EN10MB,
+                                           rotate_bytes = 500)
+        dump.write_many(records)
+        dump.close()
+        self.assertEqual(dump.files[1], "pcapdump3.pcap.1.gz")
+        file = CompressedPcapConnector(dump.files[0], chunk_size = 10,
+                                       depth = 1)
+        self.assertEqual(file.readpkt().chain(), expected[0].chain())
+        file.close()
+        for name in dump.files:
+            os.remove(name)
+
+    def test_savefile_eof(self):
+        """The savefile readers give None from next() at the end of the
+        file, and raise EOFError from the methods which give a packet."""
+        import os
+        import pcs
+        from pcs import CompressedPcapConnector, CompressedPcapDumpConnector
+        from pcs import PcapngConnector, PcapngDumpConnector
+        records = PcapConnector("etherping.out").read_batch(-1, decode = False)
+        dump = CompressedPcapDumpConnector("pcapdump3.pcap.gz", DLT_EN10MB)
+        dump.write_many(records)
+        dump.close()
+        dump = PcapngDumpConnector("pcapdump.pcapng", DLT_EN10MB)
+        dump.write_many(records)
+        dump.close()
+        for file in [MmapPcapConnector("etherping.out"),
+                     CompressedPcapConnector("pcapdump3.pcap.gz"),
+                     PcapngConnector("pcapdump.pcapng")]:
+            self.assertEqual(len(file.read_batch(-1)), len(records))
+            self.assertEqual(file.next(), None)
+            self.assertEqual(file.read_batch(1), [])
+            for read in [file.read, file.recv, file.recvfrom,
+                         file.read_packet, file.readpkt, file.read_chain]:
+                self.assertRaises(pcs.EOFError, read)
+            file.close()
+        os.remove("pcapdump3.pcap.gz")
+        os.remove("pcapdump.pcapng")
+
+    def test_pcapng(self):
+        """Packets of two interfaces written to a pcapng file read back
+        with their timestamps, each decoded by the data link type of
+        its interface, and may be found by their number or time."""
+        import os
+        from pcs import PcapngConnector, PcapngDumpConnector
+        from pcs.pcap import DLT_NULL
+        from pcs.packets.localhost import localhost
+        ether = PcapConnector("etherping.out").read_batch(-1, decode = False)
+        lo = PcapConnector("loopping.out").read_batch(-1, decode = False)
+        records = [(ts, p, len(p), 0) for (ts, p) in ether] + \
+                  [(ts, p, len(p), 1) for (ts, p) in lo]
+        records.sort()
+        dump = PcapngDumpConnector("pcapdump.pcapng", DLT_EN10MB,
+                                   comment = "two interfaces")
+        self.assertEqual(dump.add_interface(DLT_NULL, name = "lo0",
+                                            tsresol = 6), 1)
+        dump.write_many(records[:-1])
+        (ts, bytes, length, ifid) = records[-1]
+        dump.write_record(ts, bytes, interface = ifid, comment = "last")
+        dump.write_stats(1, ifrecv = len(lo), ifdrop = 2)
+        dump.write_simple(ether[0][1])
+        dump.close()
+
+        file = PcapngConnector("pcapdump.pcapng")
+        self.assertEqual(file.section.comments(), ["two interfaces"])
+        self.assertEqual(file.dlink, (DLT_EN10MB, DLT_NULL)[records[0][3]])
+        self.assertEqual(file.read_batch(-1, decode = False),
+                         records + [(None, ether[0][1], len(ether[0][1]), 0)])
+        self.assertEqual(file.interfaces[1].name, "lo0")
+        self.assertEqual(file.options, [])
+        self.assertEqual(file.stats()[1], { "ifrecv": len(lo), "ifdrop": 2 })
+        self.assertEqual(len(file), len(records) + 1)
+
+        n = len(records) - 1
+        file.seek_packet(n)
+        packet = file.read_packet()
+        self.assertEqual(type(packet), (ethernet, localhost)[ifid])
+        self.assertEqual(packet.timestamp, ts)
+        self.assertEqual(file.options, [(1, "last")])
+        self.assertEqual(file.seek_time(records[5][0]), 5)
+        for (p, (ts, bytes, length, ifid)) in zip(file.read_batch(4),
+                                                  records[5:9]):
+            self.assertEqual(type(p), (ethernet, localhost)[ifid])
+            self.assertEqual(p.timestamp, ts)
+            self.assertEqual(p.chain().bytes, bytes)
+        file.seek_packet(len(file))
+        self.assertEqual(file.next(), None)
+        file.close()
+        os.remove("pcapdump.pcapng")
+
+    def test_pcapng_dump_packet(self):
+        """A decoded packet is written to a pcapng file whole, with the
+        packets it holds, and reads back as it was read."""
+        import os
+        from pcs import PcapngConnector, PcapngDumpConnector
+        records = PcapConnector("etherping.out").read_batch(-1, decode = False)
+        packets = PcapConnector("etherping.out").read_batch(-1)
+        dump = PcapngDumpConnector("pcapdump.pcapng", DLT_EN10MB)
+        dump.write(packets[0])
+        for packet in packets[1:]:
+            dump.write(packet.chain())
+        dump.close()
+        file = PcapngConnector("pcapdump.pcapng")
+        self.assertEqual(file.read_batch(-1, decode = False),
+                         [(ts, p, len(p), 0) for (ts, p) in records])
+        file.close()
+        os.remove("pcapdump.pcapng")
 
 if __name__ == '__main__':
     unittest.main()
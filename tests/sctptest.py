@@ -81,5 +81,29 @@ class sctpTestCase(unittest.TestCase):
                          "strings are not equal \nexpected %s \ngot %s " % \
                          (expected, got))
 
+    def test_sctp_checksum(self):
+        """The CRC32C must match the known check values, whatever the
+        alignment of the bytes, and a message must verify once its
+        checksum has been calculated."""
+        from pcs.packets import crc32c
+        self.assertEqual(~crc32c.add(0xffffffffL, "123456789") & 0xffffffffL,
+                         0xe3069283L)
+        self.assertEqual(crc32c.cksum("\0" * 32), 0xaa36918aL)
+        bytes = "".join([chr(i) for i in range(61)])
+        for i in range(9):
+            self.assertEqual(crc32c.cksum(buffer(bytes, i)),
+                             crc32c.cksum(bytes[i:]))
+        self.assertEqual(crc32c.cksum_many([bytes, ""]),
+                         [crc32c.cksum(bytes), crc32c.cksum("")])
+
+        file = PcapConnector("sctp.pcap")
+        packet = file.readpkt()
+        sctp = packet.data.data
+        self.assertEqual(len(sctp.data.bytes), 92)
+        # This capture predates RFC 3309 and carries an Adler-32 checksum.
+        self.assertEqual(sctp.verify_checksum(), False)
+        sctp.calc_checksum()
+        self.assertEqual(sctp.verify_checksum(), True)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,149 @@
+# Copyright (c) 2005, Neville-Neil Consulting
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# Neither the name of Neville-Neil Consulting nor the names of its 
+# contributors may be used to endorse or promote products derived from 
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#
+# File: $Id: $
+#
+# Author: George V. Neville-Neil
+#
+# Description: This module tests stamping the fields of many frames
+# through a template and compares them with frames built as packets.
+
+import unittest
+
+import sys
+
+if __name__ == '__main__':
+
+    if "-l" in sys.argv:
+        sys.path.insert(0, "../") # Look locally first
+        sys.argv.remove("-l") # Needed because unittest has issues
+                              # with extra arguments.
+
+    import pcs
+    from pcs import FieldBoundsError
+    from pcs.template import Template
+    from pcs.packets.ethernet import ethernet
+    from pcs.packets.ipv4 import ipv4
+    from pcs.packets.tcp import tcp
+    from pcs.packets.udp import udp
+    from pcs.packets.payload import payload
+
+def build(transport, data, **kv):
+    """Build and fix up a frame, setting the fields given as
+    packetname_fieldname keyword arguments."""
+    from socket import IPPROTO_TCP, IPPROTO_UDP
+    ether = ethernet(src = "\x00\x01\x02\x03\x04\x05",
+                     dst = "\x00\x0a\x0b\x0c\x0d\x0e")
+    ip = ipv4(version = 4, hlen = 5, ttl = 64, src = 0x0a000001,
+              dst = 0x0a000002)
+    if transport is tcp:
+        ip.protocol = IPPROTO_TCP
+        tp = tcp(sport = 1024, dport = 80, ack = 1, window = 8192)
+    else:
+        ip.protocol = IPPROTO_UDP
+        tp = udp(sport = 1024, dport = 53)
+    packets = { "ether": ether, "ip": ip, "tp": tp }
+    for (key, value) in kv.iteritems():
+        (name, field) = key.split("_", 1)
+        setattr(packets[name], field, value)
+    chain = ether / ip / tp / payload(data)
+    chain.fixup()
+    return chain
+
+class templateTestCase(unittest.TestCase):
+    def test_template_offsets(self):
+        """A template knows where the fields of each packet are."""
+        chain = build(udp, "abc")
+        t = Template(chain)
+        self.assertEqual(t.size, len(chain.bytes))
+        self.assertEqual(t.offsets, [0, 14, 34, 42])
+        self.assertEqual(t.field(1, "ttl"), (14 * 8 + 64, 8, pcs.Field))
+        self.assertEqual(t.field(chain.packets[2], "dport")[0], 36 * 8)
+
+    def test_template_stamp(self):
+        """Stamped frames are the same as frames built one by one, with
+        their checksums updated."""
+        for (transport, data) in [(udp, "odd"), (tcp, "even"), (tcp, "")]:
+            chain = build(transport, data)
+            t = Template(chain)
+            ids = [1, 2, 0xffff]
+            ports = [5, 0x8000, 1024]
+            srcs = [0x0a000001, 0xc0a80101, 0xffffffff]
+            macs = ["\x00" * 6, "\xff" * 6, "\x02\x00\x00\x00\x00\x01"]
+            frames = list(t.frames({ (1, "id"): ids,
+                                     (chain.packets[1], "src"): srcs,
+                                     (2, "sport"): ports,
+                                     (0, "src"): macs }))
+            self.assertEqual(len(frames), 3)
+            for k in xrange(3):
+                expected = build(transport, data, ip_id = ids[k],
+                                 ip_src = srcs[k], tp_sport = ports[k],
+                                 ether_src = macs[k])
+                self.assertEqual(frames[k], expected.bytes)
+
+    def test_template_bits(self):
+        """Fields which do not fill whole bytes are stamped in place."""
+        chain = build(tcp, "x")
+        t = Template(chain)
+        buf = t.stamp({ (2, "syn"): [1, 0], (1, "flags"): [2, 0] })
+        self.assertEqual(len(buf), 2 * t.size)
+        expected = build(tcp, "x", tp_syn = 1, ip_flags = 2)
+        self.assertEqual(str(buf[:t.size]), expected.bytes)
+        self.assertEqual(str(buf[t.size:]), chain.bytes)
+        self.assertRaises(FieldBoundsError, t.stamp, { (1, "flags"): [8] })
+        self.assertRaises(FieldBoundsError, t.stamp, { (0, "src"): ["a"] })
+
+    def test_template_shared_word(self):
+        """Fields which share a 16 bit word of a checksum, such as the
+        IPv4 TTL and protocol, are stamped with the same checksum as a
+        frame fixed up with those values."""
+        chain = build(udp, "abc")
+        t = Template(chain)
+        ttls = [10, 200, 64]
+        protocols = [6, 99, 17]
+        frames = list(t.frames({ (1, "ttl"): ttls,
+                                 (1, "protocol"): protocols }))
+        for k in xrange(3):
+            expected = build(udp, "abc", ip_ttl = ttls[k])
+            expected.packets[1].protocol = protocols[k]
+            expected.fixup()
+            self.assertEqual(frames[k], expected.bytes)
+        flags = [2, 1, 0]
+        offsets = [0, 100, 0x1fff]
+        frames = list(t.frames({ (1, "flags"): flags,
+                                 (1, "offset"): offsets }))
+        for k in xrange(3):
+            expected = build(udp, "abc", ip_flags = flags[k],
+                             ip_offset = offsets[k])
+            self.assertEqual(frames[k], expected.bytes)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -108,6 +108,21 @@ class udpTestCase(unittest.TestCase):
         packet1.dport = 0xffff
         self.assertNotEqual(packet1, packet2, "packets compare equal but should not\ngot %sexpect %s" % (packet1, packet2))
         
+    def test_udpv4_subclass_compare(self):
+        """udpv4 and udpv6 packets have the fields of udp, so they are
+        compared and matched on them."""
+        from pcs.packets.udpv4 import udpv4
+        from pcs.packets.udpv6 import udpv6
+        for cls in [udpv4, udpv6]:
+            self.assertEqual([field.name for field in cls()._layout],
+                             ["sport", "dport", "length", "checksum"])
+            self.assertFalse(cls(sport = 1).matches(cls(sport = 2)))
+            self.assertTrue(cls(sport = 1).matches(cls(sport = 1,
+                                                       dport = 2)))
+            self.assertNotEqual(cls(sport = 1), cls(sport = 2))
+            self.assertEqual(cls(sport = 1), cls(sport = 1))
+            self.assertEqual(cls(cls(sport = 7).getbytes()).sport, 7)
+
     def test_udpv4_print(self):
         """This test reads from a pre-stored pcap file generated with
         tcpdump and ping on the loopback interface and tests the